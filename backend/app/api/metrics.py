@@ -0,0 +1,64 @@
+"""
+运行指标路由
+"""
+from typing import Any
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.admission import admission_controller
+from app.core.cache import customer_cache
+from app.core.database import pool_stats
+from app.core.metrics import registry
+from app.crud.maintenance import maintenance_scheduler
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
+@router.get("",
+           response_class=PlainTextResponse,
+           summary="Prometheus 指标",
+           response_description="Prometheus 文本格式的全部指标")
+async def prometheus_metrics() -> PlainTextResponse:
+    """
+    供 Prometheus 抓取的指标：按路由的请求数和耗时、SQL 耗时、每个请求的语句数、连接池和缓存状态
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/cache",
+           summary="缓存指标",
+           response_description="单个客户读缓存的命中、未命中和淘汰计数")
+async def cache_metrics() -> dict[str, Any]:
+    """
+    返回单个客户读缓存的统计信息
+    """
+    return customer_cache.stats()
+
+@router.get("/pool",
+           summary="连接池指标",
+           response_description="已借出、空闲、溢出连接数以及取得连接的等待时间")
+async def pool_metrics() -> dict[str, Any]:
+    """
+    返回当前进程数据库连接池的状态，用于判断请求是否在连接池上排队
+    """
+    return pool_stats()
+
+@router.get("/admission",
+           summary="准入控制指标",
+           response_description="进行中和排队的请求数，以及因队列已满或等待超时被拒绝的次数")
+async def admission_metrics() -> dict[str, Any]:
+    """
+    返回当前进程准入控制的状态，shed_* 持续增长说明工作进程或连接池不足
+    """
+    return admission_controller.stats()
+
+@router.get("/jobs",
+           summary="定时任务指标",
+           response_description="每个定时维护任务的运行次数、影响的行数和最近一次的耗时")
+async def job_metrics() -> dict[str, Any]:
+    """
+    返回当前进程中定时维护任务的统计；多个工作进程时，其他进程执行的任务在这里记为 skipped
+    """
+    return maintenance_scheduler.stats()
@@ -1,11 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import select
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.database import get_db
-from app.schemas.customer import CustomerCreate, CustomerUpdate, Customer
-from app.crud.customer import create_customer, get_customer, get_customers, update_customer, delete_customer
+from app.core.config import settings
+from app.core.database import get_db, get_read_db, read_session_scope
+from app.core.events import event_broker
+from app.core.etag import REVALIDATE_HEADERS, customer_etag, if_match_versions, none_match, not_modified, rows_etag
+from app.core.responses import FastJSONResponse
+from app.schemas.customer import (
+    CustomerCreate, CustomerUpdate, Customer, CustomerFilter, CustomerPage, CustomerBulkError,
+    CustomerBulkResult, CustomerHistoryEntry, CustomerBatchGetRequest, CustomerBatchGetResult, CustomerImportResult, CustomerSearchResult, CustomerStatsSummary
+)
+from app.crud.customer import (
+    SORTABLE_FIELDS, DEFAULT_SORT, CUSTOMER_FIELDS, REQUIRED_FIELDS,
+    bulk_upsert_customers, count_customers, create_customer, get_customer, get_customers, get_customers_by_ids, get_customers_page,
+    search_customers, stream_customers, update_customer, update_customer_by_pk, delete_customer,
+    PreconditionFailedError
+)
+from app.crud.customer_import import import_customers_csv, iter_lines
+from app.crud.history import get_customer_history
+from app.crud.pagination import InvalidCursorError
+from app.crud.stats import get_customer_stats
 from app.models.customer import Customer as CustomerModel  # 导入模型而不是 schema
+from app.models.customer import CustomerSource, CustomerStatus, CustomerType, Shop
 
 # 创建路由器，设置URL前缀和API标签
 router = APIRouter(
@@ -14,6 +39,52 @@ router = APIRouter(
     responses={404: {"description": "找不到客户"}},
 )
 
+def customer_filter(
+    *,  # * 后的所有参数必须使用关键字参数
+    shop: Shop | None = Query(default=None, description="按店铺筛选"),
+    customer_status: CustomerStatus | None = Query(default=None, description="按客户状态筛选"),
+    customer_type: CustomerType | None = Query(default=None, description="按客户类型筛选"),
+    source: CustomerSource | None = Query(default=None, description="按客户来源筛选"),
+    expected_order_date_from: datetime | None = Query(default=None, description="预期下单日期下限（含）"),
+    expected_order_date_to: datetime | None = Query(default=None, description="预期下单日期上限（含）"),
+    expected_order_amount_min: float | None = Query(default=None, ge=0, description="预期订单金额下限（含）"),
+    expected_order_amount_max: float | None = Query(default=None, ge=0, description="预期订单金额上限（含）")
+) -> CustomerFilter:
+    """
+    客户列表和导出共用的筛选参数
+    """
+    return CustomerFilter(
+        shop=shop,
+        customer_status=customer_status,
+        customer_type=customer_type,
+        source=source,
+        expected_order_date_from=expected_order_date_from,
+        expected_order_date_to=expected_order_date_to,
+        expected_order_amount_min=expected_order_amount_min,
+        expected_order_amount_max=expected_order_amount_max
+    )
+
+def customer_fields(
+    *,  # * 后的所有参数必须使用关键字参数
+    fields: str | None = Query(
+        default=None,
+        description=f"只返回这些字段，逗号分隔；{'、'.join(REQUIRED_FIELDS)} 和排序字段总是返回"
+    )
+) -> list[str] | None:
+    """
+    解析客户列表的 fields 参数，未知字段返回 400
+    """
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CUSTOMER_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的字段: {', '.join(unknown)}，可选字段: {', '.join(CUSTOMER_FIELDS)}"
+        )
+    return names
+
 @router.post("/", 
             response_model=Customer, 
             status_code=201,
@@ -22,6 +93,7 @@ router = APIRouter(
 async def create_new_customer(
     *,  # * 后的所有参数必须使用关键字参数
     db: AsyncSession = Depends(get_db),  # 数据库会话依赖注入
+    response: Response,  # 用于设置 ETag 响应头
     customer: CustomerCreate  # 客户创建模型，包含所有必要字段
 ) -> Customer:
     """
@@ -32,8 +104,258 @@ async def create_new_customer(
     - **customer_type**: 客户类型
     - **demand**: 需求量
     - **customer_status**: 客户状态
+
+    响应头 `ETag` 可以直接用于之后更新时的 `If-Match`
+    """
+    db_customer = await create_customer(db=db, customer_create=customer)
+    response.headers["ETag"] = customer_etag(db_customer.last_modified_date)
+    return db_customer
+
+@router.post("/bulk",
+            response_model=CustomerBulkResult,
+            summary="批量创建/更新客户",
+            response_description="批量写入结果，包含每条失败记录的错误信息")
+async def bulk_create_customers(
+    *,  # * 后的所有参数必须使用关键字参数
+    db: AsyncSession = Depends(get_db),  # 数据库会话依赖注入
+    customers: list[Any] = Body(
+        ...,
+        max_length=10000,
+        description="客户列表，每一项的字段与创建客户相同"
+    )  # 不在这里直接声明为 CustomerCreate，避免一条记录不合法导致整批 422
+) -> CustomerBulkResult:
+    """
+    批量创建客户，customer_id 已存在时更新该客户：
+    - 先逐条校验，不合法的记录在 **errors** 中返回，不影响其他记录
+    - 合法记录按批写入，每批一条多行 `INSERT ... ON CONFLICT DO UPDATE` 语句
+    """
+    errors: list[CustomerBulkError] = []
+    valid: list[CustomerCreate] = []
+    positions: list[int] = []
+    for index, item in enumerate(customers):
+        try:
+            valid.append(CustomerCreate.model_validate(item))
+            positions.append(index)
+        except ValidationError as e:
+            customer_id = item.get("customer_id") if isinstance(item, dict) else None
+            errors.append(CustomerBulkError(
+                index=index,
+                customer_id=customer_id if isinstance(customer_id, str) else None,
+                errors=[
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}" if error["loc"] else error["msg"]
+                    for error in e.errors()
+                ]
+            ))
+
+    written, failed = await bulk_upsert_customers(db=db, customers=valid)
+    errors.extend(
+        CustomerBulkError(index=positions[i], customer_id=valid[i].customer_id, errors=[message])
+        for i, message in failed
+    )
+    errors.sort(key=lambda error: error.index)
+
+    return CustomerBulkResult(
+        created=sum(1 for _, _, inserted in written if inserted),
+        updated=sum(1 for _, _, inserted in written if not inserted),
+        items=[customer for _, customer, _ in written],
+        errors=errors
+    )
+
+@router.post("/batch-get",
+            response_model=CustomerBatchGetResult,
+            summary="按客户ID批量获取客户",
+            response_description="找到的客户和不存在的客户ID")
+async def batch_get_customers(
+    *,  # * 后的所有参数必须使用关键字参数
+    db: AsyncSession = Depends(get_read_db),  # 只读数据库会话依赖注入（可能是副本）
+    batch: CustomerBatchGetRequest  # 要获取的客户ID列表
+) -> FastJSONResponse:
+    """
+    一次获取多个客户，代替逐个调用获取指定客户的接口：
+    - 所有ID用一条 `WHERE customer_id = ANY(:ids)` 查询，客户表中没有的再用一条查询在归档表中查找
+    - **items** 按请求中的顺序排列，**missing** 为不存在的ID
+    """
+    customer_ids = list(dict.fromkeys(batch.customer_ids))
+    found = {row["customer_id"]: row for row in await get_customers_by_ids(db=db, customer_ids=customer_ids)}
+    return FastJSONResponse(content={
+        "items": [found[customer_id] for customer_id in customer_ids if customer_id in found],
+        "missing": [customer_id for customer_id in customer_ids if customer_id not in found]
+    })
+
+@router.post("/import",
+            response_model=CustomerImportResult,
+            summary="从 CSV 导入客户",
+            response_description="导入结果，包含吞吐量和被拒绝的行",
+            openapi_extra={
+                "requestBody": {
+                    "required": True,
+                    "content": {"text/csv": {"schema": {"type": "string"}}}
+                }
+            })
+async def import_customers(
+    *,  # * 后的所有参数必须使用关键字参数
+    db: AsyncSession = Depends(get_db),  # 数据库会话依赖注入
+    request: Request  # 直接读取请求体数据流，不把整个文件读入内存
+) -> CustomerImportResult:
+    """
+    以 `text/csv` 请求体上传客户表格，第一行为表头，列名与创建客户的字段相同：
+    - 边接收边按块解析和校验，合法行通过 COPY 写入临时表
+    - 最后一次性合并，customer_id 已存在的客户会被更新
+    - 不合法的行计入 **rejected**，不影响其他行
     """
-    return await create_customer(db=db, customer_create=customer)
+    try:
+        return await import_customers_csv(db=db, lines=iter_lines(request.stream()))
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+
+def _export_value(value: Any) -> Any:
+    """
+    把数据库取出的值转换为可导出的基础类型
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def _export_rows(
+    request: Request,
+    export_format: str,
+    columns: list[str],
+    filters: CustomerFilter,
+    include_archived: bool) -> AsyncIterator[str]:
+    """
+    逐块读取客户并编码为 NDJSON 或 CSV 文本
+
+    StreamingResponse 在依赖项清理之后才开始发送数据，所以这里自行打开会话（配置了只读副本时读副本），
+    让服务端游标在整个传输过程中保持有效。
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+    async with read_session_scope(request) as session:
+        async for rows in stream_customers(db=session, filters=filters, include_archived=include_archived):
+            if export_format == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([_export_value(row[column]) for column in columns] for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps({column: _export_value(row[column]) for column in columns}, ensure_ascii=False) + "\n"
+                    for row in rows
+                )
+
+@router.get("/export",
+           summary="导出客户数据",
+           response_class=StreamingResponse,
+           response_description="NDJSON（每行一个客户）或 CSV 格式的客户数据流")
+async def export_customers(
+    *,  # * 后的所有参数必须使用关键字参数
+    request: Request,  # 用于选择读副本还是主库
+    export_format: str = Query(default="ndjson", alias="format", pattern="^(ndjson|csv)$", description="导出格式"),  # 导出格式
+    include_archived: bool = Query(default=False, description="是否包括已归档的客户"),  # 同时导出归档表
+    filters: CustomerFilter = Depends(customer_filter)  # 筛选条件，与客户列表相同
+) -> StreamingResponse:
+    """
+    流式导出客户数据，内存占用与数据量无关：
+    - **format**: ndjson 或 csv
+    - **shop** / **customer_status** 等: 可选的筛选条件，与客户列表相同
+    - **include_archived**: 同时导出已归档的客户
+    """
+    columns = [column.name for column in CustomerModel.__table__.columns]
+    if export_format == "csv":
+        media_type = "text/csv; charset=utf-8"
+    else:
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(request, export_format, columns, filters, include_archived),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="customers.{export_format}"'}
+    )
+
+async def _event_stream(request: Request) -> AsyncIterator[str]:
+    """
+    把变更事件编码为 SSE 格式，没有事件时定期发送注释行保持连接
+
+    与导出一样在 StreamingResponse 开始发送后才订阅；不访问数据库，不占用连接。
+    """
+    async with event_broker.subscribe() as subscription:
+        # 断线后浏览器等待 3 秒重连
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event.type}\ndata: {event.data}\n\n"
+
+@router.get("/events",
+           summary="客户变更推送",
+           response_class=StreamingResponse,
+           response_description="text/event-stream 格式的变更事件流")
+async def customer_events(
+    *,  # * 后的所有参数必须使用关键字参数
+    request: Request  # 用于检测客户端断开
+) -> StreamingResponse:
+    """
+    以 Server-Sent Events 推送客户的变更，前端用 `EventSource` 订阅，不需要轮询客户列表：
+    - **created** / **updated**: data 为完整的客户数据
+    - **deleted**: data 为 `{"customer_id": ...}`
+    - **bulk**: 批量写入或导入，data 为 `{"count": 写入条数}`，需要重新加载列表
+    - **resync**: 可能错过了事件（处理太慢或服务端重连），需要重新加载列表
+
+    断线重连期间的事件不会补发，重连后应重新加载一次列表。
+    """
+    return StreamingResponse(
+        _event_stream(request),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭 nginx 的响应缓冲，事件立即送达
+        }
+    )
+
+@router.get("/stats",
+           response_model=CustomerStatsSummary,
+           summary="销售看板汇总",
+           response_description="按店铺 × 状态的客户数和预期金额，以及销售漏斗")
+async def read_customer_stats(
+    *,  # * 后的所有参数必须使用关键字参数
+    db: AsyncSession = Depends(get_read_db)  # 只读数据库会话依赖注入（可能是副本）
+) -> CustomerStatsSummary:
+    """
+    读取由写操作增量维护的汇总表，代价只与店铺数 × 状态数有关，不扫描客户表；
+    如果汇总出现偏差，可运行 `pdm run cli rebuild-stats` 重新计算
+    """
+    return await get_customer_stats(db=db)
+
+@router.get("/search",
+           response_model=list[CustomerSearchResult],
+           summary="模糊搜索客户",
+           response_description="按相关度排序的客户列表")
+async def search_customer(
+    *,  # * 后的所有参数必须使用关键字参数
+    db: AsyncSession = Depends(get_read_db),  # 只读数据库会话依赖注入（可能是副本）
+    q: str = Query(..., min_length=1, max_length=100, description="customer_id 片段或需求描述关键字"),  # 搜索关键字
+    limit: int = Query(default=20, ge=1, le=100, description="返回的最大记录数")  # 返回条数
+) -> list[CustomerSearchResult]:
+    """
+    按 customer_id 片段或需求描述中的关键字搜索客户，结果按相关度排序：
+    - **q**: 搜索关键字，至少 3 个字符时可以利用 trigram 索引
+    - **limit**: 返回的最大记录数
+    """
+    results = await search_customers(db=db, keyword=q, limit=limit)
+    return [
+        CustomerSearchResult.model_validate({**customer.model_dump(), "score": score})
+        for customer, score in results
+    ]
 
 @router.get("/{customer_id}", 
            response_model=Customer,
@@ -42,10 +364,15 @@ async def create_new_customer(
 async def read_customer(
     *,  # * 后的所有参数必须使用关键字参数
     db: AsyncSession = Depends(get_db),  # 数据库会话依赖注入
-    customer_id: str  # 要查询的客户ID
+    response: Response,  # 用于设置 ETag 响应头
+    customer_id: str,  # 要查询的客户ID
+    if_none_match: str | None = Header(default=None, description="上次响应的 ETag，未修改时返回 304")  # 条件请求头
 ) -> Customer:
     """
-    根据客户ID获取客户详细信息
+    根据客户ID获取客户详细信息，客户表中没有时再查归档表（归档的客户只能读取，不能更新）
+
+    单个客户的结果会写入缓存（写操作使缓存失效），所以始终读主库，避免把副本上的旧数据重新放进缓存。
+    响应带有 `ETag`；请求头 `If-None-Match` 与当前 ETag 相同时返回 304，不返回响应体
     """
     customer = await get_customer(db=db, customer_id=customer_id)
     if customer is None:
@@ -53,25 +380,113 @@ async def read_customer(
             status_code=404,
             detail="客户未找到"
         )
+    etag = customer_etag(customer.last_modified_date)
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+    response.headers.update({"ETag": etag, **REVALIDATE_HEADERS})
     return customer
 
+@router.get("/{customer_id}/history",
+           response_model=list[CustomerHistoryEntry],
+           summary="获取客户变更时间线",
+           response_description="按时间顺序排列的字段变更记录")
+async def read_customer_history(
+    *,  # * 后的所有参数必须使用关键字参数
+    db: AsyncSession = Depends(get_read_db),  # 只读数据库会话依赖注入（可能是副本）
+    customer_id: str,  # 要查询的客户ID
+    skip: int = Query(default=0, ge=0, description="跳过的记录数"),  # 分页参数：跳过记录数
+    limit: int = Query(default=100, ge=1, le=1000, description="返回的最大记录数")  # 分页参数：每页记录数
+) -> FastJSONResponse:
+    """
+    获取客户每个字段（状态、预期金额等）的变更记录，按变更时间从早到晚排列：
+    - 变更记录由写后队列批量写入，最近一两秒内的更新可能还没有出现
+    - 客户删除后变更记录仍然保留
+    """
+    history = await get_customer_history(db=db, customer_id=customer_id, skip=skip, limit=limit)
+    return FastJSONResponse(content=history)
+
 @router.get("/", 
-           response_model=list[Customer],
+           response_model=list[Customer] | CustomerPage,
            summary="获取客户列表",
-           response_description="客户列表")
+           response_description="客户列表；使用游标分页或要求返回总数时返回分页对象")
 async def read_customers(
     *,  # * 后的所有参数必须使用关键字参数
-    db: AsyncSession = Depends(get_db),  # 数据库会话依赖注入
+    db: AsyncSession = Depends(get_read_db),  # 只读数据库会话依赖注入（可能是副本）
     skip: int = Query(default=0, ge=0, description="跳过的记录数"),  # 分页参数：跳过记录数
-    limit: int = Query(default=100, ge=1, le=1000, description="返回的最大记录数")  # 分页参数：每页记录数
-) -> list[Customer]:
+    limit: int = Query(default=100, ge=1, le=1000, description="返回的最大记录数"),  # 分页参数：每页记录数
+    cursor: str | None = Query(default=None, description="分页游标，首页传空字符串，之后传上一页返回的 next_cursor"),  # 游标分页参数
+    sort: str = Query(
+        default=DEFAULT_SORT,
+        pattern=f"^-?({'|'.join(SORTABLE_FIELDS)})$",
+        description="排序字段，前缀 - 表示降序"
+    ),  # 排序参数
+    with_total: bool = Query(default=False, description="是否返回符合筛选条件的总数（total）"),  # 分页器需要的总数
+    include_archived: bool = Query(default=False, description="是否包括已归档的客户"),  # 同时查询归档表
+    fields: list[str] | None = Depends(customer_fields),  # 只返回部分字段
+    filters: CustomerFilter = Depends(customer_filter),  # 筛选参数
+    if_none_match: str | None = Header(default=None, description="上次响应的 ETag，未修改时返回 304")  # 条件请求头
+) -> FastJSONResponse:
     """
-    获取客户列表，支持分页：
-    - **skip**: 跳过前面的记录数
-    - **limit**: 返回的最大记录数
+    获取客户列表，支持筛选、排序和两种分页方式：
+    - **shop** / **customer_status** / **customer_type** / **source**: 精确筛选
+    - **expected_order_date_from/to**、**expected_order_amount_min/max**: 范围筛选
+    - **sort**: 排序字段（id / last_modified_date / creation_date / expected_order_date /
+      expected_order_amount），前缀 `-` 表示降序
+    - **skip** / **limit**: OFFSET 分页，兼容旧客户端
+    - **cursor** / **limit**: 游标分页，首页传 `cursor=`，之后传上一页返回的 `next_cursor`，
+      每页代价与页码无关；可能为空的 expected_order_* 字段不能用于游标分页
+    - **with_total**: 同时返回总数 `total`，此时 OFFSET 分页也返回分页对象；
+      只按店铺、状态筛选时由看板汇总得出，其他筛选在数据量很大时返回估计值（`total_exact=false`），
+      结果短时间缓存，写操作后失效
+    - **fields**: 只查询和返回这些字段（逗号分隔），例如 `fields=shop,customer_status,expected_order_amount`，
+      id、customer_id、last_modified_date 和排序字段总是返回
+    - **include_archived**: 同时返回已移到归档表的客户（长期 DEAD 或很早创建的客户），默认只查客户表
+
+    数据库取出的行直接编码返回，不再按 response_model 逐行校验。
+    响应带有根据每行版本计算的 `ETag`，`If-None-Match` 命中时返回 304，跳过编码和传输。
     """
-    customers = await get_customers(db=db, skip=skip, limit=limit)
-    return customers
+    total, total_exact = None, None
+    if cursor is None:
+        customers = await get_customers(
+            db=db, skip=skip, limit=limit, sort=sort, filters=filters, fields=fields, include_archived=include_archived
+        )
+        if with_total:
+            total, total_exact = await count_customers(db=db, filters=filters, include_archived=include_archived)
+        etag = rows_etag(customers, total)
+        if none_match(if_none_match, etag):
+            return not_modified(etag)
+        content = customers
+        if with_total:
+            content = {"items": customers, "next_cursor": None, "total": total, "total_exact": total_exact}
+        return FastJSONResponse(content=content, headers={"ETag": etag, **REVALIDATE_HEADERS})
+
+    if skip:
+        raise HTTPException(
+            status_code=400,
+            detail="skip 与 cursor 不能同时使用"
+        )
+    try:
+        customers, next_cursor = await get_customers_page(
+            db=db, cursor=cursor, limit=limit, sort=sort, filters=filters, fields=fields,
+            include_archived=include_archived
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    if with_total:
+        total, total_exact = await count_customers(db=db, filters=filters, include_archived=include_archived)
+    etag = rows_etag(customers, next_cursor, total)
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+    content = {"items": customers, "next_cursor": next_cursor}
+    if with_total:
+        content.update(total=total, total_exact=total_exact)
+    return FastJSONResponse(
+        content=content,
+        headers={"ETag": etag, **REVALIDATE_HEADERS}
+    )
 
 @router.put("/{customer_id}", 
            response_model=Customer,
@@ -80,18 +495,31 @@ async def read_customers(
 async def update_existing_customer(
     *,  # * 后的所有参数必须使用关键字参数
     db: AsyncSession = Depends(get_db),  # 数据库会话依赖注入
+    response: Response,  # 用于设置 ETag 响应头
     customer_id: str,  # 要更新的客户ID
-    customer: CustomerUpdate  # 客户更新模型，所有字段都是可选的
+    customer: CustomerUpdate,  # 客户更新模型，所有字段都是可选的
+    if_match: str | None = Header(default=None, description="读取客户时得到的 ETag，客户已被修改时返回 412")  # 条件请求头
 ) -> Customer:
     """
     更新指定客户的信息，所有字段都是可选的
+
+    带 `If-Match` 时只有客户仍是该版本才更新，否则返回 412，避免覆盖其他人的修改
     """
-    updated_customer = await update_customer(db=db, customer_id=customer_id, customer_update=customer)
+    try:
+        updated_customer = await update_customer(
+            db=db, customer_id=customer_id, customer_update=customer, if_match=if_match_versions(if_match)
+        )
+    except PreconditionFailedError as e:
+        raise HTTPException(
+            status_code=412,
+            detail=str(e)
+        )
     if updated_customer is None:
         raise HTTPException(
             status_code=404,
             detail="客户未找到"
         )
+    response.headers["ETag"] = customer_etag(updated_customer.last_modified_date)
     return updated_customer
 
 @router.put("/id/{id}", 
@@ -101,31 +529,30 @@ async def update_existing_customer(
 async def update_customer_by_id(
     *,
     db: AsyncSession = Depends(get_db),
+    response: Response,
     id: int,
-    customer: CustomerUpdate
+    customer: CustomerUpdate,
+    if_match: str | None = Header(default=None, description="读取客户时得到的 ETag，客户已被修改时返回 412")
 ) -> Customer:
     """
-    通过数据库ID更新指定客户的信息，所有字段都是可选的
+    通过数据库ID更新指定客户的信息，所有字段都是可选的，`If-Match` 的用法与按客户ID更新相同
     """
-    # 先查找客户
-    query = select(CustomerModel).where(CustomerModel.id == id)
-    result = await db.execute(query)
-    db_customer = result.scalar_one_or_none()
-    
-    if not db_customer:
+    try:
+        updated_customer = await update_customer_by_pk(
+            db=db, id=id, customer_update=customer, if_match=if_match_versions(if_match)
+        )
+    except PreconditionFailedError as e:
+        raise HTTPException(
+            status_code=412,
+            detail=str(e)
+        )
+    if updated_customer is None:
         raise HTTPException(
             status_code=404,
             detail="客户未找到"
         )
-    
-    # 更新客户信息
-    customer_data = customer.dict(exclude_unset=True)
-    for key, value in customer_data.items():
-        setattr(db_customer, key, value)
-    
-    await db.commit()
-    await db.refresh(db_customer)
-    return db_customer
+    response.headers["ETag"] = customer_etag(updated_customer.last_modified_date)
+    return updated_customer
 
 @router.delete("/{customer_id}",
              status_code=204,
@@ -0,0 +1,214 @@
+"""
+命令行工具
+
+用法：python -m app.cli --help
+"""
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator
+
+import typer
+
+from app.core.config import settings
+from app.core.database import async_session, engine, is_memory_database
+from app.core.migrations import LATEST_VERSION, Migration, SchemaVersionError, migrate as run_migrations, verify_schema_version
+from app.crud.customer_import import IMPORT_CHUNK_SIZE, import_customers_csv
+from app.crud.history import history_writer
+from app.crud.maintenance import archive_customers as run_archive, mark_stale_leads_dead
+from app.crud.stats import rebuild_customer_stats
+from app.schemas.customer import CustomerImportResult
+
+cli = typer.Typer(help="客户管理系统命令行工具")
+
+@cli.callback()
+def main() -> None:
+    """
+    客户管理系统命令行工具
+    """
+
+async def _file_lines(path: Path) -> AsyncIterator[str]:
+    """
+    逐行读取文本文件
+    """
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        for line in f:
+            yield line
+
+async def _import_csv(path: Path, chunk_size: int) -> CustomerImportResult:
+    """
+    在独立的会话中执行导入
+    """
+    try:
+        async with async_session() as session:
+            return await import_customers_csv(db=session, lines=_file_lines(path), chunk_size=chunk_size)
+    finally:
+        await engine.dispose()
+
+@cli.command("import-csv")
+def import_csv(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, readable=True, help="CSV 文件路径"),
+    chunk_size: int = typer.Option(IMPORT_CHUNK_SIZE, min=1, help="每块校验并 COPY 的行数"),
+) -> None:
+    """
+    从 CSV 文件导入客户，customer_id 已存在时更新
+    """
+    try:
+        result = asyncio.run(_import_csv(path, chunk_size))
+    except ValueError as e:
+        typer.echo(f"导入失败: {e}", err=True)
+        raise typer.Exit(code=1)
+
+    for error in result.errors:
+        typer.echo(f"第 {error.line} 行: {'; '.join(error.errors)}", err=True)
+    typer.echo(
+        f"读取 {result.rows} 行，新建 {result.created}，更新 {result.updated}，拒绝 {result.rejected}；"
+        f"耗时 {result.elapsed_seconds:.2f} 秒，{result.rows_per_second:.0f} 行/秒"
+    )
+
+async def _rebuild_stats() -> int:
+    """
+    在独立的会话中重算汇总
+    """
+    try:
+        async with async_session() as session:
+            return await rebuild_customer_stats(db=session)
+    finally:
+        await engine.dispose()
+
+@cli.command("rebuild-stats")
+def rebuild_stats() -> None:
+    """
+    根据客户表重新计算销售看板汇总，用于修复偏差
+    """
+    groups = asyncio.run(_rebuild_stats())
+    typer.echo(f"汇总已重建，共 {groups} 个店铺 × 状态分组")
+
+async def _mark_stale_leads(days: int, batch_size: int) -> int:
+    """
+    在独立的会话中标记长期未跟进的客户，写完变更记录后释放连接
+    """
+    try:
+        async with async_session() as session:
+            marked = await mark_stale_leads_dead(db=session, days=days, batch_size=batch_size)
+        await history_writer.flush()
+        return marked
+    finally:
+        await engine.dispose()
+
+@cli.command("mark-stale-leads")
+def mark_stale_leads(
+    days: int = typer.Option(settings.STALE_LEAD_DAYS or 90, min=1, help="超过多少天没有修改的客户标记为 DEAD"),
+    batch_size: int = typer.Option(settings.STALE_LEAD_BATCH_SIZE, min=1, help="每批更新的行数"),
+) -> None:
+    """
+    立即执行一次定时任务 mark-stale-leads-dead：把长期没有修改的未成交客户标记为 DEAD
+    """
+    marked = asyncio.run(_mark_stale_leads(days, batch_size))
+    typer.echo(f"已把 {marked} 个超过 {days} 天没有修改的客户标记为 DEAD")
+
+async def _archive_customers(dead_days: int | None, created_before: datetime | None, batch_size: int) -> int:
+    """
+    在独立的会话中归档客户并释放连接
+    """
+    try:
+        async with async_session() as session:
+            return await run_archive(
+                db=session, dead_days=dead_days, created_before=created_before, batch_size=batch_size
+            )
+    finally:
+        await engine.dispose()
+
+@cli.command("archive-customers")
+def archive_customers(
+    dead_days: int | None = typer.Option(settings.ARCHIVE_DEAD_DAYS, min=0, help="归档超过多少天没有修改的 DEAD 客户"),
+    created_before: datetime | None = typer.Option(
+        settings.ARCHIVE_CREATED_BEFORE, formats=["%Y-%m-%d"], help="归档创建时间早于这一天（UTC）的客户"
+    ),
+    batch_size: int = typer.Option(settings.ARCHIVE_BATCH_SIZE, min=1, help="每批移动的行数"),
+) -> None:
+    """
+    立即执行一次定时任务 archive-customers：把长期 DEAD 或很早创建的客户移到归档表
+    """
+    if dead_days is None and created_before is None:
+        typer.echo("必须指定 --dead-days 或 --created-before", err=True)
+        raise typer.Exit(code=1)
+    archived = asyncio.run(_archive_customers(dead_days, created_before, batch_size))
+    typer.echo(f"已归档 {archived} 个客户")
+
+async def _migrate() -> list[Migration]:
+    """
+    执行迁移并释放连接
+    """
+    try:
+        return await run_migrations(engine)
+    finally:
+        await engine.dispose()
+
+@cli.command("migrate")
+def migrate() -> None:
+    """
+    执行还没有执行过的数据库迁移，部署新版本时运行一次
+    """
+    applied = asyncio.run(_migrate())
+    for migration in applied:
+        typer.echo(f"已执行迁移 {migration.version}：{migration.description}")
+    typer.echo(f"数据库结构版本 {LATEST_VERSION}" if applied else f"数据库已是最新版本 {LATEST_VERSION}")
+
+async def _verify_schema() -> int:
+    """
+    检查结构版本并释放连接
+    """
+    try:
+        return await verify_schema_version(engine)
+    finally:
+        await engine.dispose()
+
+@cli.command("serve")
+def serve(
+    host: str = typer.Option(settings.SERVER_HOST, help="监听地址"),
+    port: int = typer.Option(settings.SERVER_PORT, help="监听端口"),
+    workers: int = typer.Option(settings.SERVER_WORKERS, min=1, help="工作进程数，每个进程有自己的连接池"),
+    loop: str = typer.Option(settings.SERVER_LOOP, help="事件循环：auto / asyncio / uvloop"),
+    http: str = typer.Option(settings.SERVER_HTTP, help="HTTP 解析器：auto / h11 / httptools"),
+    graceful_timeout: int = typer.Option(settings.SERVER_GRACEFUL_TIMEOUT, min=0, help="关闭时等待进行中请求的最长秒数"),
+    keep_alive: int = typer.Option(settings.SERVER_KEEP_ALIVE, min=1, help="空闲 keep-alive 连接保持的秒数"),
+    access_log: bool = typer.Option(False, help="是否输出访问日志"),
+) -> None:
+    """
+    生产环境启动服务：多进程、可选的事件循环和 HTTP 解析器，收到 SIGTERM 后优雅关闭
+    """
+    import uvicorn
+
+    if loop not in ("auto", "asyncio", "uvloop"):
+        raise typer.BadParameter("loop 只能是 auto、asyncio 或 uvloop", param_hint="--loop")
+    if http not in ("auto", "h11", "httptools"):
+        raise typer.BadParameter("http 只能是 auto、h11 或 httptools", param_hint="--http")
+
+    # 内存数据库只存在于单个连接中：每个工作进程各有一份空库，并发请求共用一个连接也会互相干扰
+    if is_memory_database(settings.DATABASE_URL):
+        typer.echo("SQLite 内存数据库只能用于测试，请在 DATABASE_URL 中使用数据库文件", err=True)
+        raise typer.Exit(code=1)
+    # 在主进程中先检查一次，结构版本不对时直接退出，而不是让每个工作进程分别启动失败
+    try:
+        version = asyncio.run(_verify_schema())
+    except SchemaVersionError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    typer.echo(f"数据库结构版本 {version}，启动 {workers} 个工作进程")
+
+    uvicorn.run(
+        "main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=graceful_timeout,
+        timeout_keep_alive=keep_alive,
+        access_log=access_log,
+        proxy_headers=True,
+    )
+
+if __name__ == "__main__":
+    cli()
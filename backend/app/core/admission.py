@@ -0,0 +1,179 @@
+"""
+准入控制
+
+突发流量时，如果所有请求都去等待数据库连接池，每个请求都要排到 DB_POOL_TIMEOUT 才失败，
+所有人的延迟一起变坏。这里在进入路由之前限制同时处理的 API 请求数（默认等于连接池的连接数），
+多出的请求在有界队列中按先后顺序等待最多 queue_timeout 秒；队列已满或等待超时时直接返回 503 和 Retry-After，
+让客户端稍后重试，已经被接受的请求不受影响。
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.metrics import CallbackGauge, registry
+
+
+class OverloadedError(Exception):
+    """请求被拒绝：等待队列已满或等待超时"""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """限制同时处理的请求数，多出的请求在有界的先进先出队列中等待"""
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued_total = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @property
+    def queued(self) -> int:
+        """正在排队的请求数"""
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """
+        取得一个处理名额；需要排队时最多等待 queue_timeout 秒，队列已满或超时抛出 OverloadedError
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            raise OverloadedError("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时或取消的同时刚好轮到这个请求：把名额交给下一个
+                self.release()
+            elif waiter in self._waiters:
+                # release() 可能已经在这个请求恢复执行之前把取消的 waiter 移出了队列
+                self._waiters.remove(waiter)
+            if isinstance(e, TimeoutError):
+                self.shed_timeout += 1
+                raise OverloadedError("timeout") from None
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.admitted += 1
+
+    def release(self) -> None:
+        """
+        归还名额：有请求在排队时直接交给最早的一个，否则减少进行中的请求数
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict[str, Any]:
+        """进行中和排队的请求数，接受、排队、因队列已满或超时拒绝的计数以及排队时间"""
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+class AdmissionMiddleware:
+    """
+    对路径以 prefix 开头的请求做准入控制的 ASGI 中间件
+
+    根路径、健康检查、指标和文档不受限制；exempt_paths 中的路径（长时间保持的 SSE 连接，不占用数据库连接）也不受限制。
+    名额一直占用到响应发送完毕，流式导出在传输期间也计入。
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        prefix: str,
+        exempt_paths: tuple[str, ...] = (),
+        retry_after: int = 1) -> None:
+        self.app = app
+        self.controller = controller
+        self.prefix = prefix
+        self.exempt_paths = frozenset(exempt_paths)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.prefix)
+            or scope["path"].rstrip("/") in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire()
+        except OverloadedError:
+            response = JSONResponse(
+                {"detail": "服务繁忙，请稍后重试"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+
+# 每个工作进程的准入控制，默认同时处理的请求数等于连接池的最大连接数
+admission_controller = AdmissionController(
+    limit=settings.ADMISSION_MAX_IN_FLIGHT or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+)
+
+registry.register(CallbackGauge(
+    "admission_requests",
+    "准入控制中进行中和排队的请求数，以及接受、排队、因队列已满或超时拒绝的累计次数",
+    lambda: {
+        (kind,): admission_controller.stats()[kind]
+        for kind in ("limit", "in_flight", "queued", "admitted", "queued_total", "shed_queue_full", "shed_timeout")
+    },
+    ("kind",)
+))
+registry.register(CallbackGauge(
+    "admission_queue_wait_seconds",
+    "请求在准入队列中的累计和最长等待时间（秒）",
+    lambda: {(kind,): admission_controller.stats()[f"wait_seconds_{kind}"] for kind in ("total", "max")},
+    ("kind",)
+))
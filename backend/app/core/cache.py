@@ -0,0 +1,241 @@
+"""
+缓存层
+
+默认使用进程内的 LRU + TTL 缓存；设置 CACHE_BACKEND=redis 时改用 Redis，
+多个进程共享同一份缓存（需要额外安装 redis 包）。
+缓存的值必须是可以 JSON 序列化的基础类型（datetime 会被转成字符串）。
+"""
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+from app.core.config import settings
+from app.core.metrics import CallbackGauge, registry
+
+
+class CacheBackend(ABC):
+    """
+    缓存后端接口
+
+    读数据库再写缓存之间有 await，期间提交的写操作删除缓存后，旧值可能又被写回去。
+    读数据库前先取 generation()，用 set_if_unchanged() 写入：期间本进程删除或清空过缓存就不写，
+    写入之后发现代数变了再删掉刚写入的值（Redis 往返期间发生的删除）。
+    代数只记录本进程的失效；使用 Redis 时，其他进程的写入与本进程的读取交错仍可能留下旧值，最多保留 ttl 秒。
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_skips = 0
+        self._generation = 0
+
+    def generation(self) -> int:
+        """当前的失效代数，每次 delete() 或 clear() 加一"""
+        return self._generation
+
+    async def set_if_unchanged(self, key: str, value: Any, generation: int) -> bool:
+        """
+        generation 之后没有发生过失效时写入缓存，返回是否保留了写入的值
+        """
+        if generation == self._generation:
+            await self.set(key, value)
+            if generation == self._generation:
+                return True
+            await self.delete(key)
+        self.stale_skips += 1
+        return False
+
+    @abstractmethod
+    async def get(self, key: str) -> Any | None:
+        """读取缓存，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        """写入缓存"""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """删除缓存，实现中要先把 _generation 加一"""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """清空缓存，实现中要先把 _generation 加一"""
+
+    def stats(self) -> dict[str, Any]:
+        """命中、未命中和淘汰计数"""
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_skips": self.stale_skips,
+        }
+
+
+class NullCache(CacheBackend):
+    """不缓存任何内容，用于关闭缓存"""
+
+    async def get(self, key: str) -> Any | None:
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        pass
+
+    async def delete(self, *keys: str) -> None:
+        self._generation += 1
+
+    async def clear(self) -> None:
+        self._generation += 1
+
+
+class MemoryCache(CacheBackend):
+    """进程内 LRU 缓存，每个条目在 ttl 秒后过期"""
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        self._generation += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {**super().stats(), "size": len(self._entries), "max_entries": self.max_entries}
+
+
+class RedisCache(CacheBackend):
+    """基于 Redis 的共享缓存，淘汰由 Redis 自己负责（evictions 始终为 0）"""
+
+    def __init__(self, url: str, ttl: float, namespace: str = "customer_management") -> None:
+        super().__init__()
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis 需要安装 redis 包：pdm add redis") from e
+        self._redis = Redis.from_url(url)
+        self.ttl = ttl
+        self.namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Any | None:
+        raw = await self._redis.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any) -> None:
+        raw = json.dumps(value, default=str, ensure_ascii=False)
+        await self._redis.set(self._key(key), raw, px=int(self.ttl * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        self._generation += 1
+        if keys:
+            await self._redis.delete(*(self._key(key) for key in keys))
+
+    async def clear(self) -> None:
+        self._generation += 1
+        async for key in self._redis.scan_iter(match=self._key("*")):
+            await self._redis.delete(key)
+
+
+class CountCache:
+    """
+    客户列表总数的短期缓存，按筛选条件区分
+
+    只在进程内缓存：写操作调用 invalidate() 清空本进程的缓存，其他进程的写入最多在 ttl 秒后可见。
+    计数前先取 generation()，写入缓存时如果期间发生过写操作就放弃，避免存入过期的计数。
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._generation = 0
+        self._entries: dict[str, tuple[float, int, bool]] = {}
+
+    def generation(self) -> int:
+        """当前的写入代数，每次 invalidate() 加一"""
+        return self._generation
+
+    def get(self, key: str) -> tuple[int, bool] | None:
+        """读取 (总数, 是否精确)，不存在或已过期时返回 None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, total, exact = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return total, exact
+
+    def set(self, key: str, total: int, exact: bool, generation: int) -> None:
+        """写入计数，generation 是计数开始前取得的写入代数"""
+        if generation == self._generation:
+            self._entries[key] = (time.monotonic() + self.ttl, total, exact)
+
+    def invalidate(self) -> None:
+        """写操作之后清空所有计数"""
+        self._generation += 1
+        self._entries.clear()
+
+
+def create_cache() -> CacheBackend:
+    """
+    根据配置创建缓存后端
+    """
+    if settings.CACHE_BACKEND == "none":
+        return NullCache()
+    if settings.CACHE_BACKEND == "redis":
+        if not settings.CACHE_URL:
+            raise RuntimeError("CACHE_BACKEND=redis 时必须设置 CACHE_URL")
+        return RedisCache(settings.CACHE_URL, ttl=settings.CACHE_TTL_SECONDS)
+    return MemoryCache(max_entries=settings.CACHE_MAX_ENTRIES, ttl=settings.CACHE_TTL_SECONDS)
+
+
+# 单个客户的读缓存，写操作提交后失效
+customer_cache = create_cache()
+
+# 客户列表总数的缓存，写操作提交后失效
+count_cache = CountCache(ttl=settings.COUNT_CACHE_TTL_SECONDS)
+
+registry.register(CallbackGauge(
+    "customer_cache_events",
+    "单个客户读缓存的命中、未命中、淘汰次数，以及读取期间发生写入而放弃写缓存的次数",
+    lambda: {(kind,): customer_cache.stats()[kind] for kind in ("hits", "misses", "evictions", "stale_skips")},
+    ("kind",)
+))
@@ -0,0 +1,159 @@
+"""
+响应压缩
+
+按请求的 Accept-Encoding 选择 brotli（安装了 brotli 包时）或 gzip，只压缩超过 minimum_size 字节的
+JSON、NDJSON、CSV 等文本响应。流式响应（导出）边生成边压缩；SSE 事件流和已经编码过的响应不压缩。
+
+压缩后的响应体与原来的字节不同，强 ETag 改为弱 ETag（`W/`）；304 响应同样带上 `Vary: Accept-Encoding`，
+协商出编码时 ETag 也改为弱 ETag，与完整响应的响应头一致。
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖：pdm install -G compression
+    brotli = None
+
+# 值得压缩的内容类型（前缀匹配）
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# 需要逐条立即送达的内容类型，压缩缓冲会造成延迟
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """
+    从 Accept-Encoding 中选择编码：br 优先于 gzip，q=0 表示不接受
+    """
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    candidates = ("br", "gzip") if brotli is not None else ("gzip",)
+    for encoding in candidates:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    """
+    把响应头中的强 ETag 改为弱 ETag
+    """
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class _Encoder:
+    """增量压缩器，gzip 和 brotli 的统一接口"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31：带 gzip 头和校验的 deflate
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """
+        压缩一段数据；不是最后一段时刷出缓冲，让已经生成的数据立即发给客户端
+        """
+        if self.encoding == "br":
+            output = self._compressor.process(data)
+            return output + (self._compressor.finish() if final else self._compressor.flush())
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 压缩较大响应的 ASGI 中间件"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+
+        start_message = None
+        encoder: _Encoder | None = None
+        passthrough = False
+
+        async def send_wrapper(message) -> None:
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    # 304 没有响应体，响应头要与压缩后的完整响应一致，缓存才能按编码区分并更新保存的响应
+                    response_headers = MutableHeaders(raw=message["headers"])
+                    response_headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None:
+                        weaken_etag(response_headers)
+                    passthrough = True
+                elif encoding is None:
+                    passthrough = True
+                else:
+                    # 先保留响应头，看到第一段响应体后再决定是否压缩
+                    start_message = message
+                    return
+                await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = Headers(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(EXCLUDED_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+                compressed = encoder.compress(body, final=not more_body)
+                response_headers = MutableHeaders(raw=start_message["headers"])
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                weaken_etag(response_headers)
+                if more_body:
+                    # 流式响应压缩后的长度未知
+                    del response_headers["Content-Length"]
+                else:
+                    response_headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+
+            await send({
+                "type": "http.response.body",
+                "body": encoder.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_wrapper)
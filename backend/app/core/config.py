@@ -1,24 +1,129 @@
 """
 应用配置
 """
+from datetime import datetime
 from functools import lru_cache
+from typing import Literal
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Customer Management System"
     
-    # 数据库配置
-    DB_USER: str
-    DB_PASSWORD: str
-    DB_HOST: str
-    DB_PORT: int
-    DB_NAME: str
+    # 数据库配置：直接设置 DATABASE_URL，或者设置 DB_* 各项拼出 PostgreSQL 连接串
+    # SQLite 用于测试和本地压测：sqlite+aiosqlite:///customer.db；内存数据库 sqlite+aiosqlite:///:memory: 只用于测试
+    DATABASE_URL: str | None = None
+    DB_USER: str | None = None
+    DB_PASSWORD: str | None = None
+    DB_HOST: str | None = None
+    DB_PORT: int = 5432
+    DB_NAME: str | None = None
+
+    # 连接池配置：每个工作进程最多 DB_POOL_SIZE + DB_MAX_OVERFLOW 个连接
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # 等待空闲连接的最长秒数
+    DB_POOL_RECYCLE: int = 1800  # 连接使用超过该秒数后重建，-1 表示不回收
+    DB_POOL_PRE_PING: bool = True  # 取出连接前先检测是否可用
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg 每个连接缓存的预编译语句数，0 表示关闭
+
+    # 启动时自动执行数据库迁移；生产环境保持关闭，部署时执行一次 `pdm run cli migrate`，
+    # 工作进程启动时只检查结构版本
+    DB_AUTO_MIGRATE: bool = False
+
+    # 只读副本：设置 DATABASE_READ_URL 后，列表、搜索、统计、导出等 GET 请求读副本，写操作仍然使用主库。
+    # 客户端写入后的 DB_READ_STICKY_SECONDS 秒内，它的读请求仍然走主库（读到自己刚写的数据）；
+    # 副本连接失败时改读主库，DB_READ_RETRY_SECONDS 秒后再尝试副本
+    DATABASE_READ_URL: str | None = None
+    DB_READ_STICKY_SECONDS: float = 5.0
+    DB_READ_RETRY_SECONDS: float = 30.0
+    DB_READ_CONNECT_TIMEOUT: float = 2.0  # 连接副本的最长秒数，超时按副本不可用处理
+
+    # 准入控制：每个工作进程同时处理的 API 请求数上限（默认 DB_POOL_SIZE + DB_MAX_OVERFLOW），
+    # 多出的请求最多 ADMISSION_QUEUE_SIZE 个排队，等待超过 ADMISSION_QUEUE_TIMEOUT 秒或队列已满时返回 503
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_IN_FLIGHT: int | None = None
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0  # 应小于 DB_POOL_TIMEOUT，先于连接池超时拒绝
+    ADMISSION_RETRY_AFTER: int = 1  # 503 响应的 Retry-After 秒数
+
+    # 生产服务器（pdm run cli serve）的默认参数
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1  # 工作进程数，每个进程有自己的连接池
+    SERVER_LOOP: Literal["auto", "asyncio", "uvloop"] = "auto"  # auto 在安装了 uvloop 时使用 uvloop
+    SERVER_HTTP: Literal["auto", "h11", "httptools"] = "auto"  # auto 在安装了 httptools 时使用 httptools
+    SERVER_GRACEFUL_TIMEOUT: int = 30  # 关闭时等待进行中请求完成的最长秒数
+    SERVER_KEEP_ALIVE: int = 5  # 空闲 keep-alive 连接保持的秒数
+
+    # 是否记录请求和 SQL 指标（/metrics）
+    METRICS_ENABLED: bool = True
+
+    # 客户变更记录的写后队列：攒够 HISTORY_BATCH_SIZE 行或每隔 HISTORY_FLUSH_INTERVAL 秒批量写入一次，
+    # 队列中超过 HISTORY_MAX_PENDING 行时丢弃新的记录（数据库长时间不可用时保护内存）
+    HISTORY_BATCH_SIZE: int = 500
+    HISTORY_FLUSH_INTERVAL: float = 1.0
+    HISTORY_MAX_PENDING: int = 100000
+
+    # 客户变更推送（/customers/events）：memory（进程内，单个工作进程）、postgres（LISTEN/NOTIFY，
+    # 多个工作进程共享）或 none（关闭）
+    EVENTS_BACKEND: Literal["memory", "postgres", "none"] = "memory"
+    EVENTS_CHANNEL: str = "customer_events"  # LISTEN/NOTIFY 的频道名
+    EVENTS_QUEUE_SIZE: int = 1000  # 每个订阅者最多积压的事件数，超出时改为通知重新加载
+    EVENTS_KEEPALIVE_SECONDS: float = 15.0  # 没有事件时发送注释行的间隔，防止代理断开空闲连接
+
+    # 合并并发的单个客户查询：CUSTOMER_LOADER_WINDOW 秒内的查询合并为一条，最多 CUSTOMER_LOADER_MAX_BATCH 个
+    CUSTOMER_LOADER_ENABLED: bool = True
+    CUSTOMER_LOADER_WINDOW: float = 0.002
+    CUSTOMER_LOADER_MAX_BATCH: int = 100
+
+    # 响应压缩：超过 COMPRESSION_MINIMUM_SIZE 字节的 JSON/NDJSON/CSV 响应按 Accept-Encoding 用 brotli 或 gzip 压缩
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11，4 左右压缩率与速度比较均衡
+
+    # 后台维护任务：SCHEDULER_ENABLED 控制工作进程是否运行定时任务，多个进程时同一任务只有一个进程执行。
+    # 超过 STALE_LEAD_DAYS 天没有修改的未成交客户标记为 DEAD，每 STALE_LEAD_INTERVAL_SECONDS 秒检查一次，
+    # 每批最多更新 STALE_LEAD_BATCH_SIZE 行；不设置 STALE_LEAD_DAYS 时不运行
+    SCHEDULER_ENABLED: bool = True
+    STALE_LEAD_DAYS: int | None = None
+    STALE_LEAD_INTERVAL_SECONDS: float = 3600.0
+    STALE_LEAD_BATCH_SIZE: int = 1000
+    # 归档：超过 ARCHIVE_DEAD_DAYS 天没有修改的 DEAD 客户、以及创建时间早于 ARCHIVE_CREATED_BEFORE 的客户
+    # 每 ARCHIVE_INTERVAL_SECONDS 秒移到 customer_management_archive 一次；两项都不设置时不运行
+    ARCHIVE_DEAD_DAYS: int | None = None
+    ARCHIVE_CREATED_BEFORE: datetime | None = None
+    ARCHIVE_INTERVAL_SECONDS: float = 86400.0
+    ARCHIVE_BATCH_SIZE: int = 1000
+
+    # 缓存配置：memory（进程内 LRU）、redis（多进程共享）或 none（关闭）
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    CACHE_URL: str | None = None
+    CACHE_TTL_SECONDS: float = 60.0
+    CACHE_MAX_ENTRIES: int = 10000
+
+    # 客户列表总数（with_total=true）：缓存秒数，以及 PostgreSQL 的估计行数超过多少时直接返回估计值
+    COUNT_CACHE_TTL_SECONDS: float = 10.0
+    COUNT_EXACT_LIMIT: int = 100000
+
+    @model_validator(mode="after")
+    def build_database_url(self) -> "Settings":
+        """未设置 DATABASE_URL 时用 DB_* 构建 PostgreSQL 连接串"""
+        if self.DATABASE_URL is None:
+            missing = [name for name in ("DB_USER", "DB_PASSWORD", "DB_HOST", "DB_NAME") if getattr(self, name) is None]
+            if missing:
+                raise ValueError(f"必须设置 DATABASE_URL，或者设置 {', '.join(missing)}")
+            self.DATABASE_URL = (
+                f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+            )
+        return self
 
     @property
-    def DATABASE_URL(self) -> str:
-        """构建数据库 URL"""
-        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+    def DATABASE_BACKEND(self) -> str:
+        """数据库类型：postgresql 或 sqlite"""
+        return self.DATABASE_URL.split(":", 1)[0].split("+", 1)[0]
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,17 +1,113 @@
-from typing import AsyncGenerator
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator
 
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession #异步会话
-from sqlalchemy.ext.asyncio import create_async_engine #创建异步引擎
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine #创建异步引擎
 from sqlalchemy.orm import sessionmaker #会话工厂
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 from app.core.config import settings
+from app.core.metrics import CallbackGauge, Counter, instrument_engine, registry
+
+logger = logging.getLogger(__name__)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """记录取得连接所需等待时间和超时次数的连接池"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.acquisitions += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+def _setup_sqlite(engine: AsyncEngine) -> None:
+    """
+    SQLite 连接设置
+
+    关闭驱动自带的事务处理，改为在 begin 时自己发出 BEGIN，这样 SAVEPOINT 才能正常工作；
+    文件数据库使用 WAL 模式，读写可以并发。
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record) -> None:
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def on_begin(conn) -> None:
+        conn.exec_driver_sql("BEGIN")
+
+def is_memory_database(url: str) -> bool:
+    """
+    连接串是否指向 SQLite 内存数据库：只存在于单个连接和单个进程中，只用于测试
+    """
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+def build_engine(url: str, connect_timeout: float | None = None) -> AsyncEngine:
+    """
+    按连接串创建异步引擎，PostgreSQL 使用可配置的连接池，SQLite 使用文件或内存数据库
+
+    connect_timeout 是建立 PostgreSQL 连接的最长秒数，不设置时使用 asyncpg 的默认值
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if is_memory_database(url):
+            # 内存数据库只存在于单个连接中，所有会话共用这一个连接，不能并发使用
+            sqlite_engine = create_async_engine(url, poolclass=StaticPool)
+        else:
+            sqlite_engine = create_async_engine(
+                url,
+                poolclass=InstrumentedPool,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+                connect_args={"timeout": settings.DB_POOL_TIMEOUT}  # 等待写锁的秒数
+            )
+        _setup_sqlite(sqlite_engine)
+        return sqlite_engine
+
+    connect_args: dict[str, Any] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    if connect_timeout is not None:
+        connect_args["timeout"] = connect_timeout
+    return create_async_engine(
+        url,
+        echo=False,  # 设置为 True 可以打印 SQL 语句，生产环境建议设为 False
+        future=True,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args
+    )
 
 # 创建异步引擎
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,  # 设置为 True 可以打印 SQL 语句，生产环境建议设为 False
-    future=True
-)
+engine = build_engine(settings.DATABASE_URL)
 
 # 创建异步会话工厂
 async_session = sessionmaker(
@@ -20,12 +116,94 @@ async_session = sessionmaker(
     expire_on_commit=False
 )
 
+# 只读副本的引擎和会话工厂，没有设置 DATABASE_READ_URL 时为 None
+read_engine = (
+    build_engine(settings.DATABASE_READ_URL, connect_timeout=settings.DB_READ_CONNECT_TIMEOUT)
+    if settings.DATABASE_READ_URL else None
+)
+read_session = (
+    sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    if read_engine is not None else None
+)
+
+def pool_stats(pool_engine: AsyncEngine | None = None) -> dict[str, Any]:
+    """
+    连接池当前状态：已借出、空闲、溢出连接数，以及取得连接的等待时间
+
+    默认统计主库的连接池，传入 read_engine 时统计只读副本的连接池
+    """
+    pool = (pool_engine or engine).pool
+    if not isinstance(pool, QueuePool):
+        # 内存 SQLite 只有一个共享连接，没有可统计的连接池
+        return {"pool_class": type(pool).__name__}
+    stats: dict[str, Any] = {
+        "pool_size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, InstrumentedPool):
+        stats.update(
+            acquisitions=pool.acquisitions,
+            timeouts=pool.timeouts,
+            wait_seconds_total=round(pool.wait_seconds_total, 6),
+            wait_seconds_avg=round(pool.wait_seconds_total / pool.acquisitions, 6) if pool.acquisitions else 0.0,
+            wait_seconds_max=round(pool.wait_seconds_max, 6),
+        )
+    return stats
+
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
+    registry.register(CallbackGauge(
+        "db_pool_connections",
+        "连接池中各状态的连接数",
+        lambda: {
+            (state,): pool_stats().get(state, 0)
+            for state in ("pool_size", "checked_out", "idle", "overflow")
+        },
+        ("state",)
+    ))
+    registry.register(CallbackGauge(
+        "db_pool_acquire_wait_seconds",
+        "取得连接的累计和最长等待时间（秒）",
+        lambda: {
+            (kind,): pool_stats().get(f"wait_seconds_{kind}", 0.0)
+            for kind in ("total", "max")
+        },
+        ("kind",)
+    ))
+    registry.register(CallbackGauge(
+        "db_pool_acquire_events",
+        "取得连接的次数和超时次数",
+        lambda: {(kind,): pool_stats().get(kind, 0) for kind in ("acquisitions", "timeouts")},
+        ("kind",)
+    ))
+    if read_engine is not None:
+        instrument_engine(read_engine)
+        registry.register(CallbackGauge(
+            "db_read_pool_connections",
+            "只读副本连接池中各状态的连接数",
+            lambda: {
+                (state,): pool_stats(read_engine).get(state, 0)
+                for state in ("pool_size", "checked_out", "idle", "overflow")
+            },
+            ("state",)
+        ))
+
+# 读请求实际使用的数据库：replica（副本）、primary（没有副本）、sticky（刚写入过，读主库）、fallback（副本不可用，读主库）
+DB_READ_ROUTES = registry.register(Counter(
+    "db_read_routes_total",
+    "读请求按实际使用的数据库计数",
+    ("target",)
+))
+
 async def init_db():
     """初始化数据库，创建所有表"""
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
     """
     获取数据库会话的依赖函数
     用法：
@@ -33,12 +211,127 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async def get_items(db: AsyncSession = Depends(get_db)):
         ...
     """
+    # 标记请求使用了主库会话，写请求成功后由 ReadYourWritesMiddleware 设置读主库的 cookie
+    request.state.primary_db_used = True
     async with async_session() as session:
         try:
             yield session
-            await session.commit()
+            # CRUD 写操作已自行提交，这里只提交还未结束的事务（例如只读查询）
+            if session.in_transaction():
+                await session.commit()
         except Exception:
             await session.rollback()
             raise
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+# 记录客户端最近一次写入的 cookie，值是读请求需要走主库的截止时间（Unix 时间戳）
+READ_PRIMARY_COOKIE = "read_primary_until"
+# 不修改数据的请求方法，其他方法的请求都按写入处理
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# 副本连接失败后，在这个时间（time.monotonic）之前不再尝试副本
+_replica_retry_at = 0.0
+
+def _read_primary_until(request: Request) -> float:
+    """
+    客户端需要读主库的截止时间，没有写入过（或 cookie 无法解析）时返回 0
+    """
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+def read_target(request: Request) -> str:
+    """
+    决定读请求使用的数据库：replica、primary（没有副本）、sticky（刚写入过）或 fallback（副本暂时不可用）
+    """
+    if read_session is None:
+        return "primary"
+    if _read_primary_until(request) > time.time():
+        return "sticky"
+    if time.monotonic() < _replica_retry_at:
+        return "fallback"
+    return "replica"
+
+@asynccontextmanager
+async def read_session_scope(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    打开读请求使用的会话
+
+    使用副本时先取得连接，连接失败（副本宕机、超时）就改用主库，
+    并在 DB_READ_RETRY_SECONDS 秒内不再尝试副本，避免每个请求都等待连接超时。
+    副本的连接池已满、等待空闲连接超时时只有这个请求改用主库：副本本身是可用的。
+    """
+    global _replica_retry_at
+    target = read_target(request)
+    session = None
+    if target == "replica":
+        session = read_session()
+        try:
+            await session.connection()
+        except PoolTimeoutError as e:
+            await session.close()
+            session = None
+            target = "fallback"
+            logger.warning("只读副本的连接池已满，这个请求改读主库: %s", e)
+        except (DBAPIError, OSError, TimeoutError) as e:
+            await session.close()
+            session = None
+            target = "fallback"
+            _replica_retry_at = time.monotonic() + settings.DB_READ_RETRY_SECONDS
+            logger.warning("只读副本不可用，%s 秒内改读主库: %s", settings.DB_READ_RETRY_SECONDS, e)
+    DB_READ_ROUTES.inc(target)
+    async with session or async_session() as session:
+        yield session
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取只读请求数据库会话的依赖函数
+
+    设置了只读副本时读副本，客户端刚写入过或副本不可用时读主库；
+    通过这个会话执行的写操作没有意义（副本是只读的），写路由要使用 get_db。
+    """
+    async with read_session_scope(request) as session:
+        try:
+            yield session
+            if session.in_transaction():
+                await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+class ReadYourWritesMiddleware:
+    """
+    写请求成功后设置 cookie，让这个客户端在 DB_READ_STICKY_SECONDS 秒内读主库
+
+    副本有复制延迟，客户端刚创建或修改的数据可能还没出现在副本上。
+    cookie 由客户端携带，多个工作进程都能识别，服务端不需要保存状态。
+    """
+
+    def __init__(self, app, sticky_seconds: float = settings.DB_READ_STICKY_SECONDS) -> None:
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        scope.setdefault("state", {})
+
+        async def send_wrapper(message) -> None:
+            # 只有通过 get_db 使用了主库的请求才算写入，批量获取等只读的 POST 不影响读路由
+            if (
+                message["type"] == "http.response.start"
+                and message["status"] < 400
+                and scope["state"].get("primary_db_used")
+            ):
+                until = time.time() + self.sticky_seconds
+                cookie = (
+                    f"{READ_PRIMARY_COOKIE}={until:.3f}; Max-Age={math.ceil(self.sticky_seconds)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message["headers"], (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
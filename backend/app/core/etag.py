@@ -0,0 +1,90 @@
+"""
+ETag 与条件请求
+
+单个客户的 ETag 由 last_modified_date 编码而来（每次写入都会更新），可以再解码回时间，
+用于 `If-Match` 条件更新：`UPDATE ... WHERE last_modified_date = :版本`。
+客户列表的 ETag 是返回的每一行 (id, last_modified_date) 的摘要，不需要先编码响应体。
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+from fastapi import Response
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 带 ETag 的 GET 响应：客户端（包括浏览器缓存）每次使用前都要用 If-None-Match 重新验证
+REVALIDATE_HEADERS = {"Cache-Control": "no-cache"}
+
+def _utc(value: datetime) -> datetime:
+    """
+    SQLite 取出的时间不带时区，按 UTC 处理
+    """
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def customer_etag(last_modified_date: datetime) -> str:
+    """
+    单个客户的强 ETag：last_modified_date 距 1970 年的微秒数（十六进制）
+    """
+    microseconds = (_utc(last_modified_date) - EPOCH) // timedelta(microseconds=1)
+    return f'"{microseconds:x}"'
+
+def parse_customer_etag(etag: str) -> datetime | None:
+    """
+    把 customer_etag 生成的 ETag 解码为 last_modified_date，无法解析时返回 None
+
+    压缩中间件会把压缩后响应的 ETag 改为弱 ETag，版本号不变，所以也接受 `W/` 前缀。
+    """
+    etag = etag.removeprefix("W/")
+    if len(etag) < 2 or not (etag.startswith('"') and etag.endswith('"')):
+        return None
+    try:
+        return EPOCH + timedelta(microseconds=int(etag[1:-1], 16))
+    except (ValueError, OverflowError):
+        return None
+
+def rows_etag(rows: Iterable[dict[str, Any]], *extra: Any) -> str:
+    """
+    客户列表的弱 ETag：每一行 (id, last_modified_date) 以及 extra（如下一页游标）的摘要
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(f"{row['id']}:{_utc(row['last_modified_date']).isoformat()};".encode())
+    for value in extra:
+        digest.update(f"|{value}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+def split_etags(header: str) -> list[str]:
+    """
+    拆分 If-Match / If-None-Match 中逗号分隔的 ETag 列表
+    """
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+def none_match(if_none_match: str | None, etag: str) -> bool:
+    """
+    If-None-Match 是否命中当前 ETag（弱比较，忽略 W/ 前缀），命中时应返回 304
+    """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(tag == "*" or tag.removeprefix("W/") == opaque for tag in split_etags(if_none_match))
+
+def if_match_versions(if_match: str | None) -> list[datetime] | None:
+    """
+    把 If-Match 解析为可以接受的 last_modified_date 列表
+
+    没有 If-Match 或者是 `*` 时返回 None，表示不限制版本；
+    其中的 ETag 都无法解析时返回空列表，更新一定失败（412）。
+    """
+    if not if_match:
+        return None
+    tags = split_etags(if_match)
+    if "*" in tags:
+        return None
+    return [version for version in map(parse_customer_etag, tags) if version is not None]
+
+def not_modified(etag: str) -> Response:
+    """
+    304 响应，不带响应体
+    """
+    return Response(status_code=304, headers={"ETag": etag, **REVALIDATE_HEADERS})
@@ -0,0 +1,247 @@
+"""
+客户变更事件的广播
+
+CRUD 写操作提交后发布事件（created / updated / deleted / bulk），
+`GET /api/v1/customers/events` 的每个 SSE 连接订阅一个进程内的队列。
+订阅者不占用数据库连接：每个事件只编码一次，再分发给本进程的所有订阅队列。
+
+默认使用进程内的代理，只能通知同一个工作进程的订阅者；设置 EVENTS_BACKEND=postgres 时
+通过 PostgreSQL 的 LISTEN/NOTIFY 在多个工作进程之间广播，每个进程只多用一个专门的连接。
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, NamedTuple
+
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.core.metrics import CallbackGauge, registry
+from app.core.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL 监听连接断开后重连的间隔（秒）
+RECONNECT_DELAY = 5.0
+
+
+class ChangeEvent(NamedTuple):
+    """一条变更事件，data 是已经编码好的 JSON"""
+    type: str
+    data: str
+
+
+# 订阅者可能错过了事件（队列溢出、监听连接重连），需要重新加载列表
+RESYNC = ChangeEvent("resync", "{}")
+
+
+def change_event(event_type: str, data: Any) -> ChangeEvent:
+    """
+    创建变更事件，在这里编码一次，分发给订阅者时不再重复编码
+    """
+    return ChangeEvent(event_type, dumps(data).decode("utf-8"))
+
+
+class Subscription:
+    """一个订阅者的事件队列"""
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: asyncio.Queue[ChangeEvent] = asyncio.Queue(queue_size)
+
+    def put(self, event: ChangeEvent) -> bool:
+        """
+        放入事件；队列已满（客户端读得太慢）时清空队列，改为通知它重新加载，返回 False
+        """
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return False
+
+    async def get(self, timeout: float) -> ChangeEvent | None:
+        """
+        等待下一条事件，timeout 秒内没有事件时返回 None
+        """
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except TimeoutError:
+            return None
+
+
+class EventBroker(ABC):
+    """事件代理接口"""
+
+    def __init__(self) -> None:
+        self._subscriptions: set[Subscription] = set()
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    @abstractmethod
+    async def publish(self, event: ChangeEvent) -> None:
+        """发布事件，发布失败只记录日志，不影响已经提交的写操作"""
+
+    async def start(self) -> None:
+        """在应用启动时调用"""
+
+    async def stop(self) -> None:
+        """在应用关闭时调用"""
+
+    def deliver(self, event: ChangeEvent) -> None:
+        """
+        把事件分发给本进程的所有订阅者
+        """
+        for subscription in list(self._subscriptions):
+            if subscription.put(event):
+                self.delivered += 1
+            else:
+                self.overflows += 1
+
+    @asynccontextmanager
+    async def subscribe(self, queue_size: int = settings.EVENTS_QUEUE_SIZE) -> AsyncIterator[Subscription]:
+        """
+        订阅事件，退出上下文时取消订阅
+        """
+        subscription = Subscription(queue_size)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def stats(self) -> dict[str, Any]:
+        """订阅者数以及发布、送达和溢出的计数"""
+        return {
+            "backend": type(self).__name__,
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+
+class NullBroker(EventBroker):
+    """不发布任何事件，用于关闭变更推送"""
+
+    async def publish(self, event: ChangeEvent) -> None:
+        pass
+
+
+class InProcessBroker(EventBroker):
+    """只在当前进程内广播，适用于单个工作进程"""
+
+    async def publish(self, event: ChangeEvent) -> None:
+        self.published += 1
+        self.deliver(event)
+
+
+class PostgresBroker(EventBroker):
+    """
+    通过 PostgreSQL 的 LISTEN/NOTIFY 在多个工作进程之间广播
+
+    每个进程用一个不属于连接池的 asyncpg 连接，既 LISTEN 也发送 NOTIFY；
+    收到的通知（包括本进程发出的）再分发给本进程的订阅者。
+    NOTIFY 的内容不能超过 8000 字节，单个客户的数据远小于这个限制。
+    """
+
+    def __init__(self, url: str, channel: str) -> None:
+        super().__init__()
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError("EVENTS_BACKEND=postgres 需要安装 asyncpg") from e
+        self._asyncpg = asyncpg
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self._connection = None
+        self._lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        event_type, _, data = payload.partition("\n")
+        self.deliver(ChangeEvent(event_type, data))
+
+    async def _listen(self) -> None:
+        """
+        保持监听连接，断开后重连；重连期间可能错过通知，重连后通知订阅者重新加载
+        """
+        connected_before = False
+        while True:
+            try:
+                connection = await self._asyncpg.connect(self.dsn)
+            except (OSError, self._asyncpg.PostgresError) as e:
+                logger.warning("事件监听连接失败，%s 秒后重试: %s", RECONNECT_DELAY, e)
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            try:
+                await connection.add_listener(self.channel, self._on_notify)
+                self._connection = connection
+                if connected_before:
+                    self.deliver(RESYNC)
+                connected_before = True
+                await lost.wait()
+                logger.warning("事件监听连接断开，%s 秒后重连", RECONNECT_DELAY)
+            finally:
+                self._connection = None
+                if not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def start(self) -> None:
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._listen(), name="customer-events-listener")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, event: ChangeEvent) -> None:
+        self.published += 1
+        connection = self._connection
+        if connection is None:
+            logger.warning("事件监听连接不可用，丢弃 %s 事件", event.type)
+            return
+        try:
+            # asyncpg 的连接不能同时执行多条语句
+            async with self._lock:
+                await connection.execute("SELECT pg_notify($1, $2)", self.channel, f"{event.type}\n{event.data}")
+        except (OSError, self._asyncpg.PostgresError, self._asyncpg.InterfaceError) as e:
+            logger.warning("发送 %s 事件失败: %s", event.type, e)
+
+
+def create_broker() -> EventBroker:
+    """
+    根据配置创建事件代理
+    """
+    if settings.EVENTS_BACKEND == "none":
+        return NullBroker()
+    if settings.EVENTS_BACKEND == "postgres":
+        if settings.DATABASE_BACKEND != "postgresql":
+            raise RuntimeError("EVENTS_BACKEND=postgres 需要使用 PostgreSQL 数据库")
+        return PostgresBroker(settings.DATABASE_URL, settings.EVENTS_CHANNEL)
+    return InProcessBroker()
+
+
+# 客户变更事件的代理，在应用的 lifespan 中启动和停止
+event_broker = create_broker()
+
+registry.register(CallbackGauge(
+    "customer_event_stream",
+    "客户变更推送的订阅者数以及发布、送达和因队列溢出改为 resync 的事件数",
+    lambda: {(kind,): event_broker.stats()[kind] for kind in ("subscribers", "published", "delivered", "overflows")},
+    ("kind",)
+))
@@ -0,0 +1,122 @@
+"""
+请求合并（DataLoader / singleflight）
+
+短时间窗口内对同一类数据的多次按键读取合并为一次批量查询：
+- 同一个键已经在等待或正在查询时，直接等待同一个结果，不再重复查询
+- 不同的键在窗口内攒成一批，窗口结束或攒满 max_batch 个键时一次查出
+
+批量查询在一个空的上下文中运行，不属于发起它的请求：其中的 SQL 不计入任何一个请求的语句数
+（http_request_db_statements），批量查询的次数见 stats()。
+
+写操作之后调用 forget() 让正在查询的键与新的读取脱钩：查询开始于写入之前，结果可能是旧的，
+之后的读取要发起新的查询，已经在等待的请求仍然拿到原来的结果。
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """把并发的按键读取合并为批量查询的加载器"""
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list[K]], Awaitable[dict[K, V]]],
+        window: float,
+        max_batch: int) -> None:
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        # 尚未发出的一批键，以及所有还没有结果的键（包括正在查询的）
+        self._queued: list[K] = []
+        self._futures: dict[K, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        # 正在执行的批量查询；事件循环只保存任务的弱引用，不保存的话任务可能在执行中被回收
+        self._tasks: set[asyncio.Task] = set()
+        self.loads = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    async def load(self, key: K) -> V | None:
+        """
+        读取一个键，不存在时返回 None
+        """
+        self.loads += 1
+        future = self._futures.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[key] = future
+            self._queued.append(key)
+            if len(self._queued) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+        # 一个等待者被取消不能取消其他请求共享的结果
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        """
+        发出当前攒下的一批键
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        keys, self._queued = self._queued, []
+        if keys:
+            batch = {key: self._futures[key] for key in keys}
+            # 不继承当前请求的上下文，否则这一批的 SQL 会全部记在碰巧发起它的请求上
+            task = asyncio.create_task(self._run_batch(batch), context=contextvars.Context())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: dict[K, asyncio.Future]) -> None:
+        """
+        执行一次批量查询，把结果分发给等待各个键的请求
+        """
+        self.batches += 1
+        try:
+            results = await self.batch_fn(list(batch))
+        except Exception as e:
+            for future in self._pop(batch):
+                future.set_exception(e)
+            return
+        except BaseException:
+            # 被取消（如应用关闭）时也要移除这些键，否则之后读取同一个键会一直等待
+            for future in self._pop(batch):
+                future.cancel()
+            raise
+        for key, future in zip(batch, self._pop(batch)):
+            future.set_result(results.get(key))
+
+    def _pop(self, batch: dict[K, asyncio.Future]) -> list[asyncio.Future]:
+        """
+        移除这一批键的等待结果（已经被 forget() 移除或替换的不动），返回与 batch 一一对应的 Future
+        """
+        for key, future in batch.items():
+            if self._futures.get(key) is future:
+                del self._futures[key]
+        return list(batch.values())
+
+    def forget(self, keys: Iterable[K] | None = None) -> None:
+        """
+        让正在查询的这些键（None 表示全部）不再接受新的读取，之后的读取重新查询
+
+        还在窗口中等待发出的键不受影响，它们的查询一定在调用之后才开始。
+        """
+        queued = set(self._queued)
+        for key in list(self._futures) if keys is None else keys:
+            if key not in queued:
+                self._futures.pop(key, None)
+
+    def stats(self) -> dict[str, int]:
+        """读取次数、合并到已有查询的次数和实际执行的批量查询次数"""
+        return {"loads": self.loads, "coalesced": self.coalesced, "batches": self.batches}
@@ -0,0 +1,241 @@
+"""
+运行指标
+
+一个不依赖第三方库的 Prometheus 文本格式实现：
+- MetricsMiddleware 按路由模板记录请求数、状态码和耗时
+- instrument_engine 在引擎上挂 before/after_cursor_execute 钩子，记录每条 SQL 的耗时和每个请求的语句数；
+  合并多个请求的批量查询（BatchLoader）只计入 SQL 耗时，不计入任何一个请求的语句数
+- 其他模块可以注册 CallbackGauge，在抓取时读取当前值（例如连接池、缓存）
+
+所有记录都在事件循环线程内完成，只做字典查找和整数累加，开销可以常驻生产环境。
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# 延迟直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求执行的 SQL 语句数的分桶
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value: str) -> str:
+    """
+    转义标签值中的特殊字符
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    """
+    格式化标签，例如 {method="GET",route="/"}
+    """
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+class Metric:
+    """指标基类"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+
+    def samples(self) -> Iterable[str]:
+        """当前的样本行"""
+        return ()
+
+    def render(self) -> list[str]:
+        """带 HELP/TYPE 头的文本格式"""
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}", *self.samples()]
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"
+
+
+class Histogram(Metric):
+    """分桶直方图"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        # 每组标签：[各桶计数（最后一个是 +Inf）, 总和, 次数]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        entry = self._values.get(labelvalues)
+        if entry is None:
+            entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = _labels((*self.labelnames, "le"), (*labelvalues, bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class CallbackGauge(Metric):
+    """抓取时调用回调读取当前值的仪表，回调返回 {标签值元组: 数值}"""
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], dict[tuple[str, ...], float]],
+        labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in sorted(self.callback().items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "按路由模板和状态码统计的请求数", ("method", "route", "status")
+))
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "按路由模板统计的请求耗时（秒）", ("method", "route")
+))
+HTTP_REQUEST_STATEMENTS = registry.register(Histogram(
+    "http_request_db_statements", "每个请求执行的 SQL 语句数（不含合并查询的批量语句）", ("method", "route"),
+    STATEMENT_COUNT_BUCKETS
+))
+DB_STATEMENT_DURATION = registry.register(Histogram(
+    "db_statement_duration_seconds", "按语句类型统计的 SQL 执行耗时（秒）", ("operation",)
+))
+
+# 当前请求已执行的 SQL 语句数；SQLAlchemy 在 greenlet 中执行同步代码时会沿用调用方的上下文
+_request_statements: ContextVar[list[int] | None] = ContextVar("request_statements", default=None)
+
+
+def _route_template(scope) -> str:
+    """
+    请求匹配到的路由模板，例如 /api/v1/customers/{customer_id}；未匹配任何路由时为 unmatched
+
+    用路由模板而不是实际路径作为标签，避免标签数量失控。
+    较新的 FastAPI 在 scope 中放的是未加 include_router 前缀的路由，这时从实际路径中找出前缀补上。
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is None or regex.match(path):
+        return template
+    for index, char in enumerate(path):
+        if char == "/" and index and regex.match(path[index:]):
+            return path[:index] + template
+    return template
+
+
+class MetricsMiddleware:
+    """记录每个请求的路由、状态码、耗时和 SQL 语句数的 ASGI 中间件"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        statements = [0]
+        token = _request_statements.set(statements)
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_statements.reset(token)
+            route_path = _route_template(scope)
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route_path, str(status))
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, route_path)
+            HTTP_REQUEST_STATEMENTS.observe(statements[0], method, route_path)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    DB_STATEMENT_DURATION.observe(time.perf_counter() - started, operation)
+    statements = _request_statements.get()
+    if statements is not None:
+        statements[0] += 1
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    在引擎上挂 SQL 计时钩子
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
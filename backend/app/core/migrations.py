@@ -0,0 +1,206 @@
+"""
+数据库结构迁移
+
+表结构由这里按版本号顺序创建和升级，通过 `pdm run cli migrate` 在部署时执行一次；
+应用的工作进程启动时只检查 schema_version 表中记录的版本，不再执行 DDL。
+
+每个迁移在独立的事务中执行，并在同一事务中记录版本号。迁移必须可以在已有的数据库上安全执行
+（建表、建索引都使用 checkfirst），这样旧版本启动时 create_all 建好的数据库也能直接升级。
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, func, insert, inspect, select, text, true
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateTable
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.scheduler import job_run_table
+from app.crud.dialects import is_postgresql
+from app.crud.stats import apply_stats_delta_where
+from app.models.customer import Customer, CustomerArchive, CustomerHistory, CustomerStats
+
+logger = logging.getLogger(__name__)
+
+# 迁移期间持有的 PostgreSQL advisory lock，防止多个迁移进程同时执行
+MIGRATION_LOCK_ID = 7_300_001
+
+# 单独的 MetaData，不参与模型的 create_all
+schema_version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+class SchemaVersionError(RuntimeError):
+    """数据库结构版本低于代码要求的版本"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    """一个迁移步骤"""
+    version: int
+    description: str
+    upgrade: Callable[[AsyncSession], Awaitable[None]]
+
+
+async def _create_tables(db: AsyncSession, *tables: Table) -> None:
+    """
+    创建不存在的表（连同表上的索引）
+    """
+    await db.run_sync(lambda session: Customer.metadata.create_all(
+        session.connection(), tables=list(tables), checkfirst=True
+    ))
+
+async def _create_customer_table(db: AsyncSession) -> None:
+    await _create_tables(db, Customer.__table__)
+
+async def _create_customer_indexes(db: AsyncSession) -> None:
+    """
+    补建客户表上后来加入的索引（筛选、排序、游标分页和 trigram 搜索）
+    """
+    if is_postgresql(db):
+        await db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+    def create_indexes(session) -> None:
+        connection = session.connection()
+        existing = {index["name"] for index in inspect(connection).get_indexes(Customer.__tablename__)}
+        for index in Customer.__table__.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+    await db.run_sync(create_indexes)
+
+async def _create_stats_table(db: AsyncSession) -> None:
+    """
+    创建销售看板汇总表，并根据现有客户计算初始汇总
+    """
+    await _create_tables(db, CustomerStats.__table__)
+    await db.execute(delete(CustomerStats))
+    await apply_stats_delta_where(db, true(), 1)
+
+async def _create_history_table(db: AsyncSession) -> None:
+    await _create_tables(db, CustomerHistory.__table__)
+
+async def _create_archive_table(db: AsyncSession) -> None:
+    await _create_tables(db, CustomerArchive.__table__)
+
+async def _create_job_run_table(db: AsyncSession) -> None:
+    await db.run_sync(lambda session: job_run_table.create(session.connection(), checkfirst=True))
+
+async def _use_sqlite_autoincrement(db: AsyncSession) -> None:
+    """
+    SQLite：客户表改用 AUTOINCREMENT，归档移走的最大 id 不会再分配给新客户
+
+    SQLite 不能修改已有表的主键定义，旧版本建的表要按新定义建一张表、复制数据、删除旧表再改名，
+    然后重建索引；序号从客户表和归档表中最大的 id 开始。PostgreSQL 的序列本来就不会重用 id。
+    """
+    if is_postgresql(db):
+        return
+    name = Customer.__tablename__
+    result = await db.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name})
+    if "AUTOINCREMENT" not in result.scalar_one().upper():
+        rebuild = f"{name}_rebuild"
+        columns = ", ".join(column.name for column in Customer.__table__.columns)
+
+        def rebuild_table(session) -> None:
+            connection = session.connection()
+            # CreateTable 只建表不建索引，新表的索引在改名之后按原来的名字建
+            connection.execute(CreateTable(Customer.__table__.to_metadata(MetaData(), name=rebuild)))
+            connection.exec_driver_sql(f"INSERT INTO {rebuild} ({columns}) SELECT {columns} FROM {name}")
+            connection.exec_driver_sql(f"DROP TABLE {name}")
+            connection.exec_driver_sql(f"ALTER TABLE {rebuild} RENAME TO {name}")
+            for index in Customer.__table__.indexes:
+                index.create(connection, checkfirst=True)
+
+        await db.run_sync(rebuild_table)
+
+    max_id = max(
+        await db.scalar(select(func.coalesce(func.max(Customer.id), 0))),
+        await db.scalar(select(func.coalesce(func.max(CustomerArchive.id), 0))),
+    )
+    await db.execute(
+        text("UPDATE sqlite_sequence SET seq = :max_id WHERE name = :name AND seq < :max_id"),
+        {"name": name, "max_id": max_id}
+    )
+    await db.execute(
+        text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :max_id"
+            " WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+        ),
+        {"name": name, "max_id": max_id}
+    )
+
+# 按版本号排列，只能在末尾追加
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "客户表", _create_customer_table),
+    Migration(2, "客户列表筛选、排序和搜索的索引", _create_customer_indexes),
+    Migration(3, "销售看板汇总表", _create_stats_table),
+    Migration(4, "客户变更记录表", _create_history_table),
+    Migration(5, "客户归档表", _create_archive_table),
+    Migration(6, "SQLite 客户表不重用已删除的 id", _use_sqlite_autoincrement),
+    Migration(7, "定时任务运行记录表", _create_job_run_table),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+async def get_schema_version(db: AsyncSession) -> int:
+    """
+    数据库当前的结构版本，还没有迁移过时为 0
+    """
+    exists = await db.run_sync(
+        lambda session: inspect(session.connection()).has_table(schema_version_table.name)
+    )
+    if not exists:
+        return 0
+    result = await db.execute(select(func.coalesce(func.max(schema_version_table.c.version), 0)))
+    return result.scalar_one()
+
+async def migrate(engine: AsyncEngine) -> list[Migration]:
+    """
+    依次执行还没有执行过的迁移，返回本次执行的迁移
+    """
+    applied: list[Migration] = []
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        await db.run_sync(lambda session: schema_version_table.create(session.connection(), checkfirst=True))
+        await db.commit()
+
+        for migration in MIGRATIONS:
+            if is_postgresql(db):
+                # 事务级锁，提交时自动释放；拿到锁后重新读取版本，其他进程可能已经执行过这一步
+                await db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            if migration.version <= await get_schema_version(db):
+                await db.commit()
+                continue
+
+            logger.info("执行迁移 %s：%s", migration.version, migration.description)
+            await migration.upgrade(db)
+            await db.execute(insert(schema_version_table).values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.now(timezone.utc),
+            ))
+            await db.commit()
+            applied.append(migration)
+    return applied
+
+async def verify_schema_version(engine: AsyncEngine) -> int:
+    """
+    检查数据库结构版本，低于代码要求的版本时抛出 SchemaVersionError，返回当前版本
+
+    数据库版本高于代码时只记录警告：迁移只增加表和索引，滚动升级期间旧版本的进程仍然可以运行。
+    """
+    async with AsyncSession(engine) as db:
+        version = await get_schema_version(db)
+    if version < LATEST_VERSION:
+        raise SchemaVersionError(
+            f"数据库结构版本为 {version}，需要 {LATEST_VERSION}，请先执行 `pdm run cli migrate`"
+        )
+    if version > LATEST_VERSION:
+        logger.warning("数据库结构版本 %s 高于代码的版本 %s", version, LATEST_VERSION)
+    return version
@@ -0,0 +1,46 @@
+"""
+快速 JSON 响应
+
+列表接口直接返回数据库取出的列值（可信数据），不再经过 response_model 的二次校验，
+由这里的响应类负责编码：安装了 orjson 时用 orjson，否则退回标准库 json。
+"""
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖：pdm add orjson
+    orjson = None
+
+def _default(value: Any) -> Any:
+    """
+    标准库 json 不认识的类型
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        # 与 pydantic 的输出保持一致，UTC 时间以 Z 结尾
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"无法编码为 JSON 的类型: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """
+    把 dict、list、datetime、枚举等组成的数据编码为 JSON 字节串
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """跳过 jsonable_encoder，直接编码内容的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
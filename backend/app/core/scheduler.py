@@ -0,0 +1,190 @@
+"""
+进程内的定时任务
+
+每个任务是一个接收数据库会话、返回影响行数的协程函数，按固定间隔在后台运行。
+每个工作进程都会启动调度器，任务的上次开始时间记录在 scheduled_job 表中：运行前用一条
+`UPDATE ... WHERE last_started_at <= now - interval` 认领这一轮，所有进程合起来每个间隔只运行一次，
+认领失败的进程这一轮跳过。PostgreSQL 上还会先取得以任务名为键的 advisory lock，
+运行时间超过间隔的任务不会被其他进程重叠执行。SQLite 只用于单机开发，不加锁。
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.crud.dialects import is_postgresql, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+# 每个任务最近一次开始运行的时间，由迁移创建；单独的 MetaData，不参与模型的 create_all
+job_run_table = Table(
+    "scheduled_job",
+    MetaData(),
+    Column("name", String(100), primary_key=True),
+    Column("last_started_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def advisory_lock_key(name: str) -> int:
+    """
+    任务名对应的 advisory lock 键（有符号 64 位整数），不同进程算出的值相同
+    """
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+@dataclass
+class Job:
+    """一个定时任务及其运行统计"""
+    name: str
+    interval: float
+    func: Callable[[AsyncSession], Awaitable[int]]
+    runs: int = 0
+    skipped: int = 0
+    failures: int = 0
+    rows_total: int = 0
+    last_rows: int = 0
+    last_duration_seconds: float = 0.0
+    last_run_timestamp: float = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        """运行、跳过（其他进程正在运行或本轮已经运行过）和失败次数，影响的行数以及最近一次的耗时"""
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "rows_total": self.rows_total,
+            "last_rows": self.last_rows,
+            "last_duration_seconds": round(self.last_duration_seconds, 6),
+            "last_run_timestamp": self.last_run_timestamp,
+        }
+
+
+class Scheduler:
+    """按固定间隔运行任务的调度器"""
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.jobs: dict[str, Job] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def add(self, name: str, interval: float, func: Callable[[AsyncSession], Awaitable[int]]) -> Job:
+        """
+        注册任务，在 start 之前调用
+        """
+        if name in self.jobs:
+            raise ValueError(f"任务 {name} 已经注册")
+        job = Job(name, interval, func)
+        self.jobs[name] = job
+        return job
+
+    async def _claim(self, db: AsyncSession, job: Job, force: bool) -> bool:
+        """
+        认领任务的这一轮：距上次开始运行已经超过 interval 秒（或 force）时记录开始时间并返回 True
+
+        第一次运行时插入记录；之后的认领是一条带条件的 UPDATE，多个进程同时认领时只有一个更新成功。
+        """
+        now = datetime.now(timezone.utc)
+        inserted = await db.execute(
+            upsert_insert(db, job_run_table)
+            .values(name=job.name, last_started_at=now)
+            .on_conflict_do_nothing()
+        )
+        if inserted.rowcount == 1:
+            return True
+        query = update(job_run_table).where(job_run_table.c.name == job.name)
+        if not force:
+            query = query.where(job_run_table.c.last_started_at <= now - timedelta(seconds=job.interval))
+        result = await db.execute(query.values(last_started_at=now))
+        return result.rowcount == 1
+
+    async def _run(self, job: Job, force: bool) -> int | None:
+        """
+        认领这一轮并运行任务，其他进程正在运行或本轮已经运行过时返回 None
+
+        任务在一个单独的连接上运行：PostgreSQL 的 advisory lock 是会话级的，也取在这个连接上，
+        任务自己的事务提交或回滚都不会释放它，进程异常退出、连接断开时由 PostgreSQL 自动释放。
+        """
+        key = advisory_lock_key(job.name)
+        async with self.engine.connect() as conn:
+            async with AsyncSession(bind=conn, expire_on_commit=False) as db:
+                locked = is_postgresql(db)
+                if locked and not await db.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}):
+                    return None
+                try:
+                    claimed = await self._claim(db, job, force)
+                    await db.commit()
+                    if not claimed:
+                        return None
+                    return await job.func(db)
+                finally:
+                    if locked:
+                        await db.rollback()
+                        await db.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                        await db.commit()
+
+    async def run_job(self, name: str, force: bool = False) -> int | None:
+        """
+        运行一次任务并记录统计，返回影响的行数；其他进程正在运行、或者距上次运行不到 interval 秒时返回 None
+
+        force 为 True 时不检查间隔（仍然不会与其他进程同时运行），用于手动触发。
+        """
+        job = self.jobs[name]
+        started = time.perf_counter()
+        try:
+            rows = await self._run(job, force)
+        except Exception:
+            job.failures += 1
+            logger.exception("定时任务 %s 失败", job.name)
+            raise
+        if rows is None:
+            job.skipped += 1
+            return None
+        job.runs += 1
+        job.last_rows = rows
+        job.rows_total += rows
+        job.last_duration_seconds = time.perf_counter() - started
+        job.last_run_timestamp = time.time()
+        logger.info("定时任务 %s 完成，影响 %s 行，耗时 %.3f 秒", job.name, rows, job.last_duration_seconds)
+        return rows
+
+    async def _loop(self, job: Job) -> None:
+        """
+        后台任务：启动后先运行一次，之后每隔 interval 秒运行一次，失败只记录日志
+        """
+        while True:
+            try:
+                await self.run_job(job.name)
+            except Exception:
+                pass  # run_job 已经记录了日志和失败次数，下一轮继续
+            await asyncio.sleep(job.interval)
+
+    def start(self) -> None:
+        """
+        为每个任务启动后台循环（在事件循环中调用，通常在应用的 lifespan 中）
+        """
+        self._tasks = [
+            asyncio.create_task(self._loop(job), name=f"job-{job.name}")
+            for job in self.jobs.values()
+        ]
+
+    async def stop(self) -> None:
+        """
+        取消所有任务；正在执行的批次随之回滚，已经提交的批次不受影响
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """每个任务的运行统计"""
+        return {name: job.stats() for name, job in self.jobs.items()}
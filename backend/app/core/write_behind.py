@@ -0,0 +1,124 @@
+"""
+写后队列
+
+请求只把要写入的行放进进程内的队列就返回，后台任务在积累到 batch_size 行
+或者距上次写入超过 flush_interval 秒时，用一条多行 INSERT 批量写入。
+队列只在内存中：进程被强制杀死时尚未写入的行会丢失，正常关闭时会先全部写完。
+"""
+import asyncio
+import logging
+from typing import Any
+
+from sqlalchemy import Table, insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """把行批量写入一张表的后台写入器"""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        table: Table,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int) -> None:
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: list[dict[str, Any]] = []
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+
+    @property
+    def pending(self) -> int:
+        """等待写入的行数"""
+        return len(self._pending)
+
+    def record(self, rows: list[dict[str, Any]]) -> None:
+        """
+        把行放入队列，不等待写入；队列已满时丢弃放不下的行并计数
+        """
+        free = self.max_pending - len(self._pending)
+        if len(rows) > free:
+            self.dropped += len(rows) - max(free, 0)
+            logger.warning("%s 写后队列已满，丢弃 %s 行", self.table.name, len(rows) - max(free, 0))
+            rows = rows[:max(free, 0)]
+        self._pending.extend(rows)
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """
+        写入队列中的全部行，返回写入的行数
+
+        每次从队列头部取出一批再写入，取出和写入之间没有其他协程能拿到同一批行。
+        写入失败时把这一批放回队列头部，留到下次重试。
+        """
+        written = 0
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(insert(self.table).values(batch))
+            except Exception:
+                logger.exception("写入 %s 失败，%s 行留在队列中等待重试", self.table.name, len(batch))
+                self.failures += 1
+                self._pending[:0] = batch
+                break
+            self.flushes += 1
+            self.written += len(batch)
+            written += len(batch)
+        return written
+
+    async def _run(self) -> None:
+        """
+        后台任务：攒够一批或等到间隔后写入，关闭时退出
+        """
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """
+        启动后台写入任务（在事件循环中调用，通常在应用的 lifespan 中）
+        """
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=f"{self.table.name}-writer")
+
+    async def stop(self) -> None:
+        """
+        停止后台任务，并写入队列中剩余的行
+        """
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    def stats(self) -> dict[str, int]:
+        """队列长度以及写入、丢弃、失败的计数"""
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
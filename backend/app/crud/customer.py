@@ -1,78 +1,654 @@
-from typing import List, Optional
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, List, Optional, Sequence
+from sqlalchemy import RowMapping, String, and_, case, delete, func, insert, literal, literal_column, or_, tuple_, union_all, update
+from sqlalchemy.exc import DBAPIError
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.models.customer import Customer
-from app.schemas.customer import CustomerCreate, CustomerUpdate
+from app.core.cache import count_cache, customer_cache
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.events import change_event, event_broker
+from app.core.loader import BatchLoader
+from app.core.metrics import CallbackGauge, registry
+from app.crud.dialects import any_of, is_postgresql, upsert_insert
+from app.crud.history import record_changes
+from app.crud.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from app.crud.stats import apply_stats_delta, apply_stats_delta_where
+from app.models.customer import Customer, CustomerArchive, CustomerStats
+from app.schemas.customer import CustomerCreate, CustomerFilter, CustomerUpdate
+
+# 允许排序的字段，字段名前加 "-" 表示降序；id 总是作为最后的决胜键，保证顺序稳定
+SORTABLE_FIELDS = ("id", "last_modified_date", "creation_date", "expected_order_date", "expected_order_amount")
+# 可以用于游标分页的排序字段：不能为 NULL，否则 (排序字段, id) 的范围比较会漏掉记录
+KEYSET_SORTABLE_FIELDS = ("id", "last_modified_date", "creation_date")
+DEFAULT_SORT = "id"
+
+# 导出时每次从服务端游标读取的行数
+EXPORT_CHUNK_SIZE = 1000
+
+# 批量写入时每条 INSERT 语句包含的行数（asyncpg 单条语句最多 32767 个参数）
+BULK_CHUNK_SIZE = 1000
+
+# 列表查询直接选择的列，结果是普通的行而不是 ORM 对象
+CUSTOMER_COLUMNS = tuple(Customer.__table__.columns)
+# 可以通过 fields 参数选择的字段
+CUSTOMER_FIELDS = tuple(column.key for column in CUSTOMER_COLUMNS)
+# 只选择部分字段时也总是返回的字段：ETag 和前端合并变更事件需要
+REQUIRED_FIELDS = ("id", "customer_id", "last_modified_date")
+# 归档表中与客户表相同的列，按客户表的顺序排列
+ARCHIVE_COLUMNS = tuple(CustomerArchive.__table__.c[key] for key in CUSTOMER_FIELDS)
+
+class PreconditionFailedError(Exception):
+    """客户存在，但版本与 If-Match 指定的不一致（已被其他请求修改）"""
+
+
+def customer_cache_key(customer_id: str) -> str:
+    """
+    单个客户的缓存键
+    """
+    return f"customer:{customer_id}"
+
+async def invalidate_customers(customer_ids: Iterable[str] | None = None) -> None:
+    """
+    写操作提交后使这些客户（None 表示全部）的缓存失效，并让正在进行的合并查询不再接受新的读取
+    """
+    if customer_ids is None:
+        customer_loader.forget()
+        await customer_cache.clear()
+        return
+    customer_ids = list(customer_ids)
+    customer_loader.forget(customer_ids)
+    await customer_cache.delete(*(customer_cache_key(customer_id) for customer_id in customer_ids))
 
 async def create_customer(
     db: AsyncSession,
     customer_create: CustomerCreate) -> Customer:
     """
     创建客户
+
+    请求体已经由 CustomerCreate 校验过，直接用 `INSERT ... RETURNING` 写入并取回完整的行，
+    不再构造一次模型重新校验，也不需要提交后再 refresh。
     """
-    db_customer = Customer.from_orm(customer_create)
-    db.add(db_customer)
+    now = datetime.now(timezone.utc)
+    query = (
+        insert(Customer)
+        .values(**customer_create.model_dump(), creation_date=now, last_modified_date=now)
+        .returning(Customer)
+    )
+    result = await db.execute(query)
+    db_customer = result.scalar_one()
+    await apply_stats_delta(db, [
+        (db_customer.shop, db_customer.customer_status, 1, db_customer.expected_order_amount)
+    ])
     await db.commit()
-    await db.refresh(db_customer)
+    await invalidate_customers([db_customer.customer_id])
+    count_cache.invalidate()
+    await event_broker.publish(change_event("created", db_customer.model_dump()))
     return db_customer
 
+async def upsert_chunk(
+    db: AsyncSession,
+    customers: List[CustomerCreate]) -> dict[str, tuple[Customer, bool]]:
+    """
+    用一条 `INSERT ... ON CONFLICT (customer_id) DO UPDATE ... RETURNING` 写入一批客户并维护汇总，不提交
+
+    customers 中的 customer_id 必须互不相同。返回 {customer_id: (客户, 是否新建)}。
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {**customer.model_dump(), "creation_date": now, "last_modified_date": now}
+        for customer in customers
+    ]
+    stmt = upsert_insert(db, Customer).values(rows)
+    updates = {
+        name: stmt.excluded[name]
+        for name in CustomerCreate.model_fields
+        if name != "customer_id"
+    }
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Customer.customer_id],
+        set_={**updates, "last_modified_date": now},
+    )
+
+    chunk_ids = Customer.customer_id.in_([customer.customer_id for customer in customers])
+    # 汇总先移出将被覆盖的旧值，写入后再计入新值
+    await apply_stats_delta_where(db, chunk_ids, -1)
+    if is_postgresql(db):
+        # 新插入的行 xmax 为 0，不需要额外查询就能区分新建和更新
+        result = await db.execute(
+            stmt.returning(Customer, literal_column("xmax = 0").label("inserted")),
+            execution_options={"populate_existing": True}
+        )
+        returned = {customer.customer_id: (customer, inserted) for customer, inserted in result.all()}
+    else:
+        existing = set((await db.execute(select(Customer.customer_id).where(chunk_ids))).scalars().all())
+        result = await db.execute(stmt.returning(Customer), execution_options={"populate_existing": True})
+        returned = {
+            customer.customer_id: (customer, customer.customer_id not in existing)
+            for customer in result.scalars().all()
+        }
+    await apply_stats_delta_where(db, chunk_ids, 1)
+    return returned
+
+async def _upsert_isolating_failures(
+    db: AsyncSession,
+    customers: List[CustomerCreate],
+    chunk: list[int],
+    written: list[tuple[int, Customer, bool]],
+    errors: list[tuple[int, str]]) -> None:
+    """
+    在保存点中写入 chunk 指定的记录；失败时把分块对半拆开分别重试，直到找出出错的单条记录
+
+    一条坏记录不会连累同一分块中的其他记录，每条失败的记录带着它自己的错误信息；
+    k 条坏记录只多执行大约 k * log2(分块大小) 条语句，全部成功时仍然只有一条。
+    """
+    try:
+        async with db.begin_nested():
+            returned = await upsert_chunk(db, [customers[index] for index in chunk])
+    except DBAPIError as e:
+        if len(chunk) == 1:
+            errors.append((chunk[0], str(e.orig) if e.orig is not None else str(e)))
+            return
+        middle = len(chunk) // 2
+        await _upsert_isolating_failures(db, customers, chunk[:middle], written, errors)
+        await _upsert_isolating_failures(db, customers, chunk[middle:], written, errors)
+        return
+
+    for index in chunk:
+        customer, inserted = returned[customers[index].customer_id]
+        written.append((index, customer, inserted))
+
+async def bulk_upsert_customers(
+    db: AsyncSession,
+    customers: List[CustomerCreate]) -> tuple[list[tuple[int, Customer, bool]], list[tuple[int, str]]]:
+    """
+    批量创建或更新客户（按 customer_id 冲突时更新）
+
+    每 BULK_CHUNK_SIZE 行一条 `INSERT ... ON CONFLICT (customer_id) DO UPDATE ... RETURNING`，
+    每个分块在独立的保存点中执行；分块失败时拆开重试，只有真正出错的记录失败。
+    返回 ([(下标, 客户, 是否新建)], [(下标, 错误信息)])，下标是记录在 customers 中的位置。
+    """
+    errors: list[tuple[int, str]] = []
+
+    # 同一批次中重复的 customer_id 以最后一条为准，否则同一行会在一条语句中被更新两次
+    latest: dict[str, int] = {}
+    for index, customer in enumerate(customers):
+        if customer.customer_id in latest:
+            errors.append((latest[customer.customer_id], "同一批次中 customer_id 重复，已被后面的记录覆盖"))
+        latest[customer.customer_id] = index
+    indexes = sorted(latest.values())
+
+    written: list[tuple[int, Customer, bool]] = []
+    for start in range(0, len(indexes), BULK_CHUNK_SIZE):
+        chunk = indexes[start:start + BULK_CHUNK_SIZE]
+        await _upsert_isolating_failures(db, customers, chunk, written, errors)
+
+    await db.commit()
+    await invalidate_customers(customer.customer_id for _, customer, _ in written)
+    count_cache.invalidate()
+    if written:
+        # 一次写入可能有上万条，只发一条事件让订阅者重新加载
+        await event_broker.publish(change_event("bulk", {"count": len(written)}))
+    return written, sorted(errors)
+
+async def _load_customers(customer_ids: list[str]) -> dict[str, Customer]:
+    """
+    合并后的批量查询：在独立的会话中一次查出多个客户并写入缓存
+
+    查询前记下缓存的失效代数，查询期间有写操作提交时不写缓存，避免把旧值写回去。
+    """
+    generation = customer_cache.generation()
+    async with async_session() as session:
+        query = select(Customer).where(any_of(session, Customer.customer_id, customer_ids))
+        result = await session.execute(query)
+        customers = {customer.customer_id: customer for customer in result.scalars().all()}
+    for customer_id, customer in customers.items():
+        await customer_cache.set_if_unchanged(customer_cache_key(customer_id), customer.model_dump(), generation)
+    return customers
+
+# 合并并发的单个客户查询：同一个 customer_id 只查一次，窗口内的不同 customer_id 合并为一条查询
+customer_loader: BatchLoader[str, Customer] = BatchLoader(
+    _load_customers,
+    window=settings.CUSTOMER_LOADER_WINDOW,
+    max_batch=settings.CUSTOMER_LOADER_MAX_BATCH,
+)
+
+registry.register(CallbackGauge(
+    "customer_loader_events",
+    "单个客户查询的读取次数、合并到已有查询的次数和实际执行的批量查询次数",
+    lambda: {(kind,): value for kind, value in customer_loader.stats().items()},
+    ("kind",)
+))
+
+async def _get_archived_customers(db: AsyncSession, customer_ids: List[str]) -> dict[str, dict]:
+    """
+    在归档表中查找客户，返回 {customer_id: 客户字段}；同一个 customer_id 归档过多次时取最近归档的
+    """
+    query = (
+        select(*ARCHIVE_COLUMNS)
+        .where(any_of(db, CustomerArchive.customer_id, customer_ids))
+        .order_by(CustomerArchive.archived_at)
+    )
+    result = await db.execute(query)
+    return {row["customer_id"]: dict(row) for row in result.mappings()}
+
 async def get_customer(
     db: AsyncSession,
     customer_id: str) -> Optional[Customer]:
     """
-    获取客户
+    获取客户，优先读缓存；未命中时经 customer_loader 与其他并发请求合并查询，结果写入缓存
+
+    关闭合并（CUSTOMER_LOADER_ENABLED=false）时在 db 中直接查询。
+    客户表中没有时再查归档表；归档的客户只读，不写入缓存。
     """
-    query = select(Customer).where(Customer.customer_id == customer_id)
+    cached = await customer_cache.get(customer_cache_key(customer_id))
+    if cached is not None:
+        return Customer.model_validate(cached)
+
+    if settings.CUSTOMER_LOADER_ENABLED:
+        db_customer = await customer_loader.load(customer_id)
+    else:
+        generation = customer_cache.generation()
+        query = select(Customer).where(Customer.customer_id == customer_id)
+        result = await db.execute(query)
+        db_customer = result.scalar_one_or_none()
+        if db_customer is not None:
+            await customer_cache.set_if_unchanged(customer_cache_key(customer_id), db_customer.model_dump(), generation)
+    if db_customer is not None:
+        return db_customer
+
+    archived = await _get_archived_customers(db, [customer_id])
+    return Customer.model_validate(archived[customer_id]) if archived else None
+
+async def get_customers_by_ids(
+    db: AsyncSession,
+    customer_ids: List[str]) -> List[dict]:
+    """
+    用一条 `WHERE customer_id = ANY(:ids)` 查询获取多个客户，返回找到的客户（普通字典，顺序不定）
+
+    客户表中找不到的 customer_id 再用一条查询在归档表中查找。
+    """
+    query = select(*CUSTOMER_COLUMNS).where(any_of(db, Customer.customer_id, customer_ids))
     result = await db.execute(query)
-    return result.scalar_one_or_none()
+    customers = [dict(row) for row in result.mappings()]
+    found = {customer["customer_id"] for customer in customers}
+    missing = [customer_id for customer_id in customer_ids if customer_id not in found]
+    if missing:
+        customers.extend((await _get_archived_customers(db, missing)).values())
+    return customers
+
+def _customer_source(include_archived: bool = False):
+    """
+    列表、计数和导出查询的数据来源：客户表，或者客户表与归档表的 `UNION ALL`
+
+    两边都有 (排序字段, id) 索引，PostgreSQL 可以把筛选条件下推到两个分支，再按排序键归并。
+    """
+    if not include_archived:
+        return Customer.__table__
+    return union_all(select(*CUSTOMER_COLUMNS), select(*ARCHIVE_COLUMNS)).subquery("customers")
+
+def _sort_columns(sort: str, source=Customer.__table__) -> tuple[list, bool]:
+    """
+    解析排序参数，返回 source 中的排序键列和是否降序
+    """
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in SORTABLE_FIELDS:
+        raise ValueError(f"不支持的排序字段: {name}")
+    columns = [source.c[name]]
+    if name != "id":
+        columns.append(source.c.id)
+    return columns, descending
+
+def _apply_filters(query, filters: CustomerFilter | None, source=Customer.__table__):
+    """
+    把筛选条件加到查询上，条件作用在 source 的列上
+    """
+    if filters is None:
+        return query
+    columns = source.c
+    for name in ("shop", "customer_status", "customer_type", "source"):
+        value = getattr(filters, name)
+        if value is not None:
+            query = query.where(columns[name] == value)
+    if filters.expected_order_date_from is not None:
+        query = query.where(columns.expected_order_date >= filters.expected_order_date_from)
+    if filters.expected_order_date_to is not None:
+        query = query.where(columns.expected_order_date <= filters.expected_order_date_to)
+    if filters.expected_order_amount_min is not None:
+        query = query.where(columns.expected_order_amount >= filters.expected_order_amount_min)
+    if filters.expected_order_amount_max is not None:
+        query = query.where(columns.expected_order_amount <= filters.expected_order_amount_max)
+    return query
+
+def _list_columns(fields: List[str] | None, sort_columns: list, source=Customer.__table__) -> tuple:
+    """
+    列表查询选择的 source 中的列：fields 为空时是全部列，否则是 fields、必需字段和排序字段，按表中的顺序排列
+
+    子查询的列名是 SQLAlchemy 的字符串子类，orjson 不接受这样的字典键，所以按字段名重新命名
+    """
+    columns = tuple(source.c[key] for key in CUSTOMER_FIELDS)
+    if source is not Customer.__table__:
+        columns = tuple(column.label(key) for column, key in zip(columns, CUSTOMER_FIELDS))
+    if fields is None:
+        return columns
+    wanted = {*fields, *REQUIRED_FIELDS, *(column.key for column in sort_columns)}
+    return tuple(column for column in columns if column.key in wanted)
+
+def _order_by(columns: list, descending: bool) -> list:
+    """
+    生成 ORDER BY 子句
+    """
+    return [column.desc() if descending else column.asc() for column in columns]
 
 async def get_customers(
     db: AsyncSession,
     skip: int = 0,
-    limit: int = 100) -> List[Customer]:
+    limit: int = 100,
+    sort: str = DEFAULT_SORT,
+    filters: CustomerFilter | None = None,
+    fields: List[str] | None = None,
+    include_archived: bool = False) -> List[dict]:
     """
-    获取客户列表
+    获取客户列表（OFFSET 分页，保留给旧客户端）
+
+    只选择列，返回普通的字典，不构造 ORM 对象，可以直接编码为 JSON。
+    fields 不为空时只选择这些字段（以及 REQUIRED_FIELDS 和排序字段）；include_archived 时包括归档的客户。
     """
-    query = select(Customer).offset(skip).limit(limit)
+    source = _customer_source(include_archived)
+    columns, descending = _sort_columns(sort, source)
+    query = _apply_filters(select(*_list_columns(fields, columns, source)), filters, source)
+    query = query.order_by(*_order_by(columns, descending)).offset(skip).limit(limit)
     result = await db.execute(query)
-    return result.scalars().all()
+    return [dict(row) for row in result.mappings()]
 
-async def update_customer(
+async def get_customers_page(
     db: AsyncSession,
-    customer_id: str,
-    customer_update: CustomerUpdate) -> Optional[Customer]:
+    cursor: str | None = None,
+    limit: int = 100,
+    sort: str = DEFAULT_SORT,
+    filters: CustomerFilter | None = None,
+    fields: List[str] | None = None,
+    include_archived: bool = False) -> tuple[List[dict], str | None]:
+    """
+    按游标获取一页客户，返回 (客户列表, 下一页游标)，客户、fields 和 include_archived 与 get_customers 相同
+
+    cursor 为空时返回第一页；没有更多数据时下一页游标为 None。
+    游标无效或排序字段不支持游标分页时抛出 InvalidCursorError。
+    """
+    if sort.lstrip("-") not in KEYSET_SORTABLE_FIELDS:
+        raise InvalidCursorError(f"排序字段 {sort.lstrip('-')} 可能为空，不支持游标分页")
+    source = _customer_source(include_archived)
+    columns, descending = _sort_columns(sort, source)
+    query = _apply_filters(select(*_list_columns(fields, columns, source)), filters, source)
+    query = query.order_by(*_order_by(columns, descending))
+    if cursor:
+        values = decode_cursor(cursor, sort, [column.type.python_type for column in columns])
+        key = tuple_(*columns)
+        query = query.where(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    # 多取一行用来判断是否还有下一页
+    result = await db.execute(query.limit(limit + 1))
+    customers = [dict(row) for row in result.mappings()]
+    if len(customers) <= limit:
+        return customers, None
+
+    customers = customers[:limit]
+    last = customers[-1]
+    next_cursor = encode_cursor(sort, [last[column.key] for column in columns])
+    return customers, next_cursor
+
+async def _estimate_rows(db: AsyncSession, query) -> int:
+    """
+    PostgreSQL 规划器对查询结果行数的估计（EXPLAIN，不执行查询）
+
+    筛选值都来自已经校验过的参数，以字面量形式嵌入 EXPLAIN 语句。
+    """
+    compiled = query.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    # 字面量中的时间含有冒号，不能经过 text() 的参数解析
+    connection = await db.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")
+    plan = result.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+async def _count_rows(db: AsyncSession, table, filters: CustomerFilter | None) -> tuple[int, bool]:
+    """
+    统计表中符合筛选条件的行数：PostgreSQL 的估计行数超过 COUNT_EXACT_LIMIT 时返回估计值，否则精确计数
+    """
+    if is_postgresql(db):
+        estimate = await _estimate_rows(db, _apply_filters(select(table.c.id), filters, table))
+        if estimate > settings.COUNT_EXACT_LIMIT:
+            return estimate, False
+    query = _apply_filters(select(func.count()).select_from(table), filters, table)
+    return (await db.execute(query)).scalar_one(), True
+
+async def count_customers(
+    db: AsyncSession,
+    filters: CustomerFilter | None = None,
+    include_archived: bool = False) -> tuple[int, bool]:
+    """
+    符合筛选条件的客户总数，返回 (总数, 是否精确)，按代价从低到高选择：
+    - 没有筛选或只按店铺、状态筛选：汇总 customer_stats，只读店铺数 × 状态数行
+    - 其他筛选（PostgreSQL）：先看规划器的估计行数，不超过 COUNT_EXACT_LIMIT 时精确计数，
+      否则直接返回估计值，避免为了分页器扫描大量的行
+    - 其他筛选（SQLite）：精确计数
+    include_archived 时再加上归档表中符合条件的行数（归档表不在汇总中，按上面的其他筛选处理）。
+    结果按筛选条件缓存 COUNT_CACHE_TTL_SECONDS 秒，写操作后失效。
+    """
+    key = filters.model_dump_json(exclude_none=True) if filters is not None else "{}"
+    if include_archived:
+        key = f"archived:{key}"
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+    generation = count_cache.generation()
+
+    conditions = filters.model_dump(exclude_none=True) if filters is not None else {}
+    if conditions.keys() <= {"shop", "customer_status"}:
+        query = select(func.coalesce(func.sum(CustomerStats.customer_count), 0))
+        for name, value in conditions.items():
+            query = query.where(getattr(CustomerStats, name) == value)
+        total, exact = (await db.execute(query)).scalar_one(), True
+    else:
+        total, exact = await _count_rows(db, Customer.__table__, filters)
+    if include_archived:
+        archived, archived_exact = await _count_rows(db, CustomerArchive.__table__, filters)
+        total, exact = total + archived, exact and archived_exact
+
+    count_cache.set(key, total, exact, generation)
+    return total, exact
+
+def _like_pattern(keyword: str) -> str:
+    """
+    把关键字转成 `%关键字%` 形式的 LIKE 模式，转义其中的通配符
+    """
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+async def search_customers(
+    db: AsyncSession,
+    keyword: str,
+    limit: int = 20) -> List[tuple[Customer, float]]:
     """
-    更新客户
+    按 customer_id 片段或需求描述中的关键字模糊搜索，按相关度从高到低返回 (客户, 相关度)
+
+    条件都能使用 pg_trgm 的 GIN 索引：ILIKE 子串匹配、customer_id 的相似度（%）
+    以及需求描述的单词相似度（<%）。少于 3 个字符的关键字无法利用 trigram 索引。
+    SQLite 没有 pg_trgm，只做子串匹配，customer_id 命中的排在需求描述命中的前面。
     """
-    query = select(Customer).where(Customer.customer_id == customer_id)
+    pattern = _like_pattern(keyword)
+    substring = (
+        Customer.customer_id.ilike(pattern, escape="\\"),
+        Customer.demand_description.ilike(pattern, escape="\\"),
+    )
+    if is_postgresql(db):
+        score = func.greatest(
+            func.similarity(Customer.customer_id, keyword),
+            func.coalesce(func.word_similarity(keyword, Customer.demand_description), 0.0),
+        ).label("score")
+        condition = or_(
+            *substring,
+            Customer.customer_id.op("%")(keyword),
+            literal(keyword, String).op("<%")(Customer.demand_description),
+        )
+    else:
+        score = case((substring[0], 1.0), else_=0.5).label("score")
+        condition = or_(*substring)
+    query = (
+        select(Customer, score)
+        .where(condition)
+        .order_by(score.desc(), Customer.id)
+        .limit(limit)
+    )
     result = await db.execute(query)
-    db_customer = result.scalar_one_or_none()
-    
-    if not db_customer:
-        return None
-    
-    customer_data = customer_update.dict(exclude_unset=True)
-    for key, value in customer_data.items():
-        setattr(db_customer, key, value)
-    
+    return [(customer, float(score)) for customer, score in result.all()]
+
+async def stream_customers(
+    db: AsyncSession,
+    filters: CustomerFilter | None = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    include_archived: bool = False) -> AsyncIterator[Sequence[RowMapping]]:
+    """
+    通过服务端游标分块读取客户，每次产出最多 chunk_size 行，include_archived 时包括归档的客户
+
+    只选择列、不构造 ORM 对象，内存占用与表的大小无关。
+    """
+    source = _customer_source(include_archived)
+    query = _apply_filters(select(*_list_columns(None, [], source)), filters, source).order_by(source.c.id)
+
+    result = await db.stream(query.execution_options(yield_per=chunk_size))
+    async for rows in result.mappings().partitions(chunk_size):
+        yield rows
+
+async def _update_where(
+    db: AsyncSession,
+    condition,
+    customer_update: CustomerUpdate,
+    if_match: list[datetime] | None = None) -> Optional[Customer]:
+    """
+    用一条 `UPDATE ... WHERE ... RETURNING` 更新客户，找不到时返回 None
+
+    if_match 不为 None 时只在 last_modified_date 等于其中之一时更新（乐观锁），
+    客户存在但版本不一致时抛出 PreconditionFailedError。
+
+    PostgreSQL 通过锁定的子查询同时取回更新前的值，用于维护汇总和变更记录，不需要额外的查询；
+    SQLite 的 RETURNING 只能返回新值，改为更新前后各按条件调整一次汇总，并在更新前读取旧值。
+    提交后把有变化的字段放入写后队列，不等待变更记录写入。
+    """
+    found = condition
+    if if_match is not None:
+        condition = and_(condition, Customer.last_modified_date.in_(if_match))
+
+    customer_data = customer_update.model_dump(exclude_unset=True)
+    if not customer_data:
+        result = await db.execute(select(Customer).where(condition))
+        db_customer = result.scalar_one_or_none()
+        if db_customer is None and if_match is not None:
+            await _check_exists(db, found)
+        return db_customer
+
+    now = datetime.now(timezone.utc)
+    values = {**customer_data, "last_modified_date": now}
+    if is_postgresql(db):
+        tracked = sorted({*customer_data, "shop", "customer_status", "expected_order_amount"})
+        old = (
+            select(Customer.id, *(getattr(Customer, name) for name in tracked))
+            .where(condition)
+            .with_for_update()
+            .subquery("old")
+        )
+        query = (
+            update(Customer)
+            .where(Customer.id == old.c.id)
+            .values(**values)
+            .returning(Customer, *(old.c[name] for name in tracked))
+        )
+        result = await db.execute(query, execution_options={"populate_existing": True})
+        row = result.one_or_none()
+        db_customer = None
+        if row is not None:
+            db_customer, *old_values = row
+            previous = dict(zip(tracked, old_values))
+            await apply_stats_delta(db, [
+                (previous["shop"], previous["customer_status"], -1, -(previous["expected_order_amount"] or 0.0)),
+                (db_customer.shop, db_customer.customer_status, 1, db_customer.expected_order_amount),
+            ])
+    else:
+        # 第一条语句就是写操作，事务一开始就取得写锁，避免先读后写的并发事务升级锁时冲突
+        await apply_stats_delta_where(db, condition, -1)
+        result = await db.execute(select(*(getattr(Customer, name) for name in customer_data)).where(condition))
+        previous = result.mappings().one_or_none()
+        query = update(Customer).where(condition).values(**values).returning(Customer)
+        result = await db.execute(query, execution_options={"populate_existing": True})
+        db_customer = result.scalar_one_or_none()
+        if db_customer is not None:
+            await apply_stats_delta_where(db, Customer.id == db_customer.id, 1)
+
     await db.commit()
-    await db.refresh(db_customer)
+    if db_customer is None and if_match is not None:
+        await _check_exists(db, found)
+    if db_customer is not None:
+        await invalidate_customers([db_customer.customer_id])
+        count_cache.invalidate()
+        record_changes(
+            db_customer.customer_id,
+            previous,
+            {name: getattr(db_customer, name) for name in customer_data},
+            now
+        )
+        await event_broker.publish(change_event("updated", db_customer.model_dump()))
     return db_customer
 
+async def _check_exists(db: AsyncSession, condition) -> None:
+    """
+    条件更新没有更新到记录时区分两种情况：客户存在说明版本不一致，抛出 PreconditionFailedError
+    """
+    result = await db.execute(select(Customer.id).where(condition))
+    if result.first() is not None:
+        raise PreconditionFailedError("客户已被修改，请重新获取后再更新")
+
+async def update_customer(
+    db: AsyncSession,
+    customer_id: str,
+    customer_update: CustomerUpdate,
+    if_match: list[datetime] | None = None) -> Optional[Customer]:
+    """
+    更新客户，if_match 为可以接受的 last_modified_date 列表（If-Match 请求头）
+    """
+    return await _update_where(db, Customer.customer_id == customer_id, customer_update, if_match)
+
+async def update_customer_by_pk(
+    db: AsyncSession,
+    id: int,
+    customer_update: CustomerUpdate,
+    if_match: list[datetime] | None = None) -> Optional[Customer]:
+    """
+    通过数据库主键更新客户，if_match 与 update_customer 相同
+    """
+    return await _update_where(db, Customer.id == id, customer_update, if_match)
+
 async def delete_customer(
     db: AsyncSession,
     customer_id: str) -> bool:
     """
-    删除客户
+    删除客户，用一条 `DELETE ... RETURNING` 完成，返回是否删除了记录
     """
-    query = select(Customer).where(Customer.customer_id == customer_id)
+    query = (
+        delete(Customer)
+        .where(Customer.customer_id == customer_id)
+        .returning(Customer.shop, Customer.customer_status, Customer.expected_order_amount)
+    )
     result = await db.execute(query)
-    db_customer = result.scalar_one_or_none()
-    
-    if not db_customer:
-        return False
-    
-    await db.delete(db_customer)
+    row = result.one_or_none()
+    if row is not None:
+        await apply_stats_delta(db, [(row.shop, row.customer_status, -1, -(row.expected_order_amount or 0.0))])
     await db.commit()
-    return True
+    await invalidate_customers([customer_id])
+    count_cache.invalidate()
+    if row is not None:
+        await event_broker.publish(change_event("deleted", {"customer_id": customer_id}))
+    return row is not None
@@ -0,0 +1,237 @@
+"""
+客户 CSV 导入
+
+CSV 流按块解析，每块按 CustomerCreate 的规则校验，合法的行通过 asyncpg
+`copy_records_to_table` 写入临时表，全部写完后用一条 `INSERT ... SELECT ... ON CONFLICT`
+合并进 customer_management。CSV 中重复的 customer_id 以最后一行为准。
+
+SQLite 没有 COPY，每块合法的行直接按批量写入的方式合并；同一 customer_id 出现在不同的块中时
+会被计为一次新建和若干次更新。
+"""
+import codecs
+import csv
+import time
+from enum import Enum
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import column, select, table, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import count_cache
+from app.core.events import change_event, event_broker
+from app.crud.customer import BULK_CHUNK_SIZE, invalidate_customers, upsert_chunk
+from app.crud.dialects import is_postgresql
+from app.crud.stats import apply_stats_delta_where
+from app.models.customer import Customer
+from app.schemas.customer import CustomerCreate, CustomerImportError, CustomerImportResult
+
+# 每次校验并 COPY 的行数
+IMPORT_CHUNK_SIZE = 5000
+# 结果中最多返回的错误行数，其余只计数
+MAX_REPORTED_ERRORS = 100
+
+STAGING_TABLE = "customer_import_staging"
+IMPORT_COLUMNS = tuple(CustomerCreate.model_fields)
+
+async def iter_lines(chunks: AsyncIterator[bytes], encoding: str = "utf-8-sig") -> AsyncIterator[str]:
+    """
+    把字节流按换行符切分为文本行（保留行尾），跨块的多字节字符和行都能正确拼接
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def _parse_block(lines: list[str], first_line: int) -> list[tuple[int, list[str]]]:
+    """
+    用 csv 模块解析一块物理行，返回 [(记录开始的物理行号, 字段)]
+
+    csv.reader 的 line_num 是已经读取的物理行数，读下一条记录之前的值就是这条记录开始的位置。
+    """
+    reader = csv.reader(lines)
+    records: list[tuple[int, list[str]]] = []
+    while True:
+        line = first_line + reader.line_num
+        try:
+            values = next(reader)
+        except StopIteration:
+            return records
+        records.append((line, values))
+
+async def iter_record_chunks(
+    lines: AsyncIterator[str],
+    chunk_size: int) -> AsyncIterator[list[tuple[int, list[str]]]]:
+    """
+    把文本行解析为 CSV 记录，每次产出最多 chunk_size 条 (记录开始的物理行号, 字段)，行号从 1 开始
+
+    引号内可以包含换行，所以先按引号是否成对确定记录的边界，保证一块不会把一条记录拆开，
+    再把这一块的物理行整块交给 csv 模块解析；行号按文件中的物理行计算，不受引号内换行的影响。
+    """
+    block: list[str] = []
+    first_line = 1
+    records = 0
+    quotes = 0
+    async for line in lines:
+        block.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        quotes = 0
+        records += 1
+        if records >= chunk_size:
+            yield _parse_block(block, first_line)
+            first_line += len(block)
+            block, records = [], 0
+    if block:
+        yield _parse_block(block, first_line)
+
+def _validate_chunk(
+    header: list[str],
+    records: list[tuple[int, list[str]]]) -> tuple[list[tuple[int, CustomerCreate]], list[CustomerImportError]]:
+    """
+    校验一块 (行号, 字段) 记录，返回 ([(行号, 客户)], 被拒绝的行)
+    """
+    valid: list[tuple[int, CustomerCreate]] = []
+    rejected: list[CustomerImportError] = []
+    for line, values in records:
+        if not any(values):
+            continue
+        if len(values) != len(header):
+            rejected.append(CustomerImportError(line=line, errors=[f"列数应为 {len(header)}，实际为 {len(values)}"]))
+            continue
+        # 空单元格视为未填写，交给模型的默认值处理
+        data = {name: value for name, value in zip(header, values) if value != ""}
+        try:
+            customer = CustomerCreate.model_validate(data)
+        except ValidationError as e:
+            rejected.append(CustomerImportError(
+                line=line,
+                errors=[f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+            ))
+            continue
+        valid.append((line, customer))
+    return valid, rejected
+
+def _copy_record(line: int, customer: CustomerCreate) -> tuple:
+    """
+    转换为 COPY 到临时表的元组：行号和各列的值
+    """
+    row = customer.model_dump()
+    return (line, *(
+        row[name].value if isinstance(row[name], Enum) else row[name]
+        for name in IMPORT_COLUMNS
+    ))
+
+async def _upsert_valid(db: AsyncSession, valid: list[tuple[int, CustomerCreate]]) -> tuple[int, int]:
+    """
+    不支持 COPY 时直接合并一块合法的行，返回 (新建数, 更新数)
+    """
+    # 同一 customer_id 以最后一行为准
+    latest = list({customer.customer_id: customer for _, customer in valid}.values())
+    created = updated = 0
+    for start in range(0, len(latest), BULK_CHUNK_SIZE):
+        returned = await upsert_chunk(db, latest[start:start + BULK_CHUNK_SIZE])
+        inserted = sum(1 for _, is_new in returned.values() if is_new)
+        created += inserted
+        updated += len(returned) - inserted
+    return created, updated
+
+async def import_customers_csv(
+    db: AsyncSession,
+    lines: AsyncIterator[str],
+    chunk_size: int = IMPORT_CHUNK_SIZE) -> CustomerImportResult:
+    """
+    从 CSV 文本行导入客户，customer_id 已存在时更新
+
+    第一行必须是表头，列名与创建客户的字段相同，可以只包含部分可选列。
+    表头缺少必填列时抛出 ValueError。
+    """
+    started = time.perf_counter()
+    rows = 0
+    rejected = 0
+    errors: list[CustomerImportError] = []
+    header: list[str] | None = None
+    created = updated = 0
+
+    use_copy = is_postgresql(db)
+    column_list = ", ".join(IMPORT_COLUMNS)
+    if use_copy:
+        conn = await db.connection()
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        await db.execute(text(
+            f"CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {Customer.__tablename__} WITH NO DATA"
+        ))
+        await db.execute(text(f"ALTER TABLE {STAGING_TABLE} ADD COLUMN line_no integer"))
+
+    async for records in iter_record_chunks(lines, chunk_size):
+        if header is None:
+            header = [name.strip() for name in records[0][1]]
+            missing = [
+                name for name, field in CustomerCreate.model_fields.items()
+                if field.is_required() and name not in header
+            ]
+            if missing:
+                raise ValueError(f"CSV 表头缺少必填列: {', '.join(missing)}")
+            records = records[1:]
+
+        valid, chunk_rejected = _validate_chunk(header, records)
+        rows += len(valid) + len(chunk_rejected)
+        rejected += len(chunk_rejected)
+        errors.extend(chunk_rejected[:MAX_REPORTED_ERRORS - len(errors)])
+
+        if not valid:
+            continue
+        if use_copy:
+            await driver_connection.copy_records_to_table(
+                STAGING_TABLE,
+                records=[_copy_record(line, customer) for line, customer in valid],
+                columns=["line_no", *IMPORT_COLUMNS],
+            )
+        else:
+            chunk_created, chunk_updated = await _upsert_valid(db, valid)
+            created += chunk_created
+            updated += chunk_updated
+
+    if use_copy:
+        # 汇总先移出将被覆盖的旧值，合并后再计入新值
+        staged = Customer.customer_id.in_(select(column("customer_id")).select_from(table(STAGING_TABLE)))
+        await apply_stats_delta_where(db, staged, -1)
+
+        # 一条语句完成合并：同一 customer_id 取最后一行，已存在则更新
+        updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in IMPORT_COLUMNS if name != "customer_id")
+        result = await db.execute(text(
+            f"WITH merged AS ("
+            f" INSERT INTO {Customer.__tablename__} ({column_list}, creation_date, last_modified_date)"
+            f" SELECT DISTINCT ON (customer_id) {column_list}, now(), now() FROM {STAGING_TABLE}"
+            f" ORDER BY customer_id, line_no DESC"
+            f" ON CONFLICT (customer_id) DO UPDATE SET {updates}, last_modified_date = EXCLUDED.last_modified_date"
+            f" RETURNING xmax = 0 AS inserted"
+            f") SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged"
+        ))
+        created, updated = result.one()
+        await apply_stats_delta_where(db, staged, 1)
+    await db.commit()
+    # 导入可能涉及任意客户，直接清空单个客户的缓存
+    await invalidate_customers()
+    count_cache.invalidate()
+    if created or updated:
+        await event_broker.publish(change_event("bulk", {"count": created + updated}))
+
+    elapsed = time.perf_counter() - started
+    return CustomerImportResult(
+        rows=rows,
+        created=created,
+        updated=updated,
+        rejected=rejected,
+        errors=errors,
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(rows / elapsed, 1) if elapsed > 0 else 0.0
+    )
@@ -0,0 +1,34 @@
+"""
+数据库方言差异
+
+生产环境使用 PostgreSQL；SQLite 用于测试和本地压测。只有 PostgreSQL 支持的特性
+（trigram 搜索、COPY、UPDATE ... FROM 取旧值、xmax 等）由调用方先用这里的函数判断，再退化为通用写法。
+"""
+from sqlalchemy import any_, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+def is_postgresql(db: AsyncSession) -> bool:
+    """
+    会话连接的是否是 PostgreSQL
+    """
+    return db.bind.dialect.name == "postgresql"
+
+def upsert_insert(db: AsyncSession, table):
+    """
+    支持 `ON CONFLICT DO UPDATE` 的 INSERT，两种数据库的写法相同
+    """
+    if is_postgresql(db):
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def any_of(db: AsyncSession, column, values: list):
+    """
+    column 等于 values 中任意一个的条件
+
+    PostgreSQL 使用 `column = ANY(:values)`，无论多少个值都是同一条语句，可以复用预编译语句；
+    其他数据库使用 IN。
+    """
+    if is_postgresql(db):
+        return column == any_(literal(values, postgresql.ARRAY(column.type)))
+    return column.in_(values)
@@ -0,0 +1,93 @@
+"""
+客户变更记录（customer_history）
+
+更新客户时比较更新前后的值，把有变化的字段交给写后队列，由后台任务批量写入，
+更新请求不需要等待变更记录落库。
+"""
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, List
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.metrics import CallbackGauge, registry
+from app.core.write_behind import BatchWriter
+from app.models.customer import CustomerHistory
+
+# 变更记录的写后队列，在应用的 lifespan 中启动和停止
+history_writer = BatchWriter(
+    engine,
+    CustomerHistory.__table__,
+    batch_size=settings.HISTORY_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+    max_pending=settings.HISTORY_MAX_PENDING,
+)
+
+registry.register(CallbackGauge(
+    "customer_history_writer",
+    "客户变更记录写后队列的长度以及写入、丢弃的行数和写入批次、失败次数",
+    lambda: {(kind,): value for kind, value in history_writer.stats().items()},
+    ("kind",)
+))
+
+def _history_value(value: Any) -> Any:
+    """
+    把字段值转换为可以存入 JSON 列的基础类型
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        # 带时区的时间统一转成 UTC，同一时刻不会因为时区不同被当成变化
+        return (value.astimezone(timezone.utc) if value.tzinfo else value).isoformat()
+    return value
+
+def record_changes(
+    customer_id: str,
+    old_values: dict[str, Any],
+    new_values: dict[str, Any],
+    changed_at: datetime) -> int:
+    """
+    把值发生变化的字段放入写后队列，返回变化的字段数
+    """
+    rows = []
+    for field, new_value in new_values.items():
+        old_value = _history_value(old_values.get(field))
+        new_value = _history_value(new_value)
+        if old_value != new_value:
+            rows.append({
+                "customer_id": customer_id,
+                "field": field,
+                "old_value": old_value,
+                "new_value": new_value,
+                "changed_at": changed_at,
+            })
+    history_writer.record(rows)
+    return len(rows)
+
+async def get_customer_history(
+    db: AsyncSession,
+    customer_id: str,
+    skip: int = 0,
+    limit: int = 100) -> List[dict]:
+    """
+    按时间顺序获取客户的变更记录
+
+    最近几秒内的变更可能还在写后队列中，尚未出现在结果里。
+    """
+    query = (
+        select(
+            CustomerHistory.field,
+            CustomerHistory.old_value,
+            CustomerHistory.new_value,
+            CustomerHistory.changed_at,
+        )
+        .where(CustomerHistory.customer_id == customer_id)
+        .order_by(CustomerHistory.changed_at, CustomerHistory.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [dict(row) for row in result.mappings()]
@@ -0,0 +1,213 @@
+"""
+客户数据的定时维护任务
+
+每条规则都按批执行集合操作（`UPDATE ... WHERE`、`INSERT ... SELECT` + `DELETE`）：
+一批最多 batch_size 行、一个事务，不逐个加载客户，也不会长时间锁住大量行。
+规则在 maintenance_scheduler 中注册，由应用的 lifespan 启动。
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, insert, literal, or_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import count_cache
+from app.core.config import settings
+from app.core.database import engine
+from app.core.events import change_event, event_broker
+from app.core.metrics import CallbackGauge, registry
+from app.core.scheduler import Scheduler
+from app.crud.customer import ARCHIVE_COLUMNS, CUSTOMER_COLUMNS, invalidate_customers
+from app.crud.dialects import any_of, is_postgresql
+from app.crud.history import record_changes
+from app.crud.stats import apply_stats_delta, apply_stats_delta_where
+from app.models.customer import Customer, CustomerArchive, CustomerStatus
+
+# 定时维护任务的调度器，在应用的 lifespan 中启动和停止
+maintenance_scheduler = Scheduler(engine)
+
+async def _mark_dead_batch(db: AsyncSession, condition, now: datetime, batch_size: int) -> list[tuple]:
+    """
+    把最多 batch_size 个符合条件的客户标记为 DEAD 并维护汇总，不提交
+
+    返回 [(customer_id, 原状态)]。PostgreSQL 用 `SKIP LOCKED` 的子查询选出这一批，
+    正在被请求更新的行留到下一轮；SQLite 与 _update_where 一样先移出旧的汇总，事务一开始就取得写锁。
+    """
+    values = {"customer_status": CustomerStatus.DEAD, "last_modified_date": now}
+    if is_postgresql(db):
+        target = (
+            select(Customer.id, Customer.customer_status)
+            .where(condition)
+            .order_by(Customer.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .subquery("target")
+        )
+        query = (
+            update(Customer)
+            .where(Customer.id == target.c.id)
+            .values(**values)
+            .returning(Customer.customer_id, Customer.shop, Customer.expected_order_amount, target.c.customer_status)
+        )
+        rows = (await db.execute(query, execution_options={"synchronize_session": False})).all()
+        deltas = []
+        for _, shop, amount, old_status in rows:
+            deltas.append((shop, old_status, -1, -(amount or 0.0)))
+            deltas.append((shop, CustomerStatus.DEAD, 1, amount))
+        await apply_stats_delta(db, deltas)
+        return [(customer_id, old_status) for customer_id, _, _, old_status in rows]
+
+    target = Customer.id.in_(select(Customer.id).where(condition).order_by(Customer.id).limit(batch_size))
+    await apply_stats_delta_where(db, target, -1)
+    result = await db.execute(select(Customer.id, Customer.customer_id, Customer.customer_status).where(target))
+    previous = result.all()
+    ids = [row.id for row in previous]
+    if ids:
+        query = update(Customer).where(Customer.id.in_(ids)).values(**values)
+        await db.execute(query, execution_options={"synchronize_session": False})
+        await apply_stats_delta_where(db, Customer.id.in_(ids), 1)
+    return [(row.customer_id, row.customer_status) for row in previous]
+
+async def mark_stale_leads_dead(
+    db: AsyncSession,
+    days: int,
+    batch_size: int = 1000) -> int:
+    """
+    把超过 days 天没有修改、还没有标记为 DEAD 的客户标记为 DEAD，返回更新的客户数
+
+    每批单独提交；提交后使这批客户的缓存失效并记录状态变更，全部完成后发一条 bulk 事件。
+    """
+    now = datetime.now(timezone.utc)
+    condition = and_(
+        Customer.customer_status != CustomerStatus.DEAD,
+        Customer.last_modified_date < now - timedelta(days=days),
+    )
+    total = 0
+    while True:
+        marked = await _mark_dead_batch(db, condition, now, batch_size)
+        await db.commit()
+        if marked:
+            await invalidate_customers(customer_id for customer_id, _ in marked)
+            count_cache.invalidate()
+            for customer_id, old_status in marked:
+                record_changes(
+                    customer_id,
+                    {"customer_status": old_status},
+                    {"customer_status": CustomerStatus.DEAD},
+                    now
+                )
+        total += len(marked)
+        if len(marked) < batch_size:
+            break
+    if total:
+        await event_broker.publish(change_event("bulk", {"count": total}))
+    return total
+
+async def _stale_lead_job(db: AsyncSession) -> int:
+    """
+    定时任务：在调度器提供的会话中执行 mark_stale_leads_dead
+    """
+    return await mark_stale_leads_dead(
+        db=db,
+        days=settings.STALE_LEAD_DAYS,
+        batch_size=settings.STALE_LEAD_BATCH_SIZE
+    )
+
+async def _archive_batch(db: AsyncSession, condition, now: datetime, batch_size: int) -> list[str]:
+    """
+    把最多 batch_size 个符合条件的客户移到归档表并从汇总中移出，不提交，返回移动的 customer_id
+
+    先选出这一批的 id（PostgreSQL 用 `SKIP LOCKED` 跳过正在被请求更新的行），
+    再用 `INSERT ... SELECT` 复制到归档表、`DELETE` 从客户表删除，两条语句在同一个事务中。
+    SQLite 与 _update_where 一样先移出汇总，事务一开始就取得写锁。
+    """
+    target = select(Customer.id).where(condition).order_by(Customer.id).limit(batch_size)
+    if is_postgresql(db):
+        ids = (await db.execute(target.with_for_update(skip_locked=True))).scalars().all()
+    else:
+        await apply_stats_delta_where(db, Customer.id.in_(target), -1)
+        ids = (await db.execute(target)).scalars().all()
+    if not ids:
+        return []
+    selected = any_of(db, Customer.id, ids)
+    if is_postgresql(db):
+        await apply_stats_delta_where(db, selected, -1)
+
+    await db.execute(
+        insert(CustomerArchive).from_select(
+            [*(column.key for column in ARCHIVE_COLUMNS), "archived_at"],
+            select(*CUSTOMER_COLUMNS, literal(now, CustomerArchive.archived_at.type)).where(selected)
+        )
+    )
+    result = await db.execute(
+        delete(Customer).where(selected).returning(Customer.customer_id),
+        execution_options={"synchronize_session": False}
+    )
+    return list(result.scalars().all())
+
+async def archive_customers(
+    db: AsyncSession,
+    dead_days: int | None = None,
+    created_before: datetime | None = None,
+    batch_size: int = 1000) -> int:
+    """
+    把超过 dead_days 天没有修改的 DEAD 客户、以及创建时间早于 created_before 的客户移到归档表，返回移动的客户数
+
+    两个条件至少设置一个，满足任一条件的客户都会归档；不带时区的 created_before 按 UTC 处理。
+    每批单独提交；提交后使这批客户的缓存失效，全部完成后发一条 bulk 事件。归档的客户仍然可以按 customer_id 读取，列表和导出用 include_archived 包括它们。
+    """
+    now = datetime.now(timezone.utc)
+    conditions = []
+    if dead_days is not None:
+        conditions.append(and_(
+            Customer.customer_status == CustomerStatus.DEAD,
+            Customer.last_modified_date < now - timedelta(days=dead_days),
+        ))
+    if created_before is not None:
+        if created_before.tzinfo is None:
+            created_before = created_before.replace(tzinfo=timezone.utc)
+        conditions.append(Customer.creation_date < created_before)
+    if not conditions:
+        raise ValueError("必须设置 dead_days 或 created_before")
+    condition = or_(*conditions)
+
+    total = 0
+    while True:
+        archived = await _archive_batch(db, condition, now, batch_size)
+        await db.commit()
+        if archived:
+            await invalidate_customers(archived)
+            count_cache.invalidate()
+        total += len(archived)
+        if len(archived) < batch_size:
+            break
+    if total:
+        await event_broker.publish(change_event("bulk", {"count": total}))
+    return total
+
+async def _archive_job(db: AsyncSession) -> int:
+    """
+    定时任务：在调度器提供的会话中执行 archive_customers
+    """
+    return await archive_customers(
+        db=db,
+        dead_days=settings.ARCHIVE_DEAD_DAYS,
+        created_before=settings.ARCHIVE_CREATED_BEFORE,
+        batch_size=settings.ARCHIVE_BATCH_SIZE
+    )
+
+if settings.STALE_LEAD_DAYS is not None:
+    maintenance_scheduler.add("mark-stale-leads-dead", settings.STALE_LEAD_INTERVAL_SECONDS, _stale_lead_job)
+if settings.ARCHIVE_DEAD_DAYS is not None or settings.ARCHIVE_CREATED_BEFORE is not None:
+    maintenance_scheduler.add("archive-customers", settings.ARCHIVE_INTERVAL_SECONDS, _archive_job)
+
+registry.register(CallbackGauge(
+    "maintenance_job",
+    "定时维护任务的运行、跳过、失败次数，影响的行数以及最近一次的耗时（秒）和完成时间",
+    lambda: {
+        (name, kind): value
+        for name, stats in maintenance_scheduler.stats().items()
+        for kind, value in stats.items()
+    },
+    ("job", "kind")
+))
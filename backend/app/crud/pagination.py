@@ -0,0 +1,52 @@
+"""
+游标（keyset）分页工具
+
+游标是对排序键取值的 base64 编码，对客户端不透明。
+翻页时用 `(排序键, id) > (游标值)` 作为范围条件，每一页都是一次索引范围扫描，
+与 OFFSET 不同，第 5000 页和第 1 页的代价相同，且翻页过程中不会重复或漏掉记录。
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Sequence
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析，或与当前排序方式不匹配"""
+
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    """
+    把排序方式和最后一行的排序键编码为游标
+    """
+    payload = {
+        "s": sort,
+        "v": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, types: Sequence[type]) -> list[Any]:
+    """
+    解析游标，返回按 types 还原类型后的排序键取值
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = payload["v"]
+        cursor_sort = payload["s"]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError("无效的分页游标") from e
+
+    if cursor_sort != sort or not isinstance(values, list) or len(values) != len(types):
+        raise InvalidCursorError("分页游标与排序方式不匹配")
+
+    try:
+        return [
+            datetime.fromisoformat(value) if type_ is datetime else type_(value)
+            for value, type_ in zip(values, types)
+        ]
+    except (TypeError, ValueError) as e:
+        raise InvalidCursorError("无效的分页游标") from e
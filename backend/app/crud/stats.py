@@ -0,0 +1,121 @@
+"""
+销售看板汇总（customer_stats）的增量维护
+
+每次写客户时在同一事务里把变化量累加到 customer_stats，看板只需读取
+店铺数 × 状态数行，不再扫描 customer_management。
+并发写入极端情况下可能产生偏差，可以用 rebuild_customer_stats 重新计算。
+"""
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import delete, func, text, true
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.crud.dialects import is_postgresql, upsert_insert
+from app.models.customer import Customer, CustomerStats, CustomerStatus, Shop
+from app.schemas.customer import CustomerFunnelStage, CustomerStatsGroup, CustomerStatsSummary
+
+# 销售漏斗的阶段顺序
+FUNNEL_STAGES = (CustomerStatus.CONSULTING, CustomerStatus.SAMPLE, CustomerStatus.PREPARING_ORDER)
+
+StatsDelta = tuple[Shop, CustomerStatus, int, float | None]
+
+STATS_COLUMNS = ["shop", "customer_status", "customer_count", "amount_sum"]
+
+def _accumulate(stmt):
+    """
+    让写入 customer_stats 的 INSERT 在分组已存在时累加，而不是报错
+    """
+    return stmt.on_conflict_do_update(
+        index_elements=[CustomerStats.shop, CustomerStats.customer_status],
+        set_={
+            "customer_count": CustomerStats.customer_count + stmt.excluded.customer_count,
+            "amount_sum": CustomerStats.amount_sum + stmt.excluded.amount_sum,
+        },
+    )
+
+async def apply_stats_delta(db: AsyncSession, deltas: Iterable[StatsDelta]) -> None:
+    """
+    累加一组变化量，每项为 (店铺, 状态, 客户数变化, 金额变化)
+
+    同一分组的变化会先合并，合并后为零的分组不写入。
+    """
+    merged: dict[tuple[Shop, CustomerStatus], list] = defaultdict(lambda: [0, 0.0])
+    for shop, customer_status, count, amount in deltas:
+        merged[shop, customer_status][0] += count
+        merged[shop, customer_status][1] += amount or 0.0
+    rows = [
+        {"shop": shop, "customer_status": customer_status, "customer_count": count, "amount_sum": amount}
+        for (shop, customer_status), (count, amount) in merged.items()
+        if count or amount
+    ]
+    if rows:
+        await db.execute(_accumulate(upsert_insert(db, CustomerStats).values(rows)))
+
+async def apply_stats_delta_where(db: AsyncSession, condition, sign: int) -> None:
+    """
+    按条件把匹配的客户整体计入（sign=1）或移出（sign=-1）汇总
+
+    用于批量写入：写入前以 -1 调用移出旧值，写入后以 +1 调用计入新值。
+    """
+    query = (
+        select(
+            Customer.shop,
+            Customer.customer_status,
+            sign * func.count(),
+            sign * func.coalesce(func.sum(Customer.expected_order_amount), 0.0),
+        )
+        .where(condition)
+        .group_by(Customer.shop, Customer.customer_status)
+    )
+    await db.execute(_accumulate(upsert_insert(db, CustomerStats).from_select(STATS_COLUMNS, query)))
+
+async def rebuild_customer_stats(db: AsyncSession) -> int:
+    """
+    根据 customer_management 重新计算全部汇总，返回写入的分组数
+    """
+    if is_postgresql(db):
+        # 阻塞并发的增量更新，直到重算提交；之后它们再在新的汇总上累加
+        await db.execute(text(f"LOCK TABLE {CustomerStats.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+    await db.execute(delete(CustomerStats))
+    await apply_stats_delta_where(db, true(), 1)
+    result = await db.execute(select(func.count()).select_from(CustomerStats))
+    groups = result.scalar_one()
+    await db.commit()
+    return groups
+
+async def get_customer_stats(db: AsyncSession) -> CustomerStatsSummary:
+    """
+    读取看板汇总：店铺 × 状态分组和销售漏斗
+    """
+    result = await db.execute(
+        select(CustomerStats)
+        .where(CustomerStats.customer_count != 0)
+        .order_by(CustomerStats.shop, CustomerStats.customer_status)
+    )
+    groups = [CustomerStatsGroup.model_validate(row, from_attributes=True) for row in result.scalars().all()]
+
+    by_status: dict[CustomerStatus, list] = defaultdict(lambda: [0, 0.0])
+    for group in groups:
+        by_status[group.customer_status][0] += group.customer_count
+        by_status[group.customer_status][1] += group.amount_sum
+
+    funnel: list[CustomerFunnelStage] = []
+    for index, stage in enumerate(FUNNEL_STAGES):
+        reached = sum(by_status[later][0] for later in FUNNEL_STAGES[index:])
+        previous = funnel[-1].reached if funnel else None
+        funnel.append(CustomerFunnelStage(
+            customer_status=stage,
+            customer_count=by_status[stage][0],
+            amount_sum=by_status[stage][1],
+            reached=reached,
+            conversion_rate=round(reached / previous, 4) if previous else None,
+        ))
+
+    return CustomerStatsSummary(
+        total_count=sum(group.customer_count for group in groups),
+        total_amount=sum(group.amount_sum for group in groups),
+        groups=groups,
+        funnel=funnel,
+    )
@@ -1,7 +1,8 @@
 from datetime import datetime, timezone
 from enum import Enum as PyEnum
+from typing import Any
 from sqlmodel import Field, SQLModel
-from sqlalchemy import DateTime
+from sqlalchemy import DDL, JSON, DateTime, Index, event
 
 class CustomerSource(str, PyEnum):
     NATURAL_FLOW = "NATURAL_FLOW"
@@ -25,6 +26,28 @@ class Shop(str, PyEnum):
 
 class Customer(SQLModel, table=True):
     __tablename__ = "customer_management"
+    __table_args__ = (
+        # 游标分页的排序键索引，(排序字段, id) 保证顺序唯一
+        Index("ix_customer_management_last_modified_date_id", "last_modified_date", "id"),
+        Index("ix_customer_management_creation_date_id", "creation_date", "id"),
+        # 销售看板的常用筛选：按店铺和状态查看、按最近修改排序
+        Index("ix_customer_management_shop_status_modified", "shop", "customer_status", "last_modified_date"),
+        Index("ix_customer_management_status_modified", "customer_status", "last_modified_date"),
+        # 预期下单日期和金额的范围筛选与排序
+        Index("ix_customer_management_expected_order_date", "expected_order_date"),
+        Index("ix_customer_management_expected_order_amount", "expected_order_amount"),
+        # 模糊搜索用的 trigram 索引，支持 ILIKE '%关键字%' 和相似度查询（仅 PostgreSQL）
+        Index(
+            "ix_customer_management_customer_id_trgm", "customer_id",
+            postgresql_using="gin", postgresql_ops={"customer_id": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_customer_management_demand_description_trgm", "demand_description",
+            postgresql_using="gin", postgresql_ops={"demand_description": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        # 归档的客户保留原来的 id，SQLite 不能重用已删除的最大 id
+        {"sqlite_autoincrement": True},
+    )
     id: int | None = Field(default=None, primary_key=True, index=True)
     shop: Shop= Field(..., sa_column_kwargs={"nullable": False})
     customer_id: str = Field(..., max_length=50, unique=True, sa_column_kwargs={"nullable": False})
@@ -46,4 +69,60 @@ class Customer(SQLModel, table=True):
     creation_date: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
         sa_type=DateTime(timezone=True)
-    )
\ No newline at end of file
+    )
+
+# trigram 索引依赖 pg_trgm 扩展，建表前先确保扩展已安装
+event.listen(
+    Customer.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+class CustomerArchive(SQLModel, table=True):
+    """
+    归档的客户：长期 DEAD 或创建时间早于截止日期的客户从 customer_management 移到这里，
+    保留原来的 id 和全部字段，让客户表和它的索引只包含活跃数据
+    """
+    __tablename__ = "customer_management_archive"
+    __table_args__ = (
+        # 按 customer_id 查询时从客户表落到归档表；同一个 customer_id 重新创建后可能被再次归档，所以不唯一
+        Index("ix_customer_management_archive_customer_id", "customer_id", "archived_at"),
+        # include_archived 时与客户表合并后的游标分页排序键
+        Index("ix_customer_management_archive_last_modified_date_id", "last_modified_date", "id"),
+        Index("ix_customer_management_archive_creation_date_id", "creation_date", "id"),
+    )
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    shop: Shop = Field(..., sa_column_kwargs={"nullable": False})
+    customer_id: str = Field(..., max_length=50, sa_column_kwargs={"nullable": False})
+    source: CustomerSource = Field(..., sa_column_kwargs={"nullable": False})
+    customer_type: CustomerType = Field(..., sa_column_kwargs={"nullable": False})
+    demand: int = Field(..., sa_column_kwargs={"nullable": False})
+    demand_description: str | None = Field(default=None)
+    customer_status: CustomerStatus = Field(..., sa_column_kwargs={"nullable": False})
+    expected_order_date: datetime | None = Field(default=None, sa_type=DateTime(timezone=True))
+    expected_order_amount: float | None = Field(default=None)
+    last_modified_date: datetime = Field(..., sa_type=DateTime(timezone=True), sa_column_kwargs={"nullable": False})
+    creation_date: datetime = Field(..., sa_type=DateTime(timezone=True), sa_column_kwargs={"nullable": False})
+    archived_at: datetime = Field(..., sa_type=DateTime(timezone=True), sa_column_kwargs={"nullable": False})
+
+class CustomerStats(SQLModel, table=True):
+    """按店铺和状态汇总的客户数与预期金额，由 CRUD 写操作增量维护"""
+    __tablename__ = "customer_stats"
+    shop: Shop = Field(primary_key=True)
+    customer_status: CustomerStatus = Field(primary_key=True)
+    customer_count: int = Field(default=0, sa_column_kwargs={"nullable": False})
+    amount_sum: float = Field(default=0.0, sa_column_kwargs={"nullable": False})
+
+class CustomerHistory(SQLModel, table=True):
+    """客户字段的变更记录，由更新操作通过写后队列批量写入；客户删除后记录仍然保留"""
+    __tablename__ = "customer_history"
+    __table_args__ = (
+        # 按客户查询时间线
+        Index("ix_customer_history_customer_id_changed_at", "customer_id", "changed_at", "id"),
+    )
+    id: int | None = Field(default=None, primary_key=True)
+    customer_id: str = Field(..., max_length=50, sa_column_kwargs={"nullable": False})
+    field: str = Field(..., max_length=50, sa_column_kwargs={"nullable": False})
+    old_value: Any = Field(default=None, sa_type=JSON)
+    new_value: Any = Field(default=None, sa_type=JSON)
+    changed_at: datetime = Field(..., sa_type=DateTime(timezone=True), sa_column_kwargs={"nullable": False})
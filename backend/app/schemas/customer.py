@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Annotated
+from typing import Annotated, Any
 from pydantic import BaseModel, Field, ConfigDict
 
 # 从 models 导入枚举类型
@@ -157,4 +157,241 @@ class Customer(CustomerBase):
                 "last_modified_date": "2024-01-01T00:00:00Z"
             }
         }
-    )
\ No newline at end of file
+    )
+
+class CustomerSearchResult(Customer):
+    """模糊搜索命中的客户及其相关度"""
+    score: Annotated[
+        float,
+        Field(description="相关度，0-1，越大越相关")
+    ]
+
+class CustomerFilter(BaseModel):
+    """客户列表和导出的筛选条件，所有条件都是可选的，同时提供时取交集"""
+    shop: Annotated[
+        Shop | None,
+        Field(default=None, description="店铺品牌")
+    ] = None
+    customer_status: Annotated[
+        CustomerStatus | None,
+        Field(default=None, description="客户状态")
+    ] = None
+    customer_type: Annotated[
+        CustomerType | None,
+        Field(default=None, description="客户类型")
+    ] = None
+    source: Annotated[
+        CustomerSource | None,
+        Field(default=None, description="客户来源")
+    ] = None
+    expected_order_date_from: Annotated[
+        datetime | None,
+        Field(default=None, description="预期下单日期下限（含）")
+    ] = None
+    expected_order_date_to: Annotated[
+        datetime | None,
+        Field(default=None, description="预期下单日期上限（含）")
+    ] = None
+    expected_order_amount_min: Annotated[
+        float | None,
+        Field(default=None, ge=0, description="预期订单金额下限（含）")
+    ] = None
+    expected_order_amount_max: Annotated[
+        float | None,
+        Field(default=None, ge=0, description="预期订单金额上限（含）")
+    ] = None
+
+class CustomerPage(BaseModel):
+    """一页客户数据：游标分页，或者要求返回总数的 OFFSET 分页"""
+    items: Annotated[
+        list[Customer],
+        Field(description="当前页的客户列表")
+    ]
+    next_cursor: Annotated[
+        str | None,
+        Field(default=None, description="下一页游标，为空表示没有更多数据")
+    ]
+    total: Annotated[
+        int | None,
+        Field(default=None, description="符合筛选条件的客户总数，只在 with_total=true 时返回")
+    ] = None
+    total_exact: Annotated[
+        bool | None,
+        Field(default=None, description="total 是否为精确值，数据量很大时可能是估计值")
+    ] = None
+
+class CustomerHistoryEntry(BaseModel):
+    """客户某个字段的一次变更"""
+    field: Annotated[
+        str,
+        Field(description="变更的字段名")
+    ]
+    old_value: Annotated[
+        Any,
+        Field(default=None, description="变更前的值")
+    ]
+    new_value: Annotated[
+        Any,
+        Field(default=None, description="变更后的值")
+    ]
+    changed_at: Annotated[
+        datetime,
+        Field(description="变更时间")
+    ]
+
+class CustomerBatchGetRequest(BaseModel):
+    """按 customer_id 批量获取客户的请求"""
+    customer_ids: Annotated[
+        list[str],
+        Field(min_length=1, max_length=1000, description="要获取的客户ID，最多 1000 个")
+    ]
+
+class CustomerBatchGetResult(BaseModel):
+    """批量获取客户的结果"""
+    items: Annotated[
+        list[Customer],
+        Field(description="找到的客户，按请求中 customer_ids 的顺序排列（重复的ID只返回一次）")
+    ]
+    missing: Annotated[
+        list[str],
+        Field(description="不存在的客户ID")
+    ]
+
+
+class CustomerBulkError(BaseModel):
+    """批量写入时单条记录的错误"""
+    index: Annotated[
+        int,
+        Field(description="记录在请求列表中的下标")
+    ]
+    customer_id: Annotated[
+        str | None,
+        Field(default=None, description="客户唯一标识（无法解析时为空）")
+    ]
+    errors: Annotated[
+        list[str],
+        Field(description="错误信息")
+    ]
+
+class CustomerBulkResult(BaseModel):
+    """批量创建/更新客户的结果"""
+    created: Annotated[
+        int,
+        Field(description="新建的客户数")
+    ]
+    updated: Annotated[
+        int,
+        Field(description="已存在并被更新的客户数")
+    ]
+    items: Annotated[
+        list[Customer],
+        Field(description="写入成功的客户")
+    ]
+    errors: Annotated[
+        list[CustomerBulkError],
+        Field(description="写入失败的记录，不影响其他记录")
+    ]
+
+
+class CustomerImportError(BaseModel):
+    """CSV 导入时被拒绝的一行"""
+    line: Annotated[
+        int,
+        Field(description="记录在 CSV 文件中开始的物理行号（表头为第 1 行，引号内的换行也计入）")
+    ]
+    errors: Annotated[
+        list[str],
+        Field(description="错误信息")
+    ]
+
+class CustomerImportResult(BaseModel):
+    """CSV 导入结果"""
+    rows: Annotated[
+        int,
+        Field(description="读取的数据行数（不含表头）")
+    ]
+    created: Annotated[
+        int,
+        Field(description="新建的客户数")
+    ]
+    updated: Annotated[
+        int,
+        Field(description="已存在并被更新的客户数")
+    ]
+    rejected: Annotated[
+        int,
+        Field(description="校验失败被拒绝的行数")
+    ]
+    errors: Annotated[
+        list[CustomerImportError],
+        Field(description="被拒绝行的错误信息（最多返回前 100 条）")
+    ]
+    elapsed_seconds: Annotated[
+        float,
+        Field(description="导入耗时（秒）")
+    ]
+    rows_per_second: Annotated[
+        float,
+        Field(description="吞吐量（行/秒）")
+    ]
+
+class CustomerStatsGroup(BaseModel):
+    """某个店铺、某个状态下的客户汇总"""
+    shop: Annotated[
+        Shop,
+        Field(description="店铺品牌")
+    ]
+    customer_status: Annotated[
+        CustomerStatus,
+        Field(description="客户状态")
+    ]
+    customer_count: Annotated[
+        int,
+        Field(description="客户数")
+    ]
+    amount_sum: Annotated[
+        float,
+        Field(description="预期订单金额合计")
+    ]
+
+class CustomerFunnelStage(BaseModel):
+    """销售漏斗中的一个阶段"""
+    customer_status: Annotated[
+        CustomerStatus,
+        Field(description="漏斗阶段")
+    ]
+    customer_count: Annotated[
+        int,
+        Field(description="当前处于该阶段的客户数")
+    ]
+    amount_sum: Annotated[
+        float,
+        Field(description="当前处于该阶段的预期订单金额合计")
+    ]
+    reached: Annotated[
+        int,
+        Field(description="处于该阶段或之后阶段的客户数")
+    ]
+    conversion_rate: Annotated[
+        float | None,
+        Field(default=None, description="相对上一阶段的转化率，第一阶段为空")
+    ]
+
+class CustomerStatsSummary(BaseModel):
+    """销售看板汇总数据"""
+    total_count: Annotated[
+        int,
+        Field(description="客户总数")
+    ]
+    total_amount: Annotated[
+        float,
+        Field(description="预期订单金额总计")
+    ]
+    groups: Annotated[
+        list[CustomerStatsGroup],
+        Field(description="按店铺 × 状态的汇总")
+    ]
+    funnel: Annotated[
+        list[CustomerFunnelStage],
+        Field(description="咨询中 → 样品 → 准备下单 的漏斗")
+    ]
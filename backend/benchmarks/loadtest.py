@@ -0,0 +1,414 @@
+"""
+客户 API 压测
+
+先通过 /bulk 写入 N 个覆盖全部 店铺 × 状态 组合的客户，然后按场景依次压测
+app/api/v1/customer.py 中的每个路由，记录吞吐量和 p50/p95/p99 延迟，结果写入 JSON 文件，
+可以用 compare 命令对比两次提交的结果。
+
+压测目标三选一：
+- 默认：进程内 ASGI 客户端，直接调用 main.app（连接 .env 中配置的数据库）
+- --uvicorn：在本机启动一个 uvicorn 子进程，通过 HTTP 压测
+- --base-url：压测已经在运行的服务
+
+用法（在 backend 目录下）：
+    python -m benchmarks.loadtest run --customers 10000 --concurrency 32 --requests 500
+    python -m benchmarks.loadtest compare old.json new.json
+"""
+import asyncio
+import csv
+import io
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+import typer
+
+from app.models.customer import CustomerSource, CustomerStatus, CustomerType, Shop
+
+API_PREFIX = "/api/v1/customers"
+# 每个 /bulk 请求写入的客户数
+SEED_BATCH_SIZE = 1000
+# 写场景每个请求涉及的客户数
+WRITE_BATCH_SIZE = 20
+
+cli = typer.Typer(help="客户 API 压测")
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+class LoadTest:
+    """一次压测的种子数据和各个路由的请求场景"""
+
+    def __init__(self, prefix: str, customers: int, seed: int) -> None:
+        self.prefix = prefix
+        self.customers = customers
+        self.rng = random.Random(seed)
+        self.combinations = list(itertools.product(Shop, CustomerStatus))
+        # 种子客户的数据库主键，PUT /id/{id} 使用
+        self.ids: list[int] = []
+
+    def customer_id(self, index: int) -> str:
+        return f"{self.prefix}-{index:07d}"
+
+    def customer(self, index: int, customer_id: str | None = None) -> dict:
+        """
+        第 index 个客户的数据，店铺和状态按顺序轮流取遍所有组合
+        """
+        shop, customer_status = self.combinations[index % len(self.combinations)]
+        return {
+            "shop": shop.value,
+            "customer_id": customer_id or self.customer_id(index),
+            "source": self.rng.choice(list(CustomerSource)).value,
+            "customer_type": self.rng.choice(list(CustomerType)).value,
+            "demand": self.rng.randint(1, 9999),
+            "demand_description": f"压测客户 {index}，需要定制礼服" if index % 2 else None,
+            "customer_status": customer_status.value,
+            "expected_order_date": f"2025-{index % 12 + 1:02d}-15T00:00:00Z" if index % 3 else None,
+            "expected_order_amount": round(self.rng.uniform(0, 100000), 2) if index % 3 else None,
+        }
+
+    def random_index(self) -> int:
+        return self.rng.randrange(self.customers)
+
+    async def seed(self, client: httpx.AsyncClient) -> None:
+        """
+        写入种子客户并记下主键
+        """
+        for start in range(0, self.customers, SEED_BATCH_SIZE):
+            batch = [self.customer(i) for i in range(start, min(start + SEED_BATCH_SIZE, self.customers))]
+            response = await client.post(f"{API_PREFIX}/bulk", json=batch)
+            response.raise_for_status()
+            result = response.json()
+            if result["errors"]:
+                raise RuntimeError(f"写入种子客户失败: {result['errors'][:3]}")
+            self.ids.extend(item["id"] for item in result["items"])
+
+    def scenarios(self) -> dict[str, Scenario]:
+        """
+        每个路由一个场景，按字典顺序执行；delete 删除的是 create 创建的客户
+        """
+        async def create(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.post(f"{API_PREFIX}/", json=self.customer(i, f"{self.prefix}-new-{i}"))
+
+        async def bulk(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            start = self.random_index()
+            batch = [self.customer(j % self.customers) for j in range(start, start + WRITE_BATCH_SIZE)]
+            return await client.post(f"{API_PREFIX}/bulk", json=batch)
+
+        async def import_csv(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            start = self.random_index()
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=list(self.customer(0)))
+            writer.writeheader()
+            for j in range(start, start + WRITE_BATCH_SIZE):
+                writer.writerow({k: "" if v is None else v for k, v in self.customer(j % self.customers).items()})
+            return await client.post(
+                f"{API_PREFIX}/import",
+                content=buffer.getvalue().encode("utf-8"),
+                headers={"Content-Type": "text/csv"},
+            )
+
+        async def export(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            shop, customer_status = self.combinations[i % len(self.combinations)]
+            params = {"format": "ndjson" if i % 2 else "csv", "shop": shop.value, "customer_status": customer_status.value}
+            return await client.get(f"{API_PREFIX}/export", params=params)
+
+        async def stats(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.get(f"{API_PREFIX}/stats")
+
+        async def search(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            # customer_id 的数字部分，既能走 ILIKE 也能走相似度
+            return await client.get(f"{API_PREFIX}/search", params={"q": self.customer_id(self.random_index())[-5:]})
+
+        async def get(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.get(f"{API_PREFIX}/{self.customer_id(self.random_index())}")
+
+        async def batch_get(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            customer_ids = [self.customer_id(self.random_index()) for _ in range(20)]
+            return await client.post(f"{API_PREFIX}/batch-get", json={"customer_ids": customer_ids})
+
+        async def history(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.get(f"{API_PREFIX}/{self.customer_id(self.random_index())}/history")
+
+        async def list_offset(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            params = {"skip": self.rng.randrange(max(self.customers - 100, 1)), "limit": 100, "sort": "-last_modified_date"}
+            return await client.get(f"{API_PREFIX}/", params=params)
+
+        async def list_cursor(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            shop, customer_status = self.combinations[i % len(self.combinations)]
+            params = {"cursor": "", "limit": 100, "shop": shop.value, "customer_status": customer_status.value}
+            return await client.get(f"{API_PREFIX}/", params=params)
+
+        async def update(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            body = {"demand": self.rng.randint(1, 9999), "expected_order_amount": round(self.rng.uniform(0, 100000), 2)}
+            return await client.put(f"{API_PREFIX}/{self.customer_id(self.random_index())}", json=body)
+
+        async def update_by_id(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.put(f"{API_PREFIX}/id/{self.rng.choice(self.ids)}", json={"demand": self.rng.randint(1, 9999)})
+
+        async def delete(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.delete(f"{API_PREFIX}/{self.prefix}-new-{i}")
+
+        return {
+            "POST /": create,
+            "POST /bulk": bulk,
+            "POST /import": import_csv,
+            "GET /export": export,
+            "GET /stats": stats,
+            "GET /search": search,
+            "GET /{customer_id}": get,
+            "GET /{customer_id}/history": history,
+            "POST /batch-get": batch_get,
+            "GET / (offset)": list_offset,
+            "GET / (cursor)": list_cursor,
+            "PUT /{customer_id}": update,
+            "PUT /id/{id}": update_by_id,
+            "DELETE /{customer_id}": delete,
+        }
+
+def _percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    最近秩法计算百分位数
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int) -> dict:
+    """
+    用 concurrency 个并发协程执行 requests 次场景，返回吞吐量和延迟统计（毫秒）
+    """
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    counter = itertools.count()
+
+    async def worker() -> None:
+        while (i := next(counter)) < requests:
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, i)
+                await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+@asynccontextmanager
+async def asgi_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    进程内 ASGI 客户端，先执行迁移，再手动执行应用的 lifespan（检查结构版本、释放连接）
+    """
+    from app.core.database import engine
+    from app.core.migrations import migrate
+    from main import app
+
+    await migrate(engine)
+    async with app.router.lifespan_context(app):
+        # 应用内部异常按 500 记录，而不是中断压测
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            yield client
+
+@asynccontextmanager
+async def http_client(base_url: str, concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    通过 HTTP 连接已经运行的服务
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        yield client
+
+@asynccontextmanager
+async def uvicorn_client(port: int, concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    在本机启动一个 uvicorn 子进程，就绪后通过 HTTP 连接
+    """
+    from app.core.database import engine
+    from app.core.migrations import migrate
+
+    # 工作进程启动时只检查结构版本，这里先执行迁移
+    await migrate(engine)
+    await engine.dispose()
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log",
+    ])
+    try:
+        async with http_client(f"http://127.0.0.1:{port}", concurrency) as client:
+            for _ in range(100):
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn 启动失败，退出码 {process.returncode}")
+                try:
+                    (await client.get("/")).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("等待 uvicorn 就绪超时")
+            yield client
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def _git_commit() -> str | None:
+    """
+    当前提交，写入结果便于对比
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _run(
+    client_context,
+    target: str,
+    load_test: LoadTest,
+    requests: int,
+    concurrency: int,
+    selected: list[str] | None) -> dict:
+    """
+    写入种子数据并依次执行各个场景
+    """
+    scenarios = load_test.scenarios()
+    async with client_context as client:
+        started = time.perf_counter()
+        await load_test.seed(client)
+        seed_seconds = time.perf_counter() - started
+        typer.echo(f"已写入 {load_test.customers} 个客户，用时 {seed_seconds:.2f} 秒")
+
+        endpoints = {}
+        for name, scenario in scenarios.items():
+            if selected and name not in selected:
+                continue
+            endpoints[name] = result = await run_scenario(client, scenario, requests, concurrency)
+            latency = result["latency_ms"]
+            typer.echo(
+                f"{name:<24}{result['throughput_rps']:>10.1f} req/s"
+                f"  p50 {latency['p50']:>8.2f}  p95 {latency['p95']:>8.2f}  p99 {latency['p99']:>8.2f} ms"
+                f"  错误 {result['errors']}"
+            )
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "target": target,
+            "customers": load_test.customers,
+            "requests_per_endpoint": requests,
+            "concurrency": concurrency,
+            "seed_seconds": round(seed_seconds, 3),
+        },
+        "endpoints": endpoints,
+    }
+
+@cli.command()
+def run(
+    customers: int = typer.Option(1000, min=1, help="种子客户数"),
+    requests: int = typer.Option(200, min=1, help="每个路由的请求数"),
+    concurrency: int = typer.Option(16, min=1, help="并发请求数"),
+    base_url: str | None = typer.Option(None, help="压测已经运行的服务，例如 http://127.0.0.1:8000"),
+    uvicorn: bool = typer.Option(False, "--uvicorn", help="在本机启动 uvicorn 子进程后通过 HTTP 压测"),
+    port: int = typer.Option(8765, help="--uvicorn 使用的端口"),
+    endpoint: list[str] = typer.Option([], help="只压测指定的场景，例如 'GET /stats'，可以重复"),
+    prefix: str | None = typer.Option(None, help="种子客户 customer_id 的前缀，默认按时间生成"),
+    seed: int = typer.Option(0, help="随机数种子"),
+    output: Path = typer.Option(Path("loadtest-results.json"), help="结果文件"),
+) -> None:
+    """
+    写入种子客户并压测每个路由，结果写入 JSON 文件
+    """
+    if base_url and uvicorn:
+        raise typer.BadParameter("--base-url 与 --uvicorn 不能同时使用")
+    unknown = set(endpoint) - set(LoadTest("", 1, 0).scenarios())
+    if unknown:
+        raise typer.BadParameter(f"未知的场景: {', '.join(sorted(unknown))}")
+
+    if not base_url:
+        from app.core.config import settings
+        from app.core.database import is_memory_database
+
+        # 内存数据库所有会话共用一个连接，并发压测的结果没有意义；--uvicorn 的子进程也看不到这里写入的数据
+        if is_memory_database(settings.DATABASE_URL):
+            raise typer.BadParameter("压测不能使用 SQLite 内存数据库，请在 DATABASE_URL 中使用数据库文件")
+
+    if base_url:
+        client_context, target = http_client(base_url, concurrency), base_url
+    elif uvicorn:
+        client_context, target = uvicorn_client(port, concurrency), f"uvicorn:{port}"
+    else:
+        client_context, target = asgi_client(), "asgi"
+
+    load_test = LoadTest(prefix or f"LT{int(time.time())}", customers, seed)
+    result = asyncio.run(_run(client_context, target, load_test, requests, concurrency, endpoint or None))
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    typer.echo(f"结果已写入 {output}")
+
+@cli.command()
+def compare(
+    baseline: Path = typer.Argument(..., exists=True, dir_okay=False, help="基准结果文件"),
+    current: Path = typer.Argument(..., exists=True, dir_okay=False, help="当前结果文件"),
+    threshold: float = typer.Option(0.2, min=0, help="p95 变慢超过该比例时视为退化"),
+) -> None:
+    """
+    对比两次压测结果，任一路由 p95 退化超过阈值时以退出码 1 结束
+    """
+    old = json.loads(baseline.read_text(encoding="utf-8"))["endpoints"]
+    new = json.loads(current.read_text(encoding="utf-8"))["endpoints"]
+    regressions = []
+    for name in new:
+        if name not in old:
+            continue
+        old_p95, new_p95 = old[name]["latency_ms"]["p95"], new[name]["latency_ms"]["p95"]
+        change = (new_p95 - old_p95) / old_p95 if old_p95 else 0.0
+        old_rps, new_rps = old[name]["throughput_rps"], new[name]["throughput_rps"]
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  ← 退化"
+        typer.echo(
+            f"{name:<24}p95 {old_p95:>8.2f} → {new_p95:>8.2f} ms ({change:+.0%})"
+            f"  吞吐 {old_rps:>8.1f} → {new_rps:>8.1f} req/s{flag}"
+        )
+    if regressions:
+        raise typer.Exit(code=1)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,122 @@
+"""
+客户列表序列化基准
+
+对比两条路径从查询到 JSON 字节串的每行耗时：
+- orm：查询 ORM 对象 → model_dump → 按 response_model 校验 → 转成 JSON 兼容类型 → 标准库 json
+  （即 FastAPI 处理 `response_model=list[Customer]` 的过程）
+- rows：只选择列 → 普通字典 → FastJSONResponse 的编码（有 orjson 时用 orjson）
+
+使用内存中的 SQLite，不需要数据库服务。用法（在 backend 目录下）：
+    python -m benchmarks.serialization --rows 1000 --repeat 20
+"""
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import typer
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from sqlmodel import SQLModel
+
+from app.core import responses
+from app.models.customer import Customer, CustomerSource, CustomerStatus, CustomerType, Shop
+from app.schemas.customer import Customer as CustomerSchema
+
+cli = typer.Typer(help="客户列表序列化基准")
+
+def _seed(session: Session, rows: int) -> None:
+    """
+    写入 rows 个随机客户
+    """
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    session.execute(Customer.__table__.insert(), [
+        {
+            "shop": rng.choice(list(Shop)),
+            "customer_id": f"BENCH{i:07d}",
+            "source": rng.choice(list(CustomerSource)),
+            "customer_type": rng.choice(list(CustomerType)),
+            "demand": rng.randint(1, 9999),
+            "demand_description": "需要定制高端礼服，预算充足" if i % 2 else None,
+            "customer_status": rng.choice(list(CustomerStatus)),
+            "expected_order_date": now + timedelta(days=rng.randint(1, 90)),
+            "expected_order_amount": round(rng.uniform(0, 100000), 2),
+            "creation_date": now,
+            "last_modified_date": now,
+        }
+        for i in range(rows)
+    ])
+    session.commit()
+
+def _orm_path(session: Session, adapter: TypeAdapter) -> bytes:
+    """
+    ORM 对象 + response_model 校验 + 标准库 json
+    """
+    customers = session.execute(select(Customer).order_by(Customer.id)).scalars().all()
+    content = [customer.model_dump() for customer in customers]
+    validated = adapter.validate_python(content)
+    encoded = adapter.dump_python(validated, mode="json")
+    session.expunge_all()
+    return json.dumps(encoded, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _rows_path(session: Session) -> bytes:
+    """
+    只选择列 + 直接编码
+    """
+    result = session.execute(select(*Customer.__table__.columns).order_by(Customer.id))
+    return responses.dumps([dict(row) for row in result.mappings()])
+
+def _measure(fn: Callable[[], bytes], repeat: int) -> list[float]:
+    """
+    运行 repeat 次，返回每次的耗时（秒）
+    """
+    fn()  # 预热
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+@cli.command()
+def main(
+    rows: int = typer.Option(1000, min=1, help="每次序列化的客户数（相当于 limit）"),
+    repeat: int = typer.Option(20, min=1, help="每条路径重复的次数"),
+) -> None:
+    """
+    输出两条路径的每行耗时（微秒）
+    """
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine, tables=[Customer.__table__])
+    adapter = TypeAdapter(list[CustomerSchema])
+
+    with Session(engine) as session:
+        _seed(session, rows)
+        # 两条路径的输出应该是同一份数据
+        orm_output = json.loads(_orm_path(session, adapter))
+        rows_output = json.loads(_rows_path(session))
+        if orm_output != rows_output:
+            typer.echo("两条路径的输出不一致", err=True)
+            raise typer.Exit(code=1)
+
+        results = {
+            "orm": _measure(lambda: _orm_path(session, adapter), repeat),
+            "rows": _measure(lambda: _rows_path(session), repeat),
+        }
+
+    encoder = "orjson" if responses.orjson is not None else "json"
+    typer.echo(f"{rows} 行 × {repeat} 次，rows 路径编码器: {encoder}")
+    typer.echo(f"{'路径':<6}{'中位数/行 (µs)':>16}{'最快/行 (µs)':>16}")
+    for name, timings in results.items():
+        typer.echo(
+            f"{name:<6}{statistics.median(timings) / rows * 1e6:>16.2f}{min(timings) / rows * 1e6:>16.2f}"
+        )
+    speedup = statistics.median(results["orm"]) / statistics.median(results["rows"])
+    typer.echo(f"rows 路径快 {speedup:.1f} 倍")
+
+if __name__ == "__main__":
+    cli()
@@ -1,30 +1,46 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import SQLModel
+from app.core.admission import AdmissionMiddleware, admission_controller
+from app.api.metrics import router as metrics_router
 from app.api.v1.customer import router as customer_router
-from app.core.database import engine
-from app.models.customer import Customer  # 导入 Customer 模型
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
+from app.core.database import ReadYourWritesMiddleware, engine, read_engine
+from app.core.events import event_broker
+from app.core.metrics import MetricsMiddleware
+from app.core.migrations import migrate, verify_schema_version
+from app.crud.history import history_writer
+from app.crud.maintenance import maintenance_scheduler
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     应用程序生命周期管理
-    启动时创建数据库表
-    关闭时释放数据库连接
+    启动时检查数据库结构版本（表结构由 `pdm run cli migrate` 创建，工作进程不执行 DDL），启动变更记录的写后队列、变更推送和定时维护任务
+    关闭时先停止定时任务，写完队列中剩余的变更记录，再释放数据库连接
     """
     print("应用程序启动...")
-    async with engine.begin() as conn:
-        # 确保所有模型都被导入后再创建表
-        # SQLModel.metadata 会包含所有已导入的模型定义
-        print("创建数据库表...")
-        await conn.run_sync(SQLModel.metadata.create_all)
-        print("数据库表创建完成")
-    
+    if settings.DB_AUTO_MIGRATE:
+        # 开发环境的便利选项：启动时直接执行迁移
+        for migration in await migrate(engine):
+            print(f"已执行迁移 {migration.version}：{migration.description}")
+    app.state.schema_version = await verify_schema_version(engine)
+    print(f"数据库结构版本 {app.state.schema_version}")
+    history_writer.start()
+    await event_broker.start()
+    if settings.SCHEDULER_ENABLED:
+        maintenance_scheduler.start()
+
     yield  # 应用运行期间
     
     print("应用程序关闭...")
+    await maintenance_scheduler.stop()
+    await event_broker.stop()
+    await history_writer.stop()
     await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
 
 # 创建 FastAPI 应用实例
 app = FastAPI(
@@ -37,6 +53,17 @@ app = FastAPI(
     openapi_url="/openapi.json"  # OpenAPI 模式路径
 )
 
+# 添加准入控制：限制同时处理的 API 请求数，超出时排队或返回 503；
+# 在 CORS 和指标中间件内层，被拒绝的响应同样带有 CORS 头并计入指标
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=admission_controller,
+        prefix=settings.API_V1_STR,
+        exempt_paths=(f"{settings.API_V1_STR}/customers/events",),  # SSE 连接长时间保持，不占用数据库连接
+        retry_after=settings.ADMISSION_RETRY_AFTER
+    )
+
 # 添加 CORS 中间件
 app.add_middleware(
     CORSMiddleware,
@@ -44,10 +71,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # 前端读取 ETag 后通过 If-Match 做条件更新
 )
 
+# 配置了只读副本时，写请求成功后让客户端短时间内读主库，读到自己刚写入的数据
+if read_engine is not None:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+# 添加指标中间件，记录每个路由的请求数、耗时和 SQL 语句数
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# 添加压缩中间件，较大的列表和导出响应按 Accept-Encoding 压缩
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY
+    )
+
 # 注册路由
 app.include_router(customer_router, prefix="/api/v1")
+app.include_router(metrics_router)
 
 @app.get("/", tags=["root"])
 async def root() -> dict[str, str]:
@@ -59,10 +105,20 @@ async def root() -> dict[str, str]:
         "docs": "访问 /docs 查看完整API文档"
     }
 
+@app.get("/health", tags=["root"])
+async def health() -> dict[str, str | int]:
+    """
+    健康检查，供负载均衡和进程管理器探测；不访问数据库
+    """
+    return {
+        "status": "ok",
+        "schema_version": app.state.schema_version
+    }
+
 if __name__ == "__main__":
     import uvicorn
     
-    # 使用 uvicorn 启动应用
+    # 开发服务器；生产环境使用 `pdm run cli serve`，支持多进程和优雅关闭
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
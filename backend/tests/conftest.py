@@ -1,42 +1,52 @@
 """
 Pytest 配置文件
+
+默认使用内存中的 SQLite，不需要数据库服务；每个测试前重新建表，测试之间互不影响。
+设置 TEST_DATABASE_URL 可以改为在 PostgreSQL 上运行。
 """
-import asyncio
+import os
+
+# 必须在导入应用之前设置，引擎在导入时按配置创建
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
 import pytest
 from typing import AsyncGenerator
+from httpx import ASGITransport, AsyncClient
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
-from httpx import AsyncClient
-
-from app.core.database import engine, get_db
-from app.main import app
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """创建事件循环"""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+from app.core.cache import count_cache, customer_cache
+from app.core.database import async_session, engine
+from app.core.migrations import schema_version_table
+from app.core.scheduler import job_run_table
+from app.crud.history import history_writer
+from main import app
 
-@pytest.fixture(scope="session")
-async def test_app():
-    """创建测试应用"""
+@pytest.fixture(autouse=True)
+async def database() -> AsyncGenerator[None, None]:
+    """为每个测试建表，结束后写完变更记录队列、删表并清空缓存"""
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
-    
-    yield app
-    
+        await conn.run_sync(job_run_table.create)
+
+    yield
+
+    await history_writer.flush()
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(schema_version_table.drop, checkfirst=True)
+        await conn.run_sync(job_run_table.drop, checkfirst=True)
+    await customer_cache.clear()
+    count_cache.invalidate()
 
 @pytest.fixture
 async def session() -> AsyncGenerator[AsyncSession, None]:
     """创建数据库会话"""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        yield client
+    async with async_session() as session:
+        yield session
 
 @pytest.fixture
-async def client(test_app) -> AsyncGenerator[AsyncClient, None]:
+async def client() -> AsyncGenerator[AsyncClient, None]:
     """创建测试客户端"""
-    async with AsyncClient(app=test_app, base_url="http://test") as client:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         yield client
@@ -1,72 +1,578 @@
 """
 客户 API 测试
 """
+import asyncio
+import json
+
 import pytest
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.core import database, responses
+from app.core.admission import AdmissionController, OverloadedError, admission_controller
+from app.core.cache import customer_cache
 from app.core.config import settings
-from app.main import app
-from app.models.customer import Customer, CustomerSource, CustomerType, CustomerStatus, Shop
+from app.core.events import event_broker
+from app.core.database import async_session
+from app.crud.customer import customer_loader
+from app.crud.customer_import import import_customers_csv, iter_lines
+from app.crud.history import history_writer
+from main import app
+
+CUSTOMERS_URL = f"{settings.API_V1_STR}/customers"
+
+def customer_data(customer_id: str = "TEST001", **overrides) -> dict:
+    """创建客户的请求体"""
+    return {
+        "shop": "YI",
+        "customer_id": customer_id,
+        "source": "NATURAL_FLOW",
+        "customer_type": "NEW",
+        "demand": 100,
+        "demand_description": "测试客户",
+        "customer_status": "CONSULTING",
+        **overrides
+    }
+
+def sample(metrics: str, series: str) -> float:
+    """Prometheus 文本中某个序列（名称加标签）的值，还没有样本时为 0"""
+    for line in metrics.splitlines():
+        if line.startswith(f"{series} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+async def create(client: AsyncClient, customer_id: str = "TEST001", **overrides) -> dict:
+    """通过 API 创建客户并返回响应数据"""
+    response = await client.post(f"{CUSTOMERS_URL}/", json=customer_data(customer_id, **overrides))
+    assert response.status_code == 201, response.text
+    return response.json()
 
 @pytest.mark.asyncio
-async def test_create_customer():
+async def test_create_customer(client: AsyncClient):
     """测试创建客户"""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        customer_data = {
-            "shop": "依",
-            "customer_id": "TEST001",
-            "source": "自然流量",
-            "customer_type": "新客户",
-            "demand": 100,
-            "demand_description": "测试客户",
-            "customer_status": "咨询中"
-        }
-        response = await client.post(
-            f"{settings.API_V1_STR}/customers/",
-            json=customer_data
-        )
-        assert response.status_code == 201
-        data = response.json()
-        assert data["customer_id"] == "TEST001"
-        assert data["shop"] == "依"
-
-@pytest.mark.asyncio
-async def test_read_customer():
+    data = await create(client)
+    assert data["customer_id"] == "TEST001"
+    assert data["shop"] == "YI"
+    assert data["id"] is not None
+
+    response = await client.post(f"{CUSTOMERS_URL}/", json=customer_data(demand=0))
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_read_customer(client: AsyncClient):
     """测试读取客户"""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.get(
-            f"{settings.API_V1_STR}/customers/TEST001"
-        )
-        assert response.status_code == 200
-        data = response.json()
-        assert data["customer_id"] == "TEST001"
+    await create(client)
+    response = await client.get(f"{CUSTOMERS_URL}/TEST001")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["customer_id"] == "TEST001"
+
+    response = await client.get(f"{CUSTOMERS_URL}/MISSING")
+    assert response.status_code == 404
 
 @pytest.mark.asyncio
-async def test_update_customer():
+async def test_update_customer(client: AsyncClient):
     """测试更新客户"""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        update_data = {
-            "customer_status": "样品",
-            "demand": 200
-        }
-        response = await client.put(
-            f"{settings.API_V1_STR}/customers/TEST001",
-            json=update_data
-        )
-        assert response.status_code == 200
-        data = response.json()
-        assert data["customer_status"] == "样品"
-        assert data["demand"] == 200
+    await create(client)
+    # 先读一次，确认更新会让缓存失效
+    await client.get(f"{CUSTOMERS_URL}/TEST001")
+    update_data = {
+        "customer_status": "SAMPLE",
+        "demand": 200
+    }
+    response = await client.put(
+        f"{CUSTOMERS_URL}/TEST001",
+        json=update_data
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["customer_status"] == "SAMPLE"
+    assert data["demand"] == 200
+
+    response = await client.get(f"{CUSTOMERS_URL}/TEST001")
+    assert response.json()["customer_status"] == "SAMPLE"
 
 @pytest.mark.asyncio
-async def test_delete_customer():
+async def test_delete_customer(client: AsyncClient):
     """测试删除客户"""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.delete(
-            f"{settings.API_V1_STR}/customers/TEST001"
-        )
+    await create(client)
+    response = await client.delete(f"{CUSTOMERS_URL}/TEST001")
+    assert response.status_code == 204
+
+    response = await client.get(f"{CUSTOMERS_URL}/TEST001")
+    assert response.status_code == 404
+    response = await client.delete(f"{CUSTOMERS_URL}/TEST001")
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_list_customers_cursor_pagination(client: AsyncClient):
+    """测试筛选和游标分页"""
+    for i in range(5):
+        await create(client, f"PAGE00{i}", shop="LI" if i % 2 else "YI")
+
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"shop": "YI"})
+    assert [item["customer_id"] for item in response.json()] == ["PAGE000", "PAGE002", "PAGE004"]
+
+    seen = []
+    params = {"cursor": "", "limit": 2}
+    while True:
+        response = await client.get(f"{CUSTOMERS_URL}/", params=params)
         assert response.status_code == 200
-        data = response.json()
-        assert data["detail"] == "客户删除成功"
+        page = response.json()
+        seen.extend(item["customer_id"] for item in page["items"])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert seen == [f"PAGE00{i}" for i in range(5)]
+
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"cursor": "bad"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_list_fast_json_matches_response_model(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    """测试列表直接编码的行与经过 response_model 的单个客户响应一致，orjson 和标准库 json 编码结果相同"""
+    await create(client, "FAST01", expected_order_date="2024-05-01", expected_order_amount=1234.5)
+    expected = (await client.get(f"{CUSTOMERS_URL}/FAST01")).json()
+
+    response = await client.get(f"{CUSTOMERS_URL}/")
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.json() == [expected]
+    monkeypatch.setattr(responses, "orjson", None)
+    fallback = await client.get(f"{CUSTOMERS_URL}/")
+    assert fallback.content == response.content
+    assert fallback.headers["ETag"] == response.headers["ETag"]
+
+@pytest.mark.asyncio
+async def test_bulk_upsert(client: AsyncClient):
+    """测试批量写入：新建、更新和单条记录校验失败"""
+    await create(client, "BULK001")
+    response = await client.post(f"{CUSTOMERS_URL}/bulk", json=[
+        customer_data("BULK001", demand=300),
+        customer_data("BULK002"),
+        customer_data("BULK003", demand=0),
+    ])
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["created"], result["updated"]) == (1, 1)
+    assert [error["index"] for error in result["errors"]] == [2]
+
+    response = await client.get(f"{CUSTOMERS_URL}/BULK001")
+    assert response.json()["demand"] == 300
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_isolates_failing_rows(client: AsyncClient, session: AsyncSession):
+    """测试同一分块中只有数据库拒绝的记录失败，每条带着自己的错误信息，其他记录照常写入"""
+    for name in ("REJECT_A", "REJECT_B"):
+        if session.bind.dialect.name == "postgresql":
+            await session.execute(text(
+                f"ALTER TABLE customer_management ADD CONSTRAINT {name.lower()} CHECK (customer_id <> '{name}')"
+            ))
+        else:
+            await session.execute(text(
+                f"CREATE TRIGGER {name.lower()} BEFORE INSERT ON customer_management"
+                f" WHEN NEW.customer_id = '{name}' BEGIN SELECT RAISE(ABORT, '{name.lower()}'); END"
+            ))
+    await session.commit()
+
+    ids = [f"ROW{i:02d}" for i in range(8)]
+    ids[2], ids[5] = "REJECT_A", "REJECT_B"
+    response = await client.post(f"{CUSTOMERS_URL}/bulk", json=[customer_data(customer_id) for customer_id in ids])
+    result = response.json()
+    assert result["created"] == 6
+    assert [item["customer_id"] for item in result["items"]] == [ids[i] for i in (0, 1, 3, 4, 6, 7)]
+    assert [(error["index"], error["customer_id"]) for error in result["errors"]] == [(2, "REJECT_A"), (5, "REJECT_B")]
+    assert "reject_a" in result["errors"][0]["errors"][0] and "reject_b" in result["errors"][1]["errors"][0]
+    stats = (await client.get(f"{CUSTOMERS_URL}/stats")).json()
+    assert stats["total_count"] == 6
+
+async def _chunks(data: bytes, size: int = 7):
+    """按固定大小切分的字节流，模拟分块上传"""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+@pytest.mark.asyncio
+async def test_import_and_export(client: AsyncClient):
+    """测试 CSV 导入和 NDJSON 导出"""
+    csv_body = (
+        "shop,customer_id,source,customer_type,demand,customer_status\n"
+        "YI,CSV001,NATURAL_FLOW,NEW,10,CONSULTING\n"
+        "LI,CSV002,RECOMMENDED,OLD,20,SAMPLE\n"
+        "MO,CSV003,RECOMMENDED,OLD,0,SAMPLE\n"
+    )
+    response = await client.post(
+        f"{CUSTOMERS_URL}/import",
+        content=csv_body.encode("utf-8"),
+        headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["created"], result["rejected"]) == (2, 1)
+    assert result["errors"][0]["line"] == 4
+
+    # 引号内的换行不影响之后的行号；分块边界不会拆开跨行的记录
+    csv_body = (
+        "shop,customer_id,source,customer_type,demand,customer_status,demand_description\n"
+        'YI,CSV004,NATURAL_FLOW,NEW,10,CONSULTING,"第一行\n第二行\n第三行"\n'
+        "LI,CSV005,RECOMMENDED,OLD,0,SAMPLE,\n"
+        "\n"
+        'MO,CSV006,RECOMMENDED,OLD,5,BAD,"说明\n"\n'
+        "MO,CSV007,RECOMMENDED,OLD,5,SAMPLE,\n"
+    )
+    async with async_session() as session:
+        result = await import_customers_csv(session, iter_lines(_chunks(csv_body.encode("utf-8"))), chunk_size=1)
+    assert (result.created, result.rejected) == (2, 2)
+    assert [error.line for error in result.errors] == [5, 7]
+    response = await client.get(f"{CUSTOMERS_URL}/CSV004")
+    assert response.json()["demand_description"] == "第一行\n第二行\n第三行"
+
+    response = await client.get(f"{CUSTOMERS_URL}/export", params={"format": "ndjson", "shop": "LI"})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["customer_id"] for row in rows] == ["CSV002"]
+
+@pytest.mark.asyncio
+async def test_stats_follow_writes(client: AsyncClient):
+    """测试看板汇总随写操作增量更新"""
+    await create(client, "STAT001", expected_order_amount=100.0)
+    await create(client, "STAT002", customer_status="SAMPLE", expected_order_amount=50.0)
+    await client.put(f"{CUSTOMERS_URL}/STAT001", json={"customer_status": "SAMPLE"})
+    await client.delete(f"{CUSTOMERS_URL}/STAT002")
+
+    response = await client.get(f"{CUSTOMERS_URL}/stats")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["total_count"] == 1
+    assert stats["total_amount"] == 100.0
+    assert [(group["customer_status"], group["customer_count"]) for group in stats["groups"]] == [("SAMPLE", 1)]
+
+@pytest.mark.asyncio
+async def test_search(client: AsyncClient):
+    """测试模糊搜索，customer_id 命中的排在前面"""
+    await create(client, "FIND001", demand_description="普通需求")
+    await create(client, "OTHER01", demand_description="想要 FIND 系列礼服")
+    await create(client, "OTHER02")
+
+    response = await client.get(f"{CUSTOMERS_URL}/search", params={"q": "find"})
+    assert response.status_code == 200
+    assert [item["customer_id"] for item in response.json()] == ["FIND001", "OTHER01"]
+
+@pytest.mark.asyncio
+async def test_customer_history(client: AsyncClient):
+    """测试更新后的字段变更通过写后队列写入，并按时间顺序返回"""
+    await create(client, "HIST001", expected_order_amount=100.0)
+    await client.put(f"{CUSTOMERS_URL}/HIST001", json={"customer_status": "SAMPLE", "demand": 100})
+    await client.put(f"{CUSTOMERS_URL}/HIST001", json={"customer_status": "DEAD", "expected_order_amount": 0})
+
+    # 变更记录还在队列中，写入之前时间线为空
+    response = await client.get(f"{CUSTOMERS_URL}/HIST001/history")
+    assert response.json() == []
+
+    await history_writer.flush()
+    response = await client.get(f"{CUSTOMERS_URL}/HIST001/history")
+    assert response.status_code == 200
+    assert [(entry["field"], entry["old_value"], entry["new_value"]) for entry in response.json()] == [
+        ("customer_status", "CONSULTING", "SAMPLE"),
+        ("customer_status", "SAMPLE", "DEAD"),
+        ("expected_order_amount", 100.0, 0.0),
+    ]
+
+@pytest.mark.asyncio
+async def test_conditional_requests(client: AsyncClient):
+    """测试 If-None-Match 返回 304，If-Match 版本不一致时返回 412"""
+    await create(client, "ETAG001")
+    response = await client.get(f"{CUSTOMERS_URL}/ETAG001")
+    etag = response.headers["ETag"]
+    response = await client.get(f"{CUSTOMERS_URL}/ETAG001", headers={"If-None-Match": etag})
+    assert (response.status_code, response.content) == (304, b"")
+
+    response = await client.get(f"{CUSTOMERS_URL}/")
+    list_etag = response.headers["ETag"]
+    response = await client.get(f"{CUSTOMERS_URL}/", headers={"If-None-Match": list_etag})
+    assert response.status_code == 304
+
+    response = await client.put(f"{CUSTOMERS_URL}/ETAG001", json={"demand": 200}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    # 用旧版本更新会被拒绝，列表的 ETag 也随之变化
+    response = await client.put(f"{CUSTOMERS_URL}/ETAG001", json={"demand": 300}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    response = await client.put(f"{CUSTOMERS_URL}/MISSING", json={"demand": 300}, headers={"If-Match": etag})
+    assert response.status_code == 404
+    response = await client.get(f"{CUSTOMERS_URL}/", headers={"If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.json()[0]["demand"] == 200
+
+@pytest.mark.asyncio
+async def test_change_events(client: AsyncClient):
+    """测试写操作提交后向订阅者发布变更事件"""
+    async with event_broker.subscribe() as subscription:
+        await create(client, "EVENT01")
+        await client.put(f"{CUSTOMERS_URL}/EVENT01", json={"demand": 200})
+        await client.post(f"{CUSTOMERS_URL}/bulk", json=[customer_data("EVENT02"), customer_data("EVENT03")])
+        await client.delete(f"{CUSTOMERS_URL}/EVENT01")
+
+        events = []
+        while (event := await subscription.get(timeout=0)) is not None:
+            events.append((event.type, json.loads(event.data)))
+    assert [event_type for event_type, _ in events] == ["created", "updated", "bulk", "deleted"]
+    assert events[1][1]["demand"] == 200
+    assert events[2][1] == {"count": 2}
+    assert events[3][1] == {"customer_id": "EVENT01"}
+
+@pytest.mark.asyncio
+async def test_batch_get_and_coalesced_reads(client: AsyncClient):
+    """测试批量获取，以及并发读取单个客户时合并为一次查询"""
+    for customer_id in ("BATCH01", "BATCH02", "BATCH03"):
+        await create(client, customer_id)
+
+    response = await client.post(f"{CUSTOMERS_URL}/batch-get", json={
+        "customer_ids": ["BATCH03", "MISSING", "BATCH01", "BATCH03"]
+    })
+    assert response.status_code == 200
+    result = response.json()
+    assert [item["customer_id"] for item in result["items"]] == ["BATCH03", "BATCH01"]
+    assert result["missing"] == ["MISSING"]
+
+    batches = customer_loader.batches
+    responses = await asyncio.gather(*(
+        client.get(f"{CUSTOMERS_URL}/{customer_id}")
+        for customer_id in ("BATCH01", "BATCH02", "BATCH01", "MISSING")
+    ))
+    assert [response.status_code for response in responses] == [200, 200, 200, 404]
+    assert customer_loader.batches == batches + 1
+
+@pytest.mark.asyncio
+async def test_reads_racing_writes_do_not_cache_stale_rows(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    """测试读取与写入交错时，旧的客户不会写回缓存，写入之后的读取也不会合并到写入之前发出的查询"""
+    await create(client, "RACE01")
+    url = f"{CUSTOMERS_URL}/RACE01"
+    reading, resume = asyncio.Event(), asyncio.Event()
+
+    async def within(awaitable):
+        """出现回归时失败而不是一直等待"""
+        return await asyncio.wait_for(awaitable, timeout=5)
+
+    # 查出客户之后、写缓存之前（如 Redis 往返）提交一次更新
+    original_set = customer_cache.set
+    async def slow_set(key, value):
+        reading.set()
+        await resume.wait()
+        await original_set(key, value)
+    monkeypatch.setattr(customer_cache, "set", slow_set)
+    read = asyncio.create_task(client.get(url))
+    await within(reading.wait())
+    response = await within(client.put(url, json={"customer_status": "SAMPLE"}))
+    assert response.json()["customer_status"] == "SAMPLE"
+    resume.set()
+    assert (await within(read)).json()["customer_status"] == "CONSULTING"
+    monkeypatch.undo()
+    assert (await within(client.get(url))).json()["customer_status"] == "SAMPLE"
+
+    # 合并查询已经查出旧值时提交更新，之后的读取要发起新的查询；先清空缓存，让读取经过合并查询
+    await customer_cache.clear()
+    reading.clear()
+    resume.clear()
+    original_batch = customer_loader.batch_fn
+    async def slow_batch(keys):
+        results = await original_batch(keys)
+        if not reading.is_set():
+            reading.set()
+            await resume.wait()
+        return results
+    monkeypatch.setattr(customer_loader, "batch_fn", slow_batch)
+    read = asyncio.create_task(client.get(url))
+    await within(reading.wait())
+    assert (await within(client.put(url, json={"customer_status": "DEAD"}))).status_code == 200
+    assert (await within(client.get(url))).json()["customer_status"] == "DEAD"
+    resume.set()
+    assert (await within(read)).json()["customer_status"] == "SAMPLE"
+    assert (await within(client.get(url))).json()["customer_status"] == "DEAD"
+
+@pytest.mark.asyncio
+async def test_list_total(client: AsyncClient):
+    """测试列表返回总数，写操作后总数缓存失效"""
+    for i in range(3):
+        await create(client, f"TOTAL0{i}", shop="LI" if i else "YI", expected_order_amount=i * 100.0)
+
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"with_total": True, "limit": 1})
+    page = response.json()
+    assert (len(page["items"]), page["total"], page["total_exact"]) == (1, 3, True)
+
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"with_total": True, "shop": "LI"})
+    assert response.json()["total"] == 2
+    params = {"with_total": True, "cursor": "", "limit": 1, "expected_order_amount_min": 50}
+    assert (await client.get(f"{CUSTOMERS_URL}/", params=params)).json()["total"] == 2
+
+    await client.delete(f"{CUSTOMERS_URL}/TOTAL01")
+    assert (await client.get(f"{CUSTOMERS_URL}/", params=params)).json()["total"] == 1
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"with_total": True, "shop": "LI"})
+    assert response.json()["total"] == 1
+
+@pytest.mark.asyncio
+async def test_sparse_fields_and_compression(client: AsyncClient):
+    """测试 fields 只返回部分字段，较大的响应按 Accept-Encoding 压缩"""
+    for i in range(20):
+        await create(client, f"FIELD{i:02d}", demand_description="需要定制高端礼服" * 20)
+
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"fields": "shop,customer_status", "limit": 1})
+    assert set(response.json()[0]) == {"id", "customer_id", "shop", "customer_status", "last_modified_date"}
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"fields": "shop,password"})
+    assert response.status_code == 400
+
+    response = await client.get(f"{CUSTOMERS_URL}/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) < len(response.content) / 5
+    assert len(response.json()) == 20
+    response = await client.get(f"{CUSTOMERS_URL}/FIELD00", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+@pytest.mark.asyncio
+async def test_compressed_responses_use_weak_etags(client: AsyncClient):
+    """测试压缩后的响应使用弱 ETag，304 响应带有 Vary，弱 ETag 仍然可以用于 If-None-Match 和 If-Match"""
+    await create(client, "WEAK01", demand_description="需要定制高端礼服" * 60)
+    url = f"{CUSTOMERS_URL}/WEAK01"
+
+    identity = await client.get(url, headers={"Accept-Encoding": "identity"})
+    strong = identity.headers["ETag"]
+    assert not strong.startswith("W/") and "Content-Encoding" not in identity.headers
+    response = await client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == f"W/{strong}"
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    response = await client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": f"W/{strong}"})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == f"W/{strong}" and "Accept-Encoding" in response.headers["Vary"]
+    response = await client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": strong})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == strong and "Accept-Encoding" in response.headers["Vary"]
+
+    response = await client.put(url, json={"demand": 300}, headers={"If-Match": f"W/{strong}"})
+    assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_read_replica_routing(client: AsyncClient, monkeypatch: pytest.MonkeyPatch, tmp_path):
+    """测试读请求走只读副本，写入后短时间内读主库，副本不可用时改读主库"""
+    replica = database.build_engine("sqlite+aiosqlite://")
+    async with replica.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    monkeypatch.setattr(database, "read_session", sessionmaker(replica, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(database, "_replica_retry_at", 0.0)
+    transport = ASGITransport(app=database.ReadYourWritesMiddleware(app, sticky_seconds=60))
+
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as writer, \
+                AsyncClient(transport=transport, base_url="http://test") as reader:
+            # 副本是另一个数据库，没有复制：主库上新建的客户只有写入的客户端读得到
+            response = await writer.post(f"{CUSTOMERS_URL}/", json=customer_data("REPLICA1"))
+            assert database.READ_PRIMARY_COOKIE in response.cookies
+            assert len((await writer.get(f"{CUSTOMERS_URL}/")).json()) == 1
+            assert (await reader.get(f"{CUSTOMERS_URL}/")).json() == []
+            response = await reader.post(f"{CUSTOMERS_URL}/batch-get", json={"customer_ids": ["REPLICA1"]})
+            assert response.json()["missing"] == ["REPLICA1"]
+            assert database.READ_PRIMARY_COOKIE not in response.cookies
+
+            # 副本连接失败时改读主库
+            broken = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+            monkeypatch.setattr(database, "read_session", sessionmaker(broken, class_=AsyncSession))
+            assert len((await reader.get(f"{CUSTOMERS_URL}/")).json()) == 1
+            metrics = (await reader.get("/metrics")).text
+            assert 'db_read_routes_total{target="fallback"} 1' in metrics
+            await broken.dispose()
+    finally:
+        await replica.dispose()
+
+@pytest.mark.asyncio
+async def test_read_replica_pool_timeout_falls_back(client: AsyncClient, monkeypatch: pytest.MonkeyPatch, tmp_path):
+    """测试只读副本的连接池已满时读主库，而不是返回 500，之后的请求仍然先尝试副本"""
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT", 0.1)
+    replica = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    async with replica.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    monkeypatch.setattr(database, "read_session", sessionmaker(replica, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(database, "_replica_retry_at", 0.0)
+    await create(client, "POOLFULL")
+
+    try:
+        routes = [f'db_read_routes_total{{target="{target}"}}' for target in ("replica", "fallback")]
+        before = (await client.get("/metrics")).text
+        async with replica.connect():
+            response = await client.get(f"{CUSTOMERS_URL}/")
+            assert [item["customer_id"] for item in response.json()] == ["POOLFULL"]
+        assert database._replica_retry_at == 0.0
+        assert (await client.get(f"{CUSTOMERS_URL}/")).json() == []
+        after = (await client.get("/metrics")).text
+        assert [sample(after, name) - sample(before, name) for name in routes] == [1, 1]
+    finally:
+        await replica.dispose()
+
+@pytest.mark.asyncio
+async def test_admission_control():
+    """测试超过上限的请求排队，队列已满或等待超时时被拒绝，名额按先后顺序交给排队的请求"""
+    controller = AdmissionController(limit=1, queue_size=1, queue_timeout=0.05)
+    await controller.acquire()
+    with pytest.raises(OverloadedError):
+        await controller.acquire()
+    assert controller.shed_timeout == 1
+
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    assert controller.queued == 1
+    with pytest.raises(OverloadedError):
+        await controller.acquire()
+    assert controller.shed_queue_full == 1
+
+    controller.release()
+    await waiting
+    assert (controller.in_flight, controller.queued, controller.admitted) == (1, 0, 2)
+    controller.release()
+    assert controller.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_admission_release_after_cancelled_waiter():
+    """测试排队的请求被取消后、恢复执行之前名额被归还时，请求仍然以取消结束，名额不会丢失"""
+    controller = AdmissionController(limit=1, queue_size=2, queue_timeout=5)
+    await controller.acquire()
+    cancelled = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    assert controller.queued == 2
+
+    cancelled.cancel()
+    controller.release()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    await asyncio.wait_for(waiting, timeout=1)
+    assert (controller.in_flight, controller.queued) == (1, 0)
+    controller.release()
+    assert controller.in_flight == 0
+
+    # 队列中只有被取消的请求时，名额回到空闲
+    await controller.acquire()
+    cancelled = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    controller.release()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert (controller.in_flight, controller.queued) == (0, 0)
+    await asyncio.wait_for(controller.acquire(), timeout=1)
+
+@pytest.mark.asyncio
+async def test_admission_sheds_api_requests(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    """测试没有名额时 API 请求返回 503 和 Retry-After，根路径和指标不受影响"""
+    monkeypatch.setattr(admission_controller, "limit", 0)
+    monkeypatch.setattr(admission_controller, "queue_size", 0)
+
+    response = await client.get(f"{CUSTOMERS_URL}/")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.ADMISSION_RETRY_AFTER)
+    for path in ("/", "/metrics/admission"):
+        assert (await client.get(path)).status_code == 200
@@ -0,0 +1,143 @@
+"""
+定时维护任务测试
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.database import async_session, engine
+from app.core.scheduler import Scheduler, job_run_table
+from app.crud.history import history_writer
+from app.crud.maintenance import archive_customers, mark_stale_leads_dead
+from app.models.customer import Customer
+from tests.test_customer_api import CUSTOMERS_URL, create
+
+async def backdate(customer_ids: list[str], days: int, field: str = "last_modified_date") -> None:
+    """把客户的最后修改时间（或 field 指定的时间字段）改到 days 天以前"""
+    async with async_session() as session:
+        await session.execute(
+            update(Customer)
+            .where(Customer.customer_id.in_(customer_ids))
+            .values({field: datetime.now(timezone.utc) - timedelta(days=days)})
+        )
+        await session.commit()
+
+@pytest.mark.asyncio
+async def test_mark_stale_leads_dead(client: AsyncClient):
+    """测试长期没有修改的客户分批标记为 DEAD，汇总、缓存和变更记录随之更新"""
+    for i in range(3):
+        await create(client, f"STALE0{i}", expected_order_amount=10.0)
+    await create(client, "FRESH01", customer_status="SAMPLE", expected_order_amount=5.0)
+    await create(client, "DEADOLD", customer_status="DEAD")
+    await backdate(["STALE00", "STALE01", "STALE02", "DEADOLD"], days=100)
+    # 读一次让 STALE00 进入缓存，标记后应该读到新状态
+    assert (await client.get(f"{CUSTOMERS_URL}/STALE00")).json()["customer_status"] == "CONSULTING"
+
+    async with async_session() as session:
+        assert await mark_stale_leads_dead(db=session, days=90, batch_size=2) == 3
+        assert await mark_stale_leads_dead(db=session, days=90, batch_size=2) == 0
+
+    assert (await client.get(f"{CUSTOMERS_URL}/STALE00")).json()["customer_status"] == "DEAD"
+    assert (await client.get(f"{CUSTOMERS_URL}/FRESH01")).json()["customer_status"] == "SAMPLE"
+    stats = (await client.get(f"{CUSTOMERS_URL}/stats")).json()
+    assert {(group["customer_status"], group["customer_count"], group["amount_sum"]) for group in stats["groups"]} == {
+        ("DEAD", 4, 30.0),
+        ("SAMPLE", 1, 5.0),
+    }
+
+    await history_writer.flush()
+    history = (await client.get(f"{CUSTOMERS_URL}/STALE01/history")).json()
+    assert [(entry["field"], entry["old_value"], entry["new_value"]) for entry in history] == [
+        ("customer_status", "CONSULTING", "DEAD"),
+    ]
+
+@pytest.mark.asyncio
+async def test_archive_customers(client: AsyncClient):
+    """测试长期 DEAD 和很早创建的客户移到归档表后，仍然可以按 customer_id 读取，列表和导出可以包括它们"""
+    await create(client, "ARCH01", customer_status="DEAD", expected_order_amount=10.0)
+    await create(client, "ARCH02", customer_status="DEAD")
+    await create(client, "ARCH03")
+    await create(client, "ARCH04", expected_order_amount=20.0)
+    await backdate(["ARCH01"], days=100)
+    await backdate(["ARCH04"], days=400, field="creation_date")
+
+    async with async_session() as session:
+        archived = await archive_customers(
+            db=session,
+            dead_days=90,
+            created_before=datetime.now(timezone.utc) - timedelta(days=365),
+            batch_size=1
+        )
+    assert archived == 2
+
+    response = await client.get(f"{CUSTOMERS_URL}/ARCH01")
+    assert (response.status_code, response.json()["customer_status"]) == (200, "DEAD")
+    assert (await client.put(f"{CUSTOMERS_URL}/ARCH04", json={"demand": 1})).status_code == 404
+    response = await client.post(f"{CUSTOMERS_URL}/batch-get", json={"customer_ids": ["ARCH04", "ARCH03", "NONE01"]})
+    assert [item["customer_id"] for item in response.json()["items"]] == ["ARCH04", "ARCH03"]
+
+    response = await client.get(f"{CUSTOMERS_URL}/", params={"with_total": True})
+    assert [item["customer_id"] for item in response.json()["items"]] == ["ARCH02", "ARCH03"]
+    assert response.json()["total"] == 2
+    params = {"include_archived": True, "with_total": True, "cursor": "", "limit": 3}
+    page = (await client.get(f"{CUSTOMERS_URL}/", params=params)).json()
+    assert [item["customer_id"] for item in page["items"]] == ["ARCH01", "ARCH02", "ARCH03"]
+    assert page["total"] == 4
+    page = (await client.get(f"{CUSTOMERS_URL}/", params={**params, "cursor": page["next_cursor"]})).json()
+    assert [item["customer_id"] for item in page["items"]] == ["ARCH04"]
+
+    response = await client.get(f"{CUSTOMERS_URL}/export", params={"include_archived": True, "customer_status": "DEAD"})
+    assert [line.count("ARCH0") for line in response.text.splitlines()] == [1, 1]
+    stats = (await client.get(f"{CUSTOMERS_URL}/stats")).json()
+    assert (stats["total_count"], stats["total_amount"]) == (2, 0.0)
+
+@pytest.mark.asyncio
+async def test_scheduler_records_runs():
+    """测试调度器记录任务的运行次数、影响的行数和失败次数"""
+    scheduler = Scheduler(engine)
+    results = iter([3, ValueError("失败")])
+
+    async def job(db: AsyncSession) -> int:
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    scheduler.add("test-job", 60, job)
+    assert await scheduler.run_job("test-job") == 3
+    with pytest.raises(ValueError):
+        await scheduler.run_job("test-job", force=True)
+    stats = scheduler.stats()["test-job"]
+    assert (stats["runs"], stats["failures"], stats["rows_total"], stats["last_rows"]) == (1, 1, 3, 3)
+    assert stats["last_run_timestamp"] > 0
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_once_per_interval_across_workers(client: AsyncClient):
+    """测试多个工作进程的调度器每个间隔只有一个运行任务，任务在调度器提供的会话中执行"""
+    await create(client, "JOB01")
+    workers = [Scheduler(engine), Scheduler(engine)]
+    calls = []
+
+    async def job(db: AsyncSession) -> int:
+        calls.append(db)
+        return len((await db.execute(select(Customer.id))).all())
+
+    for scheduler in workers:
+        scheduler.add("shared-job", 60, job)
+    assert [await scheduler.run_job("shared-job") for scheduler in workers] == [1, None]
+    assert [await scheduler.run_job("shared-job") for scheduler in workers] == [None, None]
+    assert len(calls) == 1
+    assert [scheduler.stats()["shared-job"]["skipped"] for scheduler in workers] == [1, 2]
+
+    # 间隔过去之后由先到的进程（不一定是上一轮运行的进程）运行下一轮
+    async with async_session() as session:
+        await session.execute(update(job_run_table).values(
+            last_started_at=datetime.now(timezone.utc) - timedelta(seconds=61)
+        ))
+        await session.commit()
+    assert [await scheduler.run_job("shared-job") for scheduler in reversed(workers)] == [1, None]
+    assert len(calls) == 2
@@ -0,0 +1,103 @@
+"""
+运行指标测试
+"""
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core import database
+from app.core.config import settings
+from tests.test_customer_api import CUSTOMERS_URL, create, sample
+
+@pytest.mark.asyncio
+async def test_cache_metrics(client: AsyncClient):
+    """测试单个客户的读缓存记录命中和未命中，写操作后重新未命中"""
+    await create(client, "CACHE01")
+    before = (await client.get("/metrics/cache")).json()
+
+    for _ in range(3):
+        assert (await client.get(f"{CUSTOMERS_URL}/CACHE01")).status_code == 200
+    stats = (await client.get("/metrics/cache")).json()
+    assert (stats["misses"] - before["misses"], stats["hits"] - before["hits"]) == (1, 2)
+
+    await client.put(f"{CUSTOMERS_URL}/CACHE01", json={"demand": 200})
+    assert (await client.get(f"{CUSTOMERS_URL}/CACHE01")).json()["demand"] == 200
+    stats = (await client.get("/metrics/cache")).json()
+    assert (stats["misses"] - before["misses"], stats["hits"] - before["hits"]) == (2, 2)
+    assert f'customer_cache_events{{kind="hits"}} {stats["hits"]}' in (await client.get("/metrics")).text
+
+@pytest.mark.asyncio
+async def test_pool_metrics(client: AsyncClient, monkeypatch: pytest.MonkeyPatch, tmp_path):
+    """测试连接池指标记录借出和空闲的连接数、取得连接的次数、等待时间和超时次数"""
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT", 0.1)
+    pooled = database.build_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}")
+    monkeypatch.setattr(database, "engine", pooled)
+
+    try:
+        async with pooled.connect():
+            stats = (await client.get("/metrics/pool")).json()
+            assert (stats["pool_size"], stats["checked_out"], stats["idle"], stats["acquisitions"]) == (1, 1, 0, 1)
+            with pytest.raises(PoolTimeoutError):
+                async with pooled.connect():
+                    pass
+        stats = (await client.get("/metrics/pool")).json()
+        assert (stats["checked_out"], stats["idle"], stats["acquisitions"], stats["timeouts"]) == (0, 1, 2, 1)
+        assert stats["wait_seconds_max"] >= 0.1
+        assert stats["wait_seconds_avg"] == pytest.approx(stats["wait_seconds_total"] / 2, abs=1e-6)
+        metrics = (await client.get("/metrics")).text
+        assert 'db_pool_acquire_events{kind="timeouts"} 1' in metrics
+        assert 'db_pool_connections{state="idle"} 1' in metrics
+    finally:
+        await pooled.dispose()
+
+@pytest.mark.asyncio
+async def test_request_and_sql_metrics(client: AsyncClient):
+    """测试 /metrics 按路由模板记录请求数、状态码、耗时和每个请求的 SQL 语句数，以及按语句类型的 SQL 耗时"""
+    await create(client, "METRIC01")
+    list_route = 'method="GET",route="/api/v1/customers/"'
+    item_route = 'method="GET",route="/api/v1/customers/{customer_id}"'
+    series = (
+        f'http_requests_total{{{list_route},status="200"}}',
+        f'http_requests_total{{{item_route},status="404"}}',
+        'http_requests_total{method="GET",route="unmatched",status="404"}',
+        f'http_request_duration_seconds_count{{{list_route}}}',
+        f'http_request_db_statements_count{{{list_route}}}',
+        f'http_request_db_statements_sum{{{list_route}}}',
+        'db_statement_duration_seconds_count{operation="SELECT"}',
+    )
+    before = (await client.get("/metrics")).text
+
+    assert (await client.get(f"{CUSTOMERS_URL}/")).status_code == 200
+    assert (await client.get(f"{CUSTOMERS_URL}/MISSING")).status_code == 404
+    assert (await client.get("/no-such-path")).status_code == 404
+
+    response = await client.get("/metrics")
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    delta = {name: sample(response.text, name) - sample(before, name) for name in series}
+    assert [delta[name] for name in series[:5]] == [1, 1, 1, 1, 1]
+    # 列表请求只有一条 SELECT；SQLite 的 BEGIN 由连接发出，也计为一条语句
+    assert 1 <= delta[series[5]] <= 2
+    assert delta[series[6]] >= 2
+
+@pytest.mark.asyncio
+async def test_coalesced_queries_not_counted_per_request(client: AsyncClient):
+    """测试合并查询的批量语句不计入发起它的请求的语句数"""
+    for i in range(3):
+        await create(client, f"COALESCE{i}")
+    item_route = 'method="GET",route="/api/v1/customers/{customer_id}"'
+    series = (
+        f'http_request_db_statements_count{{{item_route}}}',
+        f'http_request_db_statements_sum{{{item_route}}}',
+        'customer_loader_events{kind="batches"}',
+    )
+    before = (await client.get("/metrics")).text
+
+    responses = await asyncio.gather(*(client.get(f"{CUSTOMERS_URL}/COALESCE{i}") for i in range(3)))
+    assert [response.status_code for response in responses] == [200, 200, 200]
+
+    after = (await client.get("/metrics")).text
+    assert [sample(after, name) - sample(before, name) for name in series] == [3, 0, 1]
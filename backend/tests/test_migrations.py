@@ -0,0 +1,70 @@
+"""
+数据库迁移测试
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import MetaData, insert, inspect, text
+from sqlmodel import SQLModel
+
+from app.core.database import async_session, engine
+from app.core.migrations import LATEST_VERSION, SchemaVersionError, migrate, verify_schema_version
+from app.crud.maintenance import archive_customers
+from app.models.customer import Customer
+from tests.test_customer_api import CUSTOMERS_URL, create, customer_data
+
+@pytest.mark.asyncio
+async def test_migrate_from_empty_database():
+    """测试在空数据库上执行全部迁移，再次执行时没有待执行的迁移"""
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+
+    with pytest.raises(SchemaVersionError):
+        await verify_schema_version(engine)
+
+    applied = await migrate(engine)
+    assert [migration.version for migration in applied] == list(range(1, LATEST_VERSION + 1))
+    assert await verify_schema_version(engine) == LATEST_VERSION
+    assert await migrate(engine) == []
+
+@pytest.mark.asyncio
+async def test_migrate_existing_database(client: AsyncClient):
+    """测试旧版本启动时 create_all 建好的数据库可以直接升级，已有数据计入看板汇总"""
+    await create(client, "MIGRATE1", expected_order_amount=10.0)
+    applied = await migrate(engine)
+    assert len(applied) == LATEST_VERSION
+    stats = (await client.get(f"{CUSTOMERS_URL}/stats")).json()
+    assert (stats["total_count"], stats["total_amount"]) == (1, 10.0)
+
+@pytest.mark.asyncio
+async def test_migrate_rebuilds_sqlite_customer_table_with_autoincrement(client: AsyncClient):
+    """测试旧版本建的 SQLite 客户表改为 AUTOINCREMENT 后，归档移走的最大 id 不会分配给新客户"""
+    if engine.dialect.name != "sqlite":
+        pytest.skip("只有 SQLite 会重用已删除的最大 id")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        # 旧版本的客户表：没有 AUTOINCREMENT
+        old_table = Customer.__table__.to_metadata(MetaData())
+        old_table.dialect_options["sqlite"]["autoincrement"] = False
+        await conn.run_sync(old_table.metadata.create_all)
+        now = datetime.now(timezone.utc)
+        await conn.execute(insert(old_table), [
+            dict(customer_data(f"OLDID{i}"), creation_date=now, last_modified_date=now) for i in range(3)
+        ])
+
+    await migrate(engine)
+    async with engine.connect() as conn:
+        table_sql = await conn.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'customer_management'"))
+        indexes = await conn.run_sync(lambda sync: inspect(sync).get_indexes("customer_management"))
+    assert "AUTOINCREMENT" in table_sql.upper()
+    # trigram 索引只在 PostgreSQL 上创建
+    expected = {index.name for index in Customer.__table__.indexes if not index.name.endswith("_trgm")}
+    assert {index["name"] for index in indexes} == expected
+
+    async with async_session() as session:
+        assert await archive_customers(db=session, created_before=now + timedelta(seconds=1)) == 3
+    created = await create(client, "NEWID01")
+    assert created["id"] == 4
+    page = (await client.get(f"{CUSTOMERS_URL}/", params={"include_archived": True})).json()
+    assert [customer["id"] for customer in page] == [1, 2, 3, 4]
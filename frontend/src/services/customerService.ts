@@ -5,6 +5,8 @@ import { ShopBrandEnum, CustomerSourceEnum, CustomerTypeEnum, CustomerStatusEnum
 // 创建axios实例
 const apiClient = axios.create({
     baseURL: API_BASE_URL,
+    // 跨域请求也携带 cookie：后端配置只读副本时，写入后短时间内用 cookie 让读请求走主库
+    withCredentials: true,
     headers: {
         'Content-Type': 'application/json',
     },
@@ -1,5 +1,6 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
+import { API_BASE_URL } from '../config/api'
 
 interface Customer {
   id?: number
@@ -17,6 +18,8 @@ export const useCustomerStore = defineStore('customer', () => {
   const customers = ref<Customer[]>([])
   const loading = ref(false)
   const currentCustomer = ref<Customer | null>(null)
+  // 服务端推送的变更事件，代替定时重新获取客户列表
+  let eventSource: EventSource | null = null
 
   async function fetchCustomers() {
     loading.value = true
@@ -90,6 +93,49 @@ export const useCustomerStore = defineStore('customer', () => {
     currentCustomer.value = customer
   }
 
+  function applyChange(customer: Customer): void {
+    const index = customers.value.findIndex(c => c.customer_id === customer.customer_id)
+    if (index !== -1) {
+      customers.value[index] = customer
+    } else {
+      customers.value.push(customer)
+    }
+  }
+
+  // 订阅其他人对客户的修改：单条变更直接合并到列表，批量写入或可能错过事件时重新加载
+  function subscribeChanges(): void {
+    if (eventSource) return
+    eventSource = new EventSource(`${API_BASE_URL}/customers/events`)
+    eventSource.addEventListener('created', (event) => {
+      applyChange(JSON.parse((event as MessageEvent).data))
+    })
+    eventSource.addEventListener('updated', (event) => {
+      applyChange(JSON.parse((event as MessageEvent).data))
+    })
+    eventSource.addEventListener('deleted', (event) => {
+      const { customer_id } = JSON.parse((event as MessageEvent).data)
+      customers.value = customers.value.filter(c => c.customer_id !== customer_id)
+    })
+    eventSource.addEventListener('bulk', () => fetchCustomers())
+    eventSource.addEventListener('resync', () => fetchCustomers())
+    // 断线期间的事件不会补发，浏览器自动重连成功后重新加载一次
+    let disconnected = false
+    eventSource.onerror = () => {
+      disconnected = true
+    }
+    eventSource.onopen = () => {
+      if (disconnected) {
+        disconnected = false
+        fetchCustomers()
+      }
+    }
+  }
+
+  function unsubscribeChanges(): void {
+    eventSource?.close()
+    eventSource = null
+  }
+
   return {
     customers,
     loading,
@@ -98,6 +144,8 @@ export const useCustomerStore = defineStore('customer', () => {
     createCustomer,
     updateCustomer,
     deleteCustomer,
-    setCurrentCustomer
+    setCurrentCustomer,
+    subscribeChanges,
+    unsubscribeChanges
   }
 })
\ No newline at end of file